@@ -9,14 +9,20 @@ Define the API for the I/O of interfaces
 
 """
 import os
+import struct
 from inspect import isclass
 from copy import deepcopy
 from warnings import warn
 from packaging.version import Version
 
+from traits.trait_base import _Undefined
 from traits.trait_errors import TraitError
 from traits.trait_handlers import TraitDictObject, TraitListObject
-from ...utils.filemanip import md5, hash_infile, hash_timestamp
+from ...utils.filemanip import (
+    get_hash_algorithm,
+    get_hash_function,
+    hash_infiles,
+)
 from .traits_extension import (
     traits,
     File,
@@ -26,12 +32,119 @@ from .traits_extension import (
     has_metadata,
     OutputMultiObject,
 )
+from .support import Bunch
 
 from ... import config, __version__
 
 _float_fmt = "{:.10f}".format
 nipype_version = Version(__version__)
 
+HASH_FORMATS = (1, 2)
+"""Versions of the input hashing, selected with ``execution.hash_format``:
+
+1. md5 of the string representation of sorted lists (default)
+2. streaming canonical encoding (see :func:`_update_hash`)
+
+"""
+_pack_len = struct.Struct("<Q").pack
+_pack_float = struct.Struct("<d").pack
+
+
+def _iter_strings(objekt):
+    """Yield the strings that ``_get_sorteddict`` may consider as files"""
+    if isinstance(objekt, dict):
+        for val in objekt.values():
+            yield from _iter_strings(val)
+    elif isinstance(objekt, (list, tuple)):
+        for val in objekt:
+            yield from _iter_strings(val)
+    elif isinstance(objekt, (str, bytes)):
+        yield objekt
+
+
+def _sorted_listings(objekt, hash_files, file_hashes):
+    """
+    Return the listings of a value with, and without, the names of its files.
+
+    This is :meth:`BaseTraitedSpec._get_sorteddict` with and without
+    ``dictwithhash``, in a single pass over the value: undefined items are
+    dropped, dictionaries are sorted by key, floats formatted, and the files
+    hashed in ``file_hashes`` replaced by ``(path, hash)`` and their hash.
+    """
+    if isinstance(objekt, dict):
+        withhash, nofilename = [], []
+        for key, val in sorted(objekt.items()):
+            if isdefined(val):
+                with_val, no_val = _sorted_listings(val, hash_files, file_hashes)
+                withhash.append((key, with_val))
+                nofilename.append((key, no_val))
+        return withhash, nofilename
+    if isinstance(objekt, (list, tuple)):
+        withhash, nofilename = [], []
+        for val in objekt:
+            if isdefined(val):
+                with_val, no_val = _sorted_listings(val, hash_files, file_hashes)
+                withhash.append(with_val)
+                nofilename.append(no_val)
+        if isinstance(objekt, tuple):
+            return tuple(withhash), tuple(nofilename)
+        return withhash, nofilename
+    if not isdefined(objekt):
+        return None, None
+    if hash_files and isinstance(objekt, (str, bytes)) and objekt in file_hashes:
+        return (objekt, file_hashes[objekt]), file_hashes[objekt]
+    if isinstance(objekt, float):
+        return _float_fmt(objekt), _float_fmt(objekt)
+    return objekt, objekt
+
+
+def _update_hash(update, objekt, hash_files=True, file_hashes=None):
+    """
+    Feed a canonical encoding of ``objekt`` to ``update`` (``hash_format = 2``).
+
+    Every value is encoded as a type tag followed by a fixed-size or a
+    length-prefixed payload, and containers are delimited, so that the
+    encoding is unambiguous without building any intermediate string.
+    Dictionaries and Bunches are sorted by key, undefined values are skipped,
+    floats are rounded to 10 decimals (as with ``_float_fmt``), and strings
+    found in ``file_hashes`` are replaced by the hash of the file.
+    Other objects are encoded by their ``repr``.
+    """
+    if isinstance(objekt, (list, tuple)):
+        update(b"[" if isinstance(objekt, list) else b"(")
+        for val in objekt:
+            if not isinstance(val, _Undefined):
+                _update_hash(update, val, hash_files, file_hashes)
+        update(b"]")
+    elif isinstance(objekt, (str, bytes)):
+        if hash_files and file_hashes and objekt in file_hashes:
+            data = file_hashes[objekt].encode()
+            update(b"h" + _pack_len(len(data)) + data)
+        elif isinstance(objekt, str):
+            data = objekt.encode("utf-8", "surrogateescape")
+            update(b"s" + _pack_len(len(data)) + data)
+        else:
+            update(b"y" + _pack_len(len(objekt)) + objekt)
+    elif isinstance(objekt, float):
+        update(b"f" + _pack_float(round(objekt, 10) + 0.0))
+    elif isinstance(objekt, bool):
+        update(b"T" if objekt else b"F")
+    elif isinstance(objekt, int):
+        data = b"%d" % objekt
+        update(b"i" + _pack_len(len(data)) + data)
+    elif objekt is None:
+        update(b"N")
+    elif isinstance(objekt, (dict, Bunch)):
+        update(b"{" if isinstance(objekt, dict) else b"B")
+        for key, val in sorted(objekt.items()):
+            if not isinstance(val, _Undefined):
+                _update_hash(update, key, hash_files, file_hashes)
+                _update_hash(update, val, hash_files, file_hashes)
+        update(b"}")
+    else:
+        data = repr(objekt).encode("utf-8", "surrogateescape")
+        update(b"r" + _pack_len(len(data)) + data)
+
 
 class BaseTraitedSpec(traits.HasTraits):
     """
@@ -213,13 +326,18 @@ class BaseTraitedSpec(traits.HasTraits):
         """
         return has_metadata(self.trait(name).trait_type, metadata, value, recursive)
 
-    def get_hashval(self, hash_method=None):
+    def get_hashval(self, hash_method=None, hash_algorithm=None, hash_format=None):
         """Return a dictionary of our items with hashes for each file.
 
         Searches through dictionary items and if an item is a file, it
-        calculates the md5 hash of the file contents and stores the
+        calculates the hash of the file contents and stores the
         file name and hash value as the new key value.
 
+        File contents and the overall bunch are hashed with ``hash_algorithm``,
+        which defaults to the ``execution.hash_algorithm`` setting (md5).
+        ``hash_format`` (see ``HASH_FORMATS``) defaults to the
+        ``execution.hash_format`` setting.
+
         However, the overall bunch hash is calculated only on the hash
         value of a file. The path and name of the file are not used in
         the overall hash calculation.
@@ -230,11 +348,20 @@ class BaseTraitedSpec(traits.HasTraits):
             Copy of our dictionary with the new file hashes included
             with each file.
         hashvalue : str
-            The md5 hash value of the traited spec
+            The hash value of the traited spec
 
         """
-        list_withhash = []
-        list_nofilename = []
+        if hash_method is None:
+            hash_method = config.get("execution", "hash_method")
+        if hash_format is None:
+            hash_format = config.get("execution", "hash_format", "1")
+        hash_format = int(hash_format)
+        if hash_format not in HASH_FORMATS:
+            raise ValueError("Unknown hash format: %s" % hash_format)
+        crypto = get_hash_algorithm(hash_algorithm)
+
+        items = []
+        infiles = set()
         for name, val in sorted(self.trait_get().items()):
             if not isdefined(val) or self.has_metadata(name, "nohash", True):
                 # skip undefined traits and traits with nohash=True
@@ -243,26 +370,43 @@ class BaseTraitedSpec(traits.HasTraits):
             hash_files = not self.has_metadata(
                 name, "hash_files", False
             ) and not self.has_metadata(name, "name_source")
-            list_nofilename.append(
-                (
-                    name,
-                    self._get_sorteddict(
-                        val, hash_method=hash_method, hash_files=hash_files
-                    ),
-                )
-            )
-            list_withhash.append(
-                (
-                    name,
-                    self._get_sorteddict(
-                        val, True, hash_method=hash_method, hash_files=hash_files
-                    ),
+            if hash_files:
+                infiles.update(_iter_strings(val))
+            items.append((name, val, hash_files))
+
+        # Hash every file once (concurrently), and reuse it in both listings
+        file_hashes = hash_infiles(infiles, hash_method=hash_method, crypto=crypto)
+
+        list_withhash = []
+        list_nofilename = []
+        hashobj = crypto()
+        for name, val, hash_files in items:
+            if hash_format == 2:
+                _update_hash(hashobj.update, name)
+                _update_hash(hashobj.update, val, hash_files, file_hashes)
+                withhash = self._get_sorteddict(
+                    val,
+                    True,
+                    hash_method=hash_method,
+                    hash_files=hash_files,
+                    file_hashes=file_hashes,
                 )
-            )
-        return list_withhash, md5(str(list_nofilename).encode()).hexdigest()
+            else:
+                # Both listings are built in a single pass over the value
+                withhash, nofilename = _sorted_listings(val, hash_files, file_hashes)
+                list_nofilename.append((name, nofilename))
+            list_withhash.append((name, withhash))
+        if hash_format != 2:
+            hashobj.update(str(list_nofilename).encode())
+        return list_withhash, hashobj.hexdigest()
 
     def _get_sorteddict(
-        self, objekt, dictwithhash=False, hash_method=None, hash_files=True
+        self,
+        objekt,
+        dictwithhash=False,
+        hash_method=None,
+        hash_files=True,
+        file_hashes=None,
     ):
         if isinstance(objekt, dict):
             out = []
@@ -276,6 +420,7 @@ class BaseTraitedSpec(traits.HasTraits):
                                 dictwithhash,
                                 hash_method=hash_method,
                                 hash_files=hash_files,
+                                file_hashes=file_hashes,
                             ),
                         )
                     )
@@ -289,6 +434,7 @@ class BaseTraitedSpec(traits.HasTraits):
                             dictwithhash,
                             hash_method=hash_method,
                             hash_files=hash_files,
+                            file_hashes=file_hashes,
                         )
                     )
             if isinstance(objekt, tuple):
@@ -296,20 +442,25 @@ class BaseTraitedSpec(traits.HasTraits):
         else:
             out = None
             if isdefined(objekt):
-                if (
-                    hash_files
-                    and isinstance(objekt, (str, bytes))
-                    and os.path.isfile(objekt)
-                ):
-                    if hash_method is None:
-                        hash_method = config.get("execution", "hash_method")
-
-                    if hash_method.lower() == "timestamp":
-                        hash = hash_timestamp(objekt)
-                    elif hash_method.lower() == "content":
-                        hash = hash_infile(objekt)
+                if file_hashes is not None:
+                    is_file = (
+                        hash_files
+                        and isinstance(objekt, (str, bytes))
+                        and objekt in file_hashes
+                    )
+                else:
+                    is_file = (
+                        hash_files
+                        and isinstance(objekt, (str, bytes))
+                        and os.path.isfile(objekt)
+                    )
+                if is_file:
+                    if file_hashes is not None:
+                        hash = file_hashes[objekt]
                     else:
-                        raise Exception("Unknown hash method: %s" % hash_method)
+                        if hash_method is None:
+                            hash_method = config.get("execution", "hash_method")
+                        hash = get_hash_function(hash_method)(objekt)
                     if dictwithhash:
                         out = (objekt, hash)
                     else:
@@ -6,6 +6,7 @@ Module to unit test the resource_monitor in nipype
 """
 
 import os
+import numpy as np
 import pytest
 
 # Import packages
@@ -100,3 +101,205 @@ def test_function_profiling(tmpdir, mem_gb, n_procs, use_resource_monitor):
         abs(mem_gb - result.runtime.mem_peak_gb) < 0.3
     ), "estimated memory error above .3GB"
     assert int(result.runtime.cpu_percent / 100 + 0.2) >= n_procs
+
+
+def _sleep(seconds):
+    import time
+
+    time.sleep(seconds)
+    return seconds
+
+
+def test_resource_monitor_log(tmpdir, use_resource_monitor):
+    """
+    Test the samples are logged apart from the results, and gathered in
+    the summary of the workflow
+    """
+    import json
+
+    pytest.importorskip("psutil")
+    from ....pipeline import engine as pe
+    from ....utils.profiler import SAMPLE_DTYPE, load_resource_samples
+
+    tmpdir.chdir()
+    wf = pe.Workflow("wf", base_dir=tmpdir.strpath)
+    wf.add_nodes([pe.Node(niu.Function(function=_sleep), name="sleep")])
+    wf.get_node("sleep").inputs.seconds = 0.5
+    execgraph = wf.run()
+
+    runtime = next(iter(execgraph.nodes())).result.runtime
+    assert not hasattr(runtime, "prof_dict")
+    samples = load_resource_samples(runtime.resmon)
+    assert samples.dtype == SAMPLE_DTYPE
+    assert len(samples) >= 2
+    assert runtime.mem_peak_gb == pytest.approx(samples["rss_MiB"].max() / 1024)
+    assert runtime.cpu_mean_percent == pytest.approx(samples["cpus"].mean())
+    # Only the summaries are stored in the results
+    assert not hasattr(runtime, "resource_samples")
+
+    with open(tmpdir.join("wf", "resource_monitor.json").strpath) as fp:
+        summary = json.load(fp)
+    assert summary["time"] == samples["time"].tolist()
+    assert summary["name"] == ["wf.sleep"] * len(samples)
+
+
+def test_resource_monitor_removed_nodes(tmpdir, use_resource_monitor):
+    """Test the summary covers the nodes whose directory was removed"""
+    import json
+
+    pytest.importorskip("psutil")
+    from ....pipeline import engine as pe
+
+    tmpdir.chdir()
+    wf = pe.Workflow("wf", base_dir=tmpdir.strpath)
+    wf.config["execution"]["remove_node_directories"] = True
+    first = pe.Node(niu.Function(function=_sleep), name="first")
+    first.inputs.seconds = 0.3
+    second = pe.Node(niu.Function(function=_sleep), name="second")
+    wf.connect(first, "out", second, "seconds")
+    wf.run(plugin="MultiProc", plugin_args={"n_procs": 1})
+
+    assert not tmpdir.join("wf", "first").check()
+    with open(tmpdir.join("wf", "resource_monitor.json").strpath) as fp:
+        summary = json.load(fp)
+    assert set(summary["name"]) == {"wf.first", "wf.second"}
+
+
+def test_resource_monitor_segments(tmpdir, use_resource_monitor):
+    """Test the columnar summary of workflows gets one segment per run"""
+    pytest.importorskip("psutil")
+    from ....pipeline import engine as pe
+    from ....pipeline.engine.utils import load_workflow_resources
+    from ....utils.profiler import load_resource_samples
+
+    config.set("monitoring", "summary_format", "npz")
+    try:
+        nsamples = []
+        tmpdir.chdir()
+        for _ in range(2):
+            wf = pe.Workflow("wf", base_dir=tmpdir.strpath)
+            node = pe.MapNode(
+                niu.Function(function=_sleep), iterfield=["seconds"], name="sleep"
+            )
+            node.inputs.seconds = [0.1, 0.2]
+            wf.add_nodes([node])
+            execgraph = wf.run()
+            runtimes = next(iter(execgraph.nodes())).result.runtime
+            nsamples.append(
+                sum(len(load_resource_samples(rt.resmon)) for rt in runtimes)
+            )
+    finally:
+        config.set("monitoring", "summary_format", "json")
+
+    summary = tmpdir.join("wf", "resource_monitor").strpath
+    resources = load_workflow_resources(summary)
+    assert set(resources["run"]) == {0, 1}
+    assert set(resources["name"]) == {"wf.sleep"}
+    assert set(resources["interface"]) == {"Function"}
+    assert set(resources["mapnode"]) == {0, 1}
+
+    last = load_workflow_resources(summary, columns=["time", "mapnode"], runs=[-1])
+    assert sorted(last) == ["mapnode", "time"]
+    assert len(last["time"]) == nsamples[-1]
+
+
+def test_resource_sampler(tmpdir):
+    """Test monitors register with the shared sampler instead of sampling"""
+    pytest.importorskip("psutil")
+    import time
+    from ....utils.profiler import (
+        ResourceMonitor,
+        ResourceSampler,
+        load_resource_samples,
+        use_resource_sampler,
+    )
+
+    sampler = ResourceSampler(freq=0.2)
+    sampler.start()
+    use_resource_sampler(sampler.registry)
+    try:
+        monitor = ResourceMonitor(
+            os.getpid(), freq=0.2, fname=tmpdir.join("log").strpath
+        )
+        monitor.start()
+        assert len(os.listdir(sampler.registry)) == 1
+        time.sleep(0.7)
+        peaks = monitor.stop()
+        assert os.listdir(sampler.registry) == []
+        assert not monitor.is_alive()
+    finally:
+        use_resource_sampler(None)
+        sampler.stop()
+    assert not os.path.exists(sampler.registry)
+
+    samples = load_resource_samples(monitor.fname)
+    # The first and last samples, and those of the sampler in between
+    assert len(samples) >= 4
+    assert (np.diff(samples["time"]) >= 0).all()
+    assert peaks["mem_peak_gb"] == pytest.approx(samples["rss_MiB"].max() / 1024)
+
+
+def test_resource_sampler_multiproc(tmpdir, use_resource_monitor):
+    """Test MultiProc workers are monitored by the sampler of the master"""
+    pytest.importorskip("psutil")
+    from ....pipeline import engine as pe
+    from ....utils.profiler import load_resource_samples
+
+    tmpdir.chdir()
+    wf = pe.Workflow("wf", base_dir=tmpdir.strpath)
+    node = pe.MapNode(niu.Function(function=_sleep), iterfield=["seconds"], name="n")
+    node.inputs.seconds = [1.5, 1.5]
+    wf.add_nodes([node])
+    execgraph = wf.run(plugin="MultiProc", plugin_args={"n_procs": 2})
+    for runtime in next(iter(execgraph.nodes())).result.runtime:
+        assert len(load_resource_samples(runtime.resmon)) >= 3
+        assert runtime.mem_peak_gb > 0
+
+
+def test_resource_sampler_aborted_run(tmpdir, use_resource_monitor):
+    """Test the sampler of MultiProc is stopped when a run fails"""
+    pytest.importorskip("psutil")
+    from ....pipeline import engine as pe
+    from ....pipeline.plugins import MultiProcPlugin
+
+    tmpdir.chdir()
+    wf = pe.Workflow("wf", base_dir=tmpdir.strpath)
+    wf.add_nodes([pe.Node(niu.Function(function=_sleep), name="n", mem_gb=1000)])
+    plugin = MultiProcPlugin(plugin_args={"n_procs": 1, "memory_gb": 1})
+    # Nothing is started until the workflow is run
+    assert plugin._sampler is None
+
+    with pytest.raises(RuntimeError, match="Insufficient resources"):
+        wf.run(plugin=plugin)
+    assert not plugin._sampler.is_alive()
+    assert not os.path.exists(plugin._sampler.registry)
+
+
+def test_resource_profiles(tmpdir):
+    """Test resources measured on previous runs are persisted and estimated"""
+    from ....utils.profiler import ResourceProfiles
+
+    fname = tmpdir.join("profiles.tsv").strpath
+    profiles = ResourceProfiles(fname, history=3, min_records=2, margin=0.5)
+    profiles.record("iface:10", 1.0, 150.0)
+    profiles.record("iface:10", None, 100.0)
+    assert profiles.estimate("iface:10") is None
+    profiles.record("iface:10", 2.0, 90.0)
+    assert profiles.estimate("iface:10") == (pytest.approx(3.0), 2)
+    assert profiles.estimate("iface:11") is None
+
+    with open(fname, "a") as fp:
+        fp.write("malformed\n")
+    reloaded = ResourceProfiles(fname, history=3, min_records=2, margin=0.5)
+    assert reloaded.estimate("iface:10") == (pytest.approx(3.0), 2)
+    # Only the last records are kept
+    reloaded.record("iface:10", 0.5, 50.0)
+    reloaded.record("iface:10", 0.5, 50.0)
+    assert reloaded.estimate("iface:10") == (pytest.approx(3.0), 1)
+
+    # Durations are measured regardless of the resource monitor
+    assert reloaded.duration("iface") is None
+    reloaded.record("iface:10", None, None, 2.0)
+    reloaded.record("iface:12", None, None, 4.0)
+    assert reloaded.estimate("iface:12") is None
+    assert ResourceProfiles(fname).duration("iface") == pytest.approx(3.0)
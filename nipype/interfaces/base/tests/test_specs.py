@@ -11,7 +11,7 @@ from ...base import traits, Undefined
 from ....interfaces import fsl
 from ...utility.wrappers import Function
 from ....pipeline import Node
-from ..specs import get_filecopy_info
+from ..specs import _sorted_listings, get_filecopy_info
 
 
 @pytest.fixture(scope="module")
@@ -410,6 +410,56 @@ def test_TraitedSpec_withNoFileHashing(setup_file):
     assert hashval1[1] != hashval2[1]
 
 
+def test_TraitedSpec_hash_format(setup_file):
+    tmp_infile = setup_file
+
+    class spec(nib.TraitedSpec):
+        moo = nib.File(exists=True)
+        doo = nib.traits.List(nib.traits.Any())
+        info = nib.traits.Any()
+
+    def get_hashval(**kwargs):
+        return spec(**kwargs).get_hashval(hash_method="content", hash_format=2)
+
+    kwargs = {
+        "moo": tmp_infile,
+        "doo": [1, 2.0, "3", (4, None, True)],
+        "info": nib.Bunch(onsets=[[0.0, 10.0]], names=["a"]),
+    }
+    hashed_inputs, hashvalue = get_hashval(**kwargs)
+    assert hashed_inputs == spec(**kwargs).get_hashval(hash_method="content")[0]
+    assert hashvalue != spec(**kwargs).get_hashval(hash_method="content")[1]
+    # Values are canonicalized
+    rounded = dict(kwargs, doo=[1, 2.00000000001, "3", (4, None, True)])
+    assert get_hashval(**rounded)[1] == hashvalue
+    # Values are typed
+    for doo in ([1, 2.0, "3", [4, None, True]], [1, 2.0, 3, (4, None, True)]):
+        assert get_hashval(**dict(kwargs, doo=doo))[1] != hashvalue
+    # Containers are delimited
+    assert get_hashval(doo=[["a"], "b"])[1] != get_hashval(doo=[["a", "b"]])[1]
+    with pytest.raises(ValueError):
+        spec().get_hashval(hash_format=3)
+
+
+def test_TraitedSpec_hash_listings(setup_file):
+    tmp_infile = setup_file
+
+    class spec(nib.TraitedSpec):
+        moo = nib.File(exists=True)
+        doo = nib.traits.Any()
+
+    inputs = spec(moo=tmp_infile, doo={"b": [1.0, (tmp_infile, "x")], "a": None})
+    file_hashes = {tmp_infile: "digest"}
+    # Both listings of the hash format 1 are built in a single pass
+    for name in ("moo", "doo"):
+        val = getattr(inputs, name)
+        assert _sorted_listings(val, True, file_hashes) == (
+            inputs._get_sorteddict(val, True, file_hashes=file_hashes),
+            inputs._get_sorteddict(val, file_hashes=file_hashes),
+        )
+    assert _sorted_listings(tmp_infile, False, file_hashes) == (tmp_infile,) * 2
+
+
 def test_ImageFile():
     x = nib.BaseInterface().inputs
 
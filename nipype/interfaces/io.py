@@ -21,6 +21,7 @@ import subprocess
 import re
 import copy
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from os.path import join, dirname
 from warnings import warn
 
@@ -236,6 +237,18 @@ class DataSinkInputSpec(DynamicTraitedSpec, BaseInterfaceInputSpec):
     remove_dest_dir = traits.Bool(
         False, usedefault=True, desc="remove dest directory when copying dirs"
     )
+    copy_threads = traits.Range(
+        low=1,
+        value=1,
+        usedefault=True,
+        desc="number of files copied concurrently to the local output directory",
+    )
+    quick_check = traits.Bool(
+        False,
+        usedefault=True,
+        desc="consider existing files with the size and modification time of "
+        "their source identical, without hashing their contents",
+    )
 
     # AWS S3 data attributes
     creds_path = Str(
@@ -720,6 +733,9 @@ class DataSink(IOBase):
                     else:
                         raise (inst)
 
+        # Files to copy locally, as (src, dst) pairs
+        copies = []
+
         # Iterate through outputs attributes {key : path(s)}
         for key, files in list(self.inputs._outputs.items()):
             if not isdefined(files):
@@ -772,14 +788,7 @@ class DataSink(IOBase):
                                 raise (inst)
                     # If src is a file, copy it to dst
                     if os.path.isfile(src):
-                        iflogger.debug("copyfile: %s %s", src, dst)
-                        copyfile(
-                            src,
-                            dst,
-                            copy=True,
-                            hashmethod="content",
-                            use_hardlink=use_hardlink,
-                        )
+                        copies.append((src, dst))
                         out_files.append(dst)
                     # If src is a directory, copy entire contents to dst dir
                     elif os.path.isdir(src):
@@ -790,6 +799,30 @@ class DataSink(IOBase):
                         copytree(src, dst)
                         out_files.append(dst)
 
+        def _copyfiles(pairs):
+            for src, dst in pairs:
+                iflogger.debug("copyfile: %s %s", src, dst)
+                copyfile(
+                    src,
+                    dst,
+                    copy=True,
+                    hashmethod="content",
+                    use_hardlink=use_hardlink,
+                    quick_check=self.inputs.quick_check,
+                )
+
+        # Destinations sharing a stem may be related files (or the same file),
+        # so they are copied in turn
+        groups = {}
+        for src, dst in copies:
+            groups.setdefault(split_filename(dst)[:2], []).append((src, dst))
+        if self.inputs.copy_threads > 1 and len(groups) > 1:
+            with ThreadPoolExecutor(max_workers=self.inputs.copy_threads) as pool:
+                # Consume the results to raise the first error, if any
+                list(pool.map(_copyfiles, groups.values()))
+        else:
+            _copyfiles(copies)
+
         # Return outputs dictionary
         outputs["out_file"] = out_files
 
@@ -10,12 +10,18 @@ def test_DataSink_inputs():
         base_directory=dict(),
         bucket=dict(),
         container=dict(),
+        copy_threads=dict(
+            usedefault=True,
+        ),
         creds_path=dict(),
         encrypt_bucket_keys=dict(),
         local_copy=dict(),
         parameterization=dict(
             usedefault=True,
         ),
+        quick_check=dict(
+            usedefault=True,
+        ),
         regexp_substitutions=dict(),
         remove_dest_dir=dict(
             usedefault=True,
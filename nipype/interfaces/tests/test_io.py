@@ -486,6 +486,40 @@ def test_datasink_substitutions(tmpdir):
     ]  # so we got re used 2nd and both patterns
 
 
+def test_datasink_copy_threads(tmpdir):
+    indir = tmpdir.mkdir("in")
+    files = []
+    for n in ["a.txt", "b.txt", "c.img", "c.hdr", "d.nii"]:
+        f = indir.join(n)
+        f.write(n)
+        files.append(f.strpath)
+    outdir = tmpdir.join("out")
+    ds = nio.DataSink(
+        parameterization=False,
+        base_directory=outdir.strpath,
+        copy_threads=4,
+        quick_check=True,
+    )
+    setattr(ds.inputs, "@files", files)
+    out_files = ds.run().outputs.out_file
+    assert out_files == [outdir.join(os.path.basename(f)).strpath for f in files]
+    for src, dst in zip(files, out_files):
+        assert open(dst).read() == open(src).read()
+        assert os.stat(dst).st_mtime_ns == os.stat(src).st_mtime_ns
+
+    # Files of the same size and modification time are not copied again
+    dst = out_files[0]
+    with open(dst + ".new", "w") as fp:
+        fp.write("A.txt")
+    os.utime(dst + ".new", ns=(0, os.stat(files[0]).st_mtime_ns))
+    os.replace(dst + ".new", dst)
+    ds.run()
+    assert open(dst).read() == "A.txt"
+    ds.inputs.quick_check = False
+    ds.run()
+    assert open(dst).read() == "a.txt"
+
+
 @pytest.fixture()
 def _temp_analyze_files(tmpdir):
     """Generate temporary analyze file pair."""
@@ -9,6 +9,7 @@ from collections import OrderedDict, defaultdict
 import os
 import os.path as op
 from pathlib import Path
+import pickle
 import shutil
 import socket
 from copy import deepcopy
@@ -20,7 +21,7 @@ from tempfile import mkdtemp
 from ... import config, logging
 from ...utils.misc import flatten, unflatten, str2bool, dict_diff
 from ...utils.filemanip import (
-    md5,
+    get_hash_algorithm,
     ensure_list,
     simplify_list,
     copyfiles,
@@ -49,8 +50,12 @@ from ...interfaces.base.specs import get_filecopy_info
 from .utils import (
     _parameterization_dir,
     save_hashfile as _save_hashfile,
+    record_hash_scheme as _record_hash_scheme,
     load_resultfile as _load_resultfile,
+    load_outputs as _load_outputs,
     save_resultfile as _save_resultfile,
+    read_cache_index as _read_cache_index,
+    update_cache_index as _update_cache_index,
     nodelist_runner as _node_runner,
     strip_temp as _strip_temp,
     write_node_report,
@@ -318,17 +323,60 @@ class Node(EngineBase):
         """Print interface help"""
         self._interface.help()
 
+    def _cache_index(self):
+        """
+        Return the workflow cache index file and the key of this node,
+        or ``None`` if the cache index is disabled.
+        """
+        if not str2bool(self.config["execution"].get("use_cache_index", False)):
+            return None
+        index_dir = self.base_dir
+        if self._hierarchy:
+            index_dir = op.join(index_dir, self._hierarchy.split(".")[0])
+        index_file = op.join(index_dir, "_cache_index.tsv")
+        return index_file, op.relpath(self.output_dir(), index_dir)
+
+    def _update_cache_index(self):
+        """Record the current hash and results file of this node in the index"""
+        index = self._cache_index()
+        if index is not None:
+            _update_cache_index(
+                *index,
+                self._hashvalue,
+                op.join(self.output_dir(), "result_%s.pklz" % self.name),
+            )
+
     def is_cached(self, rm_outdated=False):
         """
         Check if the interface has been run previously, and whether
         cached results are up-to-date.
+
+        When ``use_cache_index`` is enabled, the node is first looked up in
+        the workflow cache index, which avoids listing the hashfiles of the
+        node directory. Missing or stale entries fall back to the on-disk
+        check.
         """
         outdir = self.output_dir()
+        resultsfile = op.join(outdir, "result_%s.pklz" % self.name)
+
+        index = self._cache_index()
+        if index is not None:
+            entry = _read_cache_index(index[0]).get(index[1])
+            if entry is not None:
+                try:
+                    stat = os.stat(resultsfile)
+                except OSError:
+                    stat = None
+                if (
+                    stat is not None
+                    and (stat.st_size, stat.st_mtime_ns) == entry[1:]
+                    and self._get_hashval()[1] == entry[0]
+                ):
+                    logger.debug('[Node] Up-to-date cache indexed for "%s".', outdir)
+                    return True, True
 
         # The output folder does not exist: not cached
-        if not op.exists(outdir) or not op.exists(
-            op.join(outdir, "result_%s.pklz" % self.name)
-        ):
+        if not op.exists(outdir) or not op.exists(resultsfile):
             logger.debug('[Node] Not cached "%s".', outdir)
             return False, False
 
@@ -355,6 +403,7 @@ class Node(EngineBase):
         if cached and len(hashfiles) == 1:
             assert hashfile == hashfiles[0]
             logger.debug('[Node] Up-to-date cache found for "%s".', self.fullname)
+            self._update_cache_index()
             return True, True  # Cached and updated
 
         if len(hashfiles) > 1:
@@ -378,9 +427,13 @@ class Node(EngineBase):
 
         # At this point only one hashfile is in the folder
         # and we directly check whether it is updated
-        updated = hashfile == hashfiles[0]
-        if not updated:  # Report differences depending on log verbosity
-            cached = True
+        updated = hashfile == hashfiles[0] or self._migrate_hashfile(
+            hashfiles[0], hashfile
+        )
+        cached = True
+        if updated:
+            self._update_cache_index()
+        else:  # Report differences depending on log verbosity
             logger.info('[Node] Outdated cache found for "%s".', self.fullname)
             # If logging is more verbose than INFO (20), print diff between hashes
             loglevel = logger.getEffectiveLevel()
@@ -540,24 +593,77 @@ directory. Please ensure no other concurrent workflows are racing""",
         # Tear-up after success
         shutil.move(hashfile_unfinished, hashfile_unfinished.replace("_unfinished", ""))
         write_node_report(self, result=result, is_mapnode=isinstance(self, MapNode))
+        self._update_cache_index()
         return result
 
     def _get_hashval(self):
         """Return a hash of the input state"""
         self._get_inputs()
         if self._hashvalue is None and self._hashed_inputs is None:
-            self._hashed_inputs, self._hashvalue = self.inputs.get_hashval(
-                hash_method=self.config["execution"]["hash_method"]
-            )
-            rm_extra = self.config["execution"]["remove_unnecessary_outputs"]
-            if str2bool(rm_extra) and self.needed_outputs:
-                hashobject = md5()
-                hashobject.update(self._hashvalue.encode())
-                hashobject.update(str(self.needed_outputs).encode())
-                self._hashvalue = hashobject.hexdigest()
-                self._hashed_inputs.append(("needed_outputs", self.needed_outputs))
+            self._hashed_inputs, self._hashvalue = self._compute_hashval()
         return self._hashed_inputs, self._hashvalue
 
+    def _hash_scheme(self):
+        """Return the configured hash algorithm and hash format"""
+        return (
+            self.config["execution"].get("hash_algorithm", "md5").lower(),
+            int(self.config["execution"].get("hash_format", 1)),
+        )
+
+    def _compute_hashval(self, hash_scheme=None):
+        """Hash the input state with the given (or the configured) scheme"""
+        hash_algorithm, hash_format = hash_scheme or self._hash_scheme()
+        hashed_inputs, hashvalue = self.inputs.get_hashval(
+            hash_method=self.config["execution"]["hash_method"],
+            hash_algorithm=hash_algorithm,
+            hash_format=hash_format,
+        )
+        rm_extra = self.config["execution"]["remove_unnecessary_outputs"]
+        if str2bool(rm_extra) and self.needed_outputs:
+            hashobject = get_hash_algorithm(hash_algorithm)()
+            hashobject.update(hashvalue.encode())
+            hashobject.update(str(self.needed_outputs).encode())
+            hashvalue = hashobject.hexdigest()
+            hashed_inputs.append(("needed_outputs", self.needed_outputs))
+        _record_hash_scheme(hashed_inputs, hash_algorithm, hash_format)
+        return hashed_inputs, hashvalue
+
+    def _migrate_hashfile(self, prev_hashfile, hashfile):
+        """
+        Check whether a hashfile written with a different hash algorithm
+        or hash format corresponds to the current inputs, and replace it
+        in that case.
+        """
+        try:
+            prev_inputs = dict(load_json(prev_hashfile))
+        except Exception:
+            return False
+        prev_scheme = (
+            prev_inputs.get("hash_algorithm", "md5"),
+            prev_inputs.get("hash_format", 1),
+        )
+        if prev_scheme == self._hash_scheme():
+            return False
+
+        logger.info(
+            '[Node] The hashfile of "%s" was computed with %s (format %d) '
+            "instead of %s (format %d).",
+            self.fullname,
+            *prev_scheme,
+            *self._hash_scheme(),
+        )
+        try:
+            prev_hashvalue = self._compute_hashval(prev_scheme)[1]
+        except ValueError:  # The algorithm or format is not available
+            return False
+        if op.basename(prev_hashfile) != "_0x%s.json" % prev_hashvalue:
+            return False
+
+        logger.info('[Node] Migrating up-to-date hashfile of "%s".', self.fullname)
+        _save_hashfile(hashfile, self._hashed_inputs)
+        os.remove(prev_hashfile)
+        return True
+
     def _get_inputs(self):
         """
         Retrieve inputs from pointers to results files.
@@ -586,7 +692,7 @@ directory. Please ensure no other concurrent workflows are racing""",
         for results_fname, connections in list(prev_results.items()):
             outputs = None
             try:
-                outputs = _load_resultfile(results_fname).outputs
+                outputs = _load_outputs(results_fname)
             except AttributeError as e:
                 logger.critical("%s", e)
 
@@ -604,7 +710,7 @@ Error populating the inputs of node "%s": the results file of the source node \
                     value = getattr(outputs, conn[0])
                     if isdefined(value):
                         output_value = evaluate_connect_function(
-                            conn[1], conn[2], value
+                            conn[1], conn[2], deepcopy(value)
                         )
                 else:
                     output_name = conn
@@ -1086,7 +1192,14 @@ class MapNode(Node):
     """
 
     def __init__(
-        self, interface, iterfield, name, serial=False, nested=False, **kwargs
+        self,
+        interface,
+        iterfield,
+        name,
+        serial=False,
+        nested=False,
+        chunk_size=None,
+        **kwargs,
     ):
         """
 
@@ -1108,6 +1221,12 @@ class MapNode(Node):
             support for nested lists. If set, the input list will be flattened
             before running and the nested list structure of the outputs will
             be resored.
+        chunk_size : int
+            if set, plugins submit the subnodes in groups of ``chunk_size``,
+            each group being run serially by a single job. The subnodes keep
+            their working directories, so that their results are cached and
+            collated as usual. Useful when the interface is cheap compared
+            to the overhead of a job.
 
         See Node docstring for additional keyword arguments.
         """
@@ -1123,6 +1242,11 @@ class MapNode(Node):
         self._inputs.on_trait_change(self._set_mapnode_input)
         self._got_inputs = False
         self._serial = serial
+        if chunk_size is not None and (
+            not isinstance(chunk_size, int) or chunk_size < 1
+        ):
+            raise ValueError("chunk_size must be a positive integer.")
+        self.chunk_size = chunk_size
 
     def _create_dynamic_traits(self, basetraits, fields=None, nitems=None):
         """Convert specific fields of a trait to accept multiple inputs"""
@@ -1171,6 +1295,12 @@ class MapNode(Node):
         if self._hashvalue is not None and self._hashed_inputs is not None:
             return self._hashed_inputs, self._hashvalue
 
+        self._hashed_inputs, self._hashvalue = self._compute_hashval()
+        return self._hashed_inputs, self._hashvalue
+
+    def _compute_hashval(self, hash_scheme=None):
+        """Hash the input state, including iterfield lists"""
+        hash_algorithm, hash_format = hash_scheme or self._hash_scheme()
         self._check_iterfield()
         hashinputs = deepcopy(self._interface.inputs)
         for name in self.iterfield:
@@ -1184,18 +1314,20 @@ class MapNode(Node):
             else:
                 setattr(hashinputs, name, getattr(self._inputs, name))
         hashed_inputs, hashvalue = hashinputs.get_hashval(
-            hash_method=self.config["execution"]["hash_method"]
+            hash_method=self.config["execution"]["hash_method"],
+            hash_algorithm=hash_algorithm,
+            hash_format=hash_format,
         )
         rm_extra = self.config["execution"]["remove_unnecessary_outputs"]
         if str2bool(rm_extra) and self.needed_outputs:
-            hashobject = md5()
+            hashobject = get_hash_algorithm(hash_algorithm)()
             hashobject.update(hashvalue.encode())
             sorted_outputs = sorted(self.needed_outputs)
             hashobject.update(str(sorted_outputs).encode())
             hashvalue = hashobject.hexdigest()
             hashed_inputs.append(("needed_outputs", sorted_outputs))
-        self._hashed_inputs, self._hashvalue = hashed_inputs, hashvalue
-        return self._hashed_inputs, self._hashvalue
+        _record_hash_scheme(hashed_inputs, hash_algorithm, hash_format)
+        return hashed_inputs, hashvalue
 
     @property
     def inputs(self):
@@ -1206,17 +1338,33 @@ class MapNode(Node):
         if self._interface._outputs():
             return Bunch(self._interface._outputs().trait_get())
 
+    def _iterfield_values(self, field):
+        """Return the values of an iterfield (flattened for nested MapNodes)"""
+        if self.nested:
+            return flatten(ensure_list(getattr(self.inputs, field)))
+        return ensure_list(getattr(self.inputs, field))
+
     def _make_nodes(self, cwd=None):
+        """
+        Generate the subnodes on demand. Each subnode gets a copy of the
+        interface (with the inputs shared by all subnodes), which is
+        serialized only once, and the iterfield values at its index.
+        """
         if cwd is None:
             cwd = self.output_dir()
-        if self.nested:
-            nitems = len(flatten(ensure_list(getattr(self.inputs, self.iterfield[0]))))
-        else:
-            nitems = len(ensure_list(getattr(self.inputs, self.iterfield[0])))
-        for i in range(nitems):
+        try:
+            interface = pickle.dumps(self._interface, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            interface = None  # Not picklable, deepcopy it for every subnode
+        fieldvals = [(field, self._iterfield_values(field)) for field in self.iterfield]
+        for i in range(len(fieldvals[0][1])):
             nodename = "_%s%d" % (self.name, i)
             node = Node(
-                deepcopy(self._interface),
+                (
+                    deepcopy(self._interface)
+                    if interface is None
+                    else pickle.loads(interface)
+                ),
                 n_procs=self._n_procs,
                 mem_gb=self._mem_gb,
                 overwrite=self.overwrite,
@@ -1226,24 +1374,27 @@ class MapNode(Node):
                 name=nodename,
             )
             node.plugin_args = self.plugin_args
-            node.interface.inputs.trait_set(
-                **deepcopy(self._interface.inputs.trait_get())
-            )
             node.interface.resource_monitor = self._interface.resource_monitor
-            for field in self.iterfield:
-                if self.nested:
-                    fieldvals = flatten(ensure_list(getattr(self.inputs, field)))
-                else:
-                    fieldvals = ensure_list(getattr(self.inputs, field))
-                logger.debug("setting input %d %s %s", i, field, fieldvals[i])
-                setattr(node.inputs, field, fieldvals[i])
+            for field, values in fieldvals:
+                logger.debug("setting input %d %s %s", i, field, values[i])
+                setattr(node.inputs, field, values[i])
             node.config = self.config
             yield i, node
 
     def _collate_results(self, nodes):
+        outputs = self.outputs
         finalresult = InterfaceResult(
-            interface=[], runtime=[], provenance=[], inputs=[], outputs=self.outputs
+            interface=[], runtime=[], provenance=[], inputs=[], outputs=outputs
         )
+
+        # Outputs are collected into preallocated lists, and set once
+        output_names = [key for key, _ in outputs.items()] if outputs else []
+        rm_extra = self.config["execution"]["remove_unnecessary_outputs"]
+        if str2bool(rm_extra) and self.needed_outputs:
+            output_names = [key for key in output_names if key in self.needed_outputs]
+        nitems = len(self._iterfield_values(self.iterfield[0]))
+        collated = {key: [None] * nitems for key in output_names}
+
         returncode = []
         for i, nresult, err in nodes:
             finalresult.runtime.insert(i, None)
@@ -1257,25 +1408,17 @@ class MapNode(Node):
                 if hasattr(nresult, "provenance"):
                     finalresult.provenance.insert(i, nresult.provenance)
 
-            if self.outputs:
-                for key, _ in list(self.outputs.items()):
-                    rm_extra = self.config["execution"]["remove_unnecessary_outputs"]
-                    if str2bool(rm_extra) and self.needed_outputs:
-                        if key not in self.needed_outputs:
-                            continue
-                    values = getattr(finalresult.outputs, key)
-                    if not isdefined(values):
-                        values = []
-                    if nresult and nresult.outputs:
-                        values.insert(i, nresult.outputs.trait_get()[key])
-                    else:
-                        values.insert(i, None)
-                    defined_vals = [isdefined(val) for val in values]
-                    if any(defined_vals) and finalresult.outputs:
-                        setattr(finalresult.outputs, key, values)
+            if collated and nresult and nresult.outputs:
+                node_outputs = nresult.outputs.trait_get()
+                for key, values in collated.items():
+                    values[i] = node_outputs[key]
+
+        for key, values in collated.items():
+            if any(isdefined(val) for val in values):
+                setattr(finalresult.outputs, key, values)
 
         if self.nested:
-            for key, _ in list(self.outputs.items()):
+            for key, _ in list(outputs.items()):
                 values = getattr(finalresult.outputs, key)
                 if isdefined(values):
                     values = unflatten(
@@ -1300,17 +1443,27 @@ class MapNode(Node):
         self._get_inputs()
         self._check_iterfield()
         write_node_report(self, result=None, is_mapnode=True)
-        return [node for _, node in self._make_nodes()]
+        subnodes = list(self._make_nodes())
+        if not self.chunk_size:
+            return [node for _, node in subnodes]
+        return [
+            MapNodeChunk(self, subnodes[start : start + self.chunk_size])
+            for start in range(0, len(subnodes), self.chunk_size)
+        ]
 
     def num_subnodes(self):
-        """Get the number of subnodes to iterate in this MapNode"""
+        """
+        Get the number of subnodes to iterate in this MapNode (or of chunks
+        of subnodes, if ``chunk_size`` is set)
+        """
         self._get_inputs()
         self._check_iterfield()
         if self._serial:
             return 1
-        if self.nested:
-            return len(ensure_list(flatten(getattr(self.inputs, self.iterfield[0]))))
-        return len(ensure_list(getattr(self.inputs, self.iterfield[0])))
+        nitems = len(self._iterfield_values(self.iterfield[0]))
+        if self.chunk_size:
+            return -(-nitems // self.chunk_size)
+        return nitems
 
     def _get_inputs(self):
         old_inputs = self._inputs.trait_get()
@@ -1352,10 +1505,7 @@ class MapNode(Node):
             return self._load_results()
 
         # Set up mapnode folder names
-        if self.nested:
-            nitems = len(ensure_list(flatten(getattr(self.inputs, self.iterfield[0]))))
-        else:
-            nitems = len(ensure_list(getattr(self.inputs, self.iterfield[0])))
+        nitems = len(self._iterfield_values(self.iterfield[0]))
         nnametpl = "_%s{}" % self.name
         nodenames = [nnametpl.format(i) for i in range(nitems)]
 
@@ -1406,3 +1556,40 @@ class MapNode(Node):
             shutil.rmtree(path)
 
         return result
+
+
+class MapNodeChunk(MapNode):
+    """
+    A serial MapNode running a group of subnodes of a chunked MapNode.
+
+    The subnodes are those generated by the chunked MapNode, so that they
+    run in its ``mapflow`` directory. The chunk itself keeps its hashfile
+    and results in ``mapflow/_<name>_chunk<first subnode index>``.
+    """
+
+    def __init__(self, mapnode, subnodes):
+        first = subnodes[0][0]
+        super().__init__(
+            deepcopy(mapnode._interface),
+            mapnode.iterfield,
+            "_%s_chunk%d" % (mapnode.name, first),
+            serial=True,
+            n_procs=mapnode._n_procs,
+            mem_gb=mapnode._mem_gb,
+            overwrite=mapnode.overwrite,
+            needed_outputs=mapnode.needed_outputs,
+            run_without_submitting=mapnode.run_without_submitting,
+            base_dir=op.join(mapnode.output_dir(), "mapflow"),
+        )
+        self.plugin_args = mapnode.plugin_args
+        self.config = mapnode.config
+        self._subnodes = [node for _, node in subnodes]
+        for field in self.iterfield:
+            setattr(
+                self.inputs,
+                field,
+                [getattr(node.inputs, field) for node in self._subnodes],
+            )
+
+    def _make_nodes(self, cwd=None):
+        yield from enumerate(self._subnodes)
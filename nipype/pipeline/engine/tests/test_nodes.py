@@ -188,6 +188,68 @@ def test_mapnode_expansion(tmpdir):
             assert getattr(node, attr) == getattr(mapnode, attr)
 
 
+def test_mapnode_subnode_inputs(tmpdir):
+    tmpdir.chdir()
+    from nipype import MapNode, Function
+
+    def func1(in1, in2):
+        return in1 + len(in2)
+
+    mapnode = MapNode(Function(function=func1), iterfield="in1", name="mapnode")
+    mapnode.inputs.in1 = [1, 2, 3]
+    mapnode.inputs.in2 = [0]
+
+    subnodes = [node for _, node in mapnode._make_nodes()]
+    assert [node.inputs.in1 for node in subnodes] == [1, 2, 3]
+    # Subnodes do not share their inputs
+    subnodes[0].inputs.in2.append(1)
+    assert [node.inputs.in2 for node in subnodes] == [[0, 1], [0], [0]]
+    assert mapnode.inputs.in2 == [0]
+
+    assert mapnode.run().outputs.out == [2, 3, 4]
+
+
+@pytest.mark.parametrize("plugin", ["Linear", "MultiProc"])
+def test_mapnode_chunks(tmpdir, plugin):
+    tmpdir.chdir()
+    from nipype import MapNode, Function
+
+    def func1(in1):
+        return in1 + 1
+
+    with pytest.raises(ValueError):
+        MapNode(Function(function=func1), iterfield="in1", name="m", chunk_size=0)
+
+    mapnode = MapNode(
+        Function(function=func1), iterfield="in1", name="mapnode", chunk_size=2
+    )
+    mapnode.inputs.in1 = [1, 2, 3, 4, 5]
+    assert mapnode.num_subnodes() == 3
+
+    mapnode.config = deepcopy(config._sections)
+    chunks = mapnode.get_subnodes()
+    assert [chunk.name for chunk in chunks] == [
+        "_mapnode_chunk0",
+        "_mapnode_chunk2",
+        "_mapnode_chunk4",
+    ]
+    assert [chunk.inputs.in1 for chunk in chunks] == [[1, 2], [3, 4], [5]]
+    assert chunks[1].run().outputs.out == [4, 5]
+    mapflow = os.path.join(mapnode.output_dir(), "mapflow")
+    assert sorted(os.listdir(mapflow)) == ["_mapnode2", "_mapnode3", "_mapnode_chunk2"]
+
+    wf = pe.Workflow(name="wf", base_dir=tmpdir.strpath)
+    mapnode = MapNode(
+        Function(function=func1), iterfield="in1", name="mapnode", chunk_size=2
+    )
+    mapnode.inputs.in1 = [1, 2, 3, 4, 5]
+    wf.add_nodes([mapnode])
+    (result,) = wf.run(plugin=plugin).nodes()
+    assert result.result.outputs.out == [2, 3, 4, 5, 6]
+    mapflow = os.path.join(tmpdir.strpath, "wf", "mapnode", "mapflow")
+    assert sorted(os.listdir(mapflow)) == ["_mapnode%d" % i for i in range(5)]
+
+
 def test_node_hash(tmpdir):
     from nipype.interfaces.utility import Function
 
@@ -252,6 +314,84 @@ def test_node_hash(tmpdir):
     w1.run(plugin=RaiseError())
 
 
+def test_node_cache_index(tmpdir, monkeypatch):
+    from nipype.pipeline.engine import nodes
+
+    def func(a):
+        return a + 1
+
+    def make_workflow():
+        n1 = pe.Node(niu.Function(function=func), name="n1")
+        n1.inputs.a = 1
+        n2 = pe.Node(niu.Function(function=func), name="n2")
+        n2.inputs.a = 2
+        wf = pe.Workflow(name="index", base_dir=tmpdir.strpath)
+        wf.add_nodes([n1, n2])
+        wf.config["execution"]["use_cache_index"] = True
+        return wf
+
+    def get_node(name):
+        # Set the node up as the workflow would do before execution
+        wf = make_workflow()
+        node = wf.get_node(name)
+        node.base_dir, node._hierarchy = tmpdir.strpath, wf.name
+        node.config = merge_dict(deepcopy(config._sections), wf.config)
+        return node
+
+    make_workflow().run(plugin="Linear")
+    index_file = tmpdir / "index" / "_cache_index.tsv"
+    assert sorted(nodes._read_cache_index(index_file)) == ["n1", "n2"]
+
+    # Indexed nodes do not list the hashfiles of their directory
+    def _fail(*args, **kwargs):
+        raise AssertionError("glob should not be called")
+
+    node = get_node("n1")
+    with monkeypatch.context() as m:
+        m.setattr(nodes, "glob", _fail)
+        assert node.is_cached() == (True, True)
+
+    # A stale entry falls back to checking the node directory
+    node = get_node("n1")
+    node.inputs.a = 3
+    assert node.is_cached() == (True, False)
+
+
+def test_node_hash_algorithm(tmpdir):
+    def func(a):
+        return a + 1
+
+    def make_node(algorithm, a=1, hash_format=1):
+        node = pe.Node(niu.Function(function=func), name="n", base_dir=tmpdir.strpath)
+        node.config = deepcopy(config._sections)
+        node.config["execution"]["hash_algorithm"] = algorithm
+        node.config["execution"]["hash_format"] = hash_format
+        node.inputs.a = a
+        return node
+
+    node = make_node("md5")
+    node.run()
+    md5_hash = node._get_hashval()[1]
+    assert ("hash_algorithm", "sha256") in make_node("sha256")._get_hashval()[0]
+    assert make_node("sha256")._get_hashval()[1] != md5_hash
+
+    # Changed inputs are not adopted by the new algorithm
+    assert make_node("sha256", a=2).is_cached() == (True, False)
+
+    # Hashfiles computed with the previous algorithm are migrated
+    node = make_node("sha256")
+    assert node.is_cached() == (True, True)
+    hashfiles = [f for f in os.listdir(node.output_dir()) if f.startswith("_0x")]
+    assert hashfiles == ["_0x%s.json" % node._get_hashval()[1]]
+    assert make_node("sha256").is_cached() == (True, True)
+
+    # So are hashfiles computed with the previous hash format
+    node = make_node("sha256", hash_format=2)
+    assert ("hash_format", 2) in node._get_hashval()[0]
+    assert node.is_cached() == (True, True)
+    assert make_node("md5", hash_format=2).is_cached() == (True, True)
+
+
 def test_outputs_removal(tmpdir):
     def test_function(arg1):
         import os
@@ -14,6 +14,7 @@ from ..utils import (
     clean_working_directory,
     write_workflow_prov,
     load_resultfile,
+    load_outputs,
     format_node,
 )
 
@@ -124,6 +125,51 @@ def test_clean_working_directory(tmpdir):
     config.set_default_config()
 
 
+def test_clean_working_directory_tree(tmpdir):
+    class OutputSpec(nib.TraitedSpec):
+        out_file = nib.File()
+        out_dir = nib.Directory()
+
+    for path in (
+        "out.nii",
+        "out_dir/a.txt",
+        "out_dir/sub/b.txt",
+        "out_dir_c.txt",
+        "tmp/d.txt",
+        "tmp/result_e.pklz",
+        "_report/report.rst",
+        "result_node.pklz",
+    ):
+        tmpdir.join(path).ensure()
+    tmpdir.join("link").mksymlinkto(tmpdir.join("tmp"))
+
+    outputs = OutputSpec(
+        out_file=tmpdir.join("out.nii").strpath,
+        out_dir=tmpdir.join("out_dir").strpath,
+    )
+    config.set_default_config()
+    clean_working_directory(
+        outputs,
+        tmpdir.strpath + os.sep,
+        OutputSpec(),
+        ["out_file", "out_dir"],
+        deepcopy(config._sections),
+    )
+    remaining = sorted(
+        os.path.relpath(os.path.join(path, f), tmpdir.strpath)
+        for path, _, files in os.walk(tmpdir.strpath)
+        for f in files
+    )
+    assert remaining == [
+        "_report/report.rst",
+        "out.nii",
+        "out_dir/a.txt",
+        "out_dir/sub/b.txt",
+        "result_node.pklz",
+    ]
+    assert os.path.islink(tmpdir.join("link").strpath)
+
+
 def create_wf(name):
     """Creates a workflow for the following tests"""
 
@@ -333,6 +379,48 @@ def test_save_load_resultfile(tmpdir, use_relative):
     config.set("execution", "use_relative_paths", old_use_relative)
 
 
+def test_load_outputs(tmpdir, monkeypatch):
+    from .. import utils
+
+    def func(a):
+        return a
+
+    def run_node(a):
+        node = pe.Node(niu.Function(function=func), name="n", base_dir=tmpdir.strpath)
+        node.inputs.a = a
+        node.run()
+        return os.path.join(node.output_dir(), "result_n.pklz")
+
+    results_file = run_node(1)
+
+    calls = []
+    monkeypatch.setattr(
+        utils,
+        "load_resultfile",
+        lambda *args, **kwargs: calls.append(args) or load_resultfile(*args, **kwargs),
+    )
+    outputs = load_outputs(results_file)
+    assert outputs.out == 1
+    assert load_outputs(results_file) is outputs
+    assert len(calls) == 1
+
+    # Results files are loaded again after they are overwritten
+    assert run_node(2) == results_file
+    assert load_outputs(results_file).out == 2
+    assert len(calls) == 2
+
+    with pytest.raises(FileNotFoundError):
+        load_outputs(tmpdir.join("missing.pklz").strpath)
+
+    # The runtime is stored apart from the outputs, and only loaded on demand
+    result = load_resultfile(results_file)
+    assert result.outputs.out == 2
+    assert result.runtime.cwd == os.path.dirname(results_file)
+    result = load_resultfile(results_file, runtime=False)
+    assert result.outputs.out == 2
+    assert result.runtime is None
+
+
 def test_format_node():
     node = pe.Node(niu.IdentityInterface(fields=["a", "b"]), name="node")
     serialized = format_node(node)
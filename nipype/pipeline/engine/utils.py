@@ -4,10 +4,11 @@
 import os
 import sys
 import pickle
-from collections import defaultdict
+from threading import Lock
+from collections import OrderedDict, defaultdict
 import re
+import fnmatch
 from copy import deepcopy
-from glob import glob
 from pathlib import Path
 
 from traceback import format_exception
@@ -32,6 +33,7 @@ from ...utils.filemanip import (
     write_rst_list,
 )
 from ...utils.misc import str2bool
+from ...utils.datetime import utcnow
 from ...utils.functions import create_function_from_source
 from ...interfaces.base.traits_extension import (
     rebase_path_traits,
@@ -80,6 +82,77 @@ def save_hashfile(hashfile, hashed_inputs):
             logger.critical("Unable to open the file in write mode: %s", hashfile)
 
 
+def record_hash_scheme(hashed_inputs, hash_algorithm, hash_format):
+    """Record a non-default hash algorithm and format in the hashed inputs"""
+    if hash_algorithm != "md5":
+        hashed_inputs.append(("hash_algorithm", hash_algorithm))
+    if hash_format != 1:
+        hashed_inputs.append(("hash_format", hash_format))
+
+
+_CACHE_INDEXES = {}
+
+
+def read_cache_index(index_file):
+    """
+    Read a workflow cache index written by :func:`update_cache_index`.
+
+    The index is an append-only, tab-separated file with one
+    ``<node dir> <hashvalue> <result size> <result mtime_ns>`` record per line.
+    Parsed indexes are kept in memory and only the records appended since
+    the previous call are read. Incomplete or malformed records are ignored,
+    the later records of a node directory take precedence.
+
+    Returns
+    -------
+    entries : dict
+        ``{node dir: (hashvalue, result size, result mtime_ns)}``
+
+    """
+    index_file = str(index_file)
+    try:
+        size = os.stat(index_file).st_size
+    except OSError:
+        _CACHE_INDEXES.pop(index_file, None)
+        return {}
+
+    offset, entries = _CACHE_INDEXES.get(index_file, (0, {}))
+    if size < offset:  # The index was rewritten, start over
+        offset, entries = 0, {}
+    if size > offset:
+        with open(index_file, "rb") as fp:
+            fp.seek(offset)
+            chunk = fp.read(size - offset)
+        chunk = chunk[: chunk.rfind(b"\n") + 1]  # Skip records being written
+        offset += len(chunk)
+        for line in chunk.decode(errors="replace").splitlines():
+            fields = line.split("\t")
+            try:
+                entries[fields[0]] = (fields[1], int(fields[2]), int(fields[3]))
+            except (IndexError, ValueError):
+                logger.debug("Skipping malformed cache index record: %s", line)
+    _CACHE_INDEXES[index_file] = (offset, entries)
+    return entries
+
+
+def update_cache_index(index_file, key, hashvalue, results_file):
+    """Append the hash and the results file stat of a node to the cache index."""
+    try:
+        stat = os.stat(results_file)
+    except OSError:
+        return
+    record = f"{key}\t{hashvalue}\t{stat.st_size}\t{stat.st_mtime_ns}\n"
+    # A single write on a file opened for appending keeps records whole
+    try:
+        fd = os.open(index_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+        try:
+            os.write(fd, record.encode())
+        finally:
+            os.close(fd)
+    except OSError as err:
+        logger.debug("Unable to update cache index %s: %s", index_file, err)
+
+
 def nodelist_runner(nodes, updatehash=False, stop_first=False):
     """
     A generator that iterates and over a list of ``nodes`` and
@@ -220,6 +293,25 @@ def write_report(node, report_type=None, is_mapnode=False):
     )
 
 
+OUTPUTS_CACHE_SIZE = 128
+"""Maximum number of results files whose outputs are kept by ``load_outputs``"""
+_OUTPUTS_CACHE = OrderedDict()
+_OUTPUTS_CACHE_LOCK = Lock()
+
+
+def _savepkl_result(resultsfile, result):
+    """
+    Pickle ``result`` with its runtime and provenance stored after the rest,
+    so that its outputs can be loaded without them.
+    """
+    appendix = (result.runtime, result.provenance)
+    result.runtime = result.provenance = None
+    try:
+        savepkl(resultsfile, result, appendix=appendix)
+    finally:
+        result.runtime, result.provenance = appendix
+
+
 def save_resultfile(result, cwd, name, rebase=None):
     """Save a result pklz file to ``cwd``."""
     if rebase is None:
@@ -228,20 +320,22 @@ def save_resultfile(result, cwd, name, rebase=None):
     cwd = os.path.abspath(cwd)
     resultsfile = os.path.join(cwd, "result_%s.pklz" % name)
     logger.debug("Saving results file: '%s'", resultsfile)
+    with _OUTPUTS_CACHE_LOCK:
+        _OUTPUTS_CACHE.pop(resultsfile, None)
 
     if result.outputs is None:
         logger.warning("Storing result file without outputs")
-        savepkl(resultsfile, result)
+        _savepkl_result(resultsfile, result)
         return
     try:
         output_names = result.outputs.copyable_trait_names()
     except AttributeError:
         logger.debug("Storing non-traited results, skipping rebase of paths")
-        savepkl(resultsfile, result)
+        _savepkl_result(resultsfile, result)
         return
 
     if not rebase:
-        savepkl(resultsfile, result)
+        _savepkl_result(resultsfile, result)
         return
 
     backup_traits = {}
@@ -258,14 +352,14 @@ def save_resultfile(result, cwd, name, rebase=None):
                     backup_traits[key] = old
                     val = rebase_path_traits(result.outputs.trait(key), old, cwd)
                     setattr(result.outputs, key, val)
-        savepkl(resultsfile, result)
+        _savepkl_result(resultsfile, result)
     finally:
         # Restore resolved paths from the outputs dict no matter what
         for key, val in list(backup_traits.items()):
             setattr(result.outputs, key, val)
 
 
-def load_resultfile(results_file, resolve=True):
+def load_resultfile(results_file, resolve=True, runtime=True):
     """
     Load InterfaceResult file from path.
 
@@ -277,6 +371,10 @@ def load_resultfile(results_file, resolve=True):
         Raises ``FileNotFoundError`` if ``results_file`` does not exist.
     resolve : bool
         Determines whether relative paths will be resolved to absolute (default is ``True``).
+    runtime : bool
+        Whether the runtime and provenance, stored after the outputs, are loaded too
+        (default is ``True``). Otherwise, they are left to ``None`` unless the file was
+        written before they were stored apart.
 
     Returns
     -------
@@ -289,7 +387,12 @@ def load_resultfile(results_file, resolve=True):
     if not results_file.exists():
         raise FileNotFoundError(results_file)
 
-    result = loadpkl(results_file)
+    if runtime:
+        result, appendix = loadpkl(results_file, appendix=True)
+        if appendix is not None:
+            result.runtime, result.provenance = appendix
+    else:
+        result = loadpkl(results_file)
     if resolve and getattr(result, "outputs", None):
         try:
             outputs = result.outputs.get()
@@ -311,6 +414,41 @@ def load_resultfile(results_file, resolve=True):
     return result
 
 
+def load_outputs(results_file):
+    """
+    Load the outputs stored in a results file, with paths resolved.
+
+    The outputs of the most recently loaded results files are kept in
+    memory and reused as long as the file is not replaced or modified, so
+    that a results file feeding many nodes is only unpickled once per
+    process. The runtime and provenance stored after the outputs are not
+    read. The returned object is shared and must not be modified.
+
+    Raises ``FileNotFoundError`` if ``results_file`` does not exist.
+
+    """
+    results_file = os.path.abspath(results_file)
+    try:
+        fstat = os.stat(results_file)
+    except OSError:
+        raise FileNotFoundError(results_file) from None
+    signature = (fstat.st_ino, fstat.st_size, fstat.st_mtime_ns)
+
+    with _OUTPUTS_CACHE_LOCK:
+        cached = _OUTPUTS_CACHE.get(results_file)
+        if cached is not None and cached[0] == signature:
+            _OUTPUTS_CACHE.move_to_end(results_file)
+            return cached[1]
+
+    outputs = load_resultfile(results_file, runtime=False).outputs
+    with _OUTPUTS_CACHE_LOCK:
+        _OUTPUTS_CACHE[results_file] = (signature, outputs)
+        _OUTPUTS_CACHE.move_to_end(results_file)
+        while len(_OUTPUTS_CACHE) > OUTPUTS_CACHE_SIZE:
+            _OUTPUTS_CACHE.popitem(last=False)
+    return outputs
+
+
 def strip_temp(files, wd):
     """Remove temp from a list of file paths"""
     out = []
@@ -1434,16 +1572,76 @@ def walk_files(cwd):
             yield os.path.join(path, f)
 
 
+_KEPT_FILE_PATTERNS = re.compile(
+    "|".join(
+        fnmatch.translate(pattern)
+        for pattern in (
+            "_0x*.json",
+            "provenance.*",
+            "pyscript*.m",
+            "pyjobs*.mat",
+            "command.txt",
+            "result*.pklz",
+            "_inputs.pklz",
+            "_node.pklz",
+            ".proc-*",
+        )
+    )
+)
+"""Files kept at the top of working directories by ``clean_working_directory``"""
+_KEPT_DIRS = ("_nipype", "_report")
+"""Directories kept at the top of working directories by ``clean_working_directory``"""
+
+
+def _scan_removable(cwd, removable, kept_dirs=()):
+    """
+    Collect the files under ``cwd`` for which ``removable`` is true, by directory.
+
+    The tree is scanned once, without following symbolic links to directories
+    (like :func:`walk_files`) nor descending into ``kept_dirs``.
+    """
+    found = defaultdict(list)
+    pending = [cwd]
+    while pending:
+        path = pending.pop()
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    if not entry.is_symlink() and entry.path not in kept_dirs:
+                        pending.append(entry.path)
+                elif removable(entry.path, path == cwd and entry.name):
+                    found[path].append(entry.name)
+    return found
+
+
+def _remove_files(found):
+    """Remove files grouped by directory, relative to a descriptor of each directory"""
+    if os.unlink not in os.supports_dir_fd:
+        for path, names in found.items():
+            for name in names:
+                os.remove(os.path.join(path, name))
+        return
+
+    for path, names in found.items():
+        dir_fd = os.open(path, os.O_RDONLY)
+        try:
+            for name in names:
+                os.unlink(name, dir_fd=dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
 def clean_working_directory(
     outputs, cwd, inputs, needed_outputs, config, files2keep=None, dirs2keep=None
 ):
     """Removes all files not needed for further analysis from the directory"""
     if not outputs:
         return
+    cwd = os.path.normpath(cwd)
     outputs_to_keep = list(outputs.trait_get().keys())
     if needed_outputs and str2bool(config["execution"]["remove_unnecessary_outputs"]):
         outputs_to_keep = needed_outputs
-    # build a list of needed files
+    # build a set of needed files
     output_files = []
     outputdict = outputs.trait_get()
     for output in outputs_to_keep:
@@ -1454,47 +1652,44 @@ def clean_working_directory(
         inputdict = inputs.trait_get()
         input_files.extend(walk_outputs(inputdict))
         needed_files += [path for path, type in input_files if type == "f"]
-    for extra in [
-        "_0x*.json",
-        "provenance.*",
-        "pyscript*.m",
-        "pyjobs*.mat",
-        "command.txt",
-        "result*.pklz",
-        "_inputs.pklz",
-        "_node.pklz",
-        ".proc-*",
-    ]:
-        needed_files.extend(glob(os.path.join(cwd, extra)))
     if files2keep:
         needed_files.extend(ensure_list(files2keep))
     needed_dirs = [path for path, type in output_files if type == "d"]
     if dirs2keep:
         needed_dirs.extend(ensure_list(dirs2keep))
-    for extra in ["_nipype", "_report"]:
-        needed_dirs.extend(glob(os.path.join(cwd, extra)))
-    temp = []
-    for filename in needed_files:
-        temp.extend(get_related_files(filename))
-    needed_files = temp
+    needed_dirs = {os.path.normpath(path) for path in needed_dirs}
+    needed_dirs.update(os.path.join(cwd, extra) for extra in _KEPT_DIRS)
+    needed_files = {
+        related for filename in needed_files for related in get_related_files(filename)
+    }
     logger.debug("Needed files: %s", ";".join(needed_files))
     logger.debug("Needed dirs: %s", ";".join(needed_dirs))
-    files2remove = []
     if str2bool(config["execution"]["remove_unnecessary_outputs"]):
-        for f in walk_files(cwd):
-            if f not in needed_files and not f.startswith(tuple(needed_dirs)):
-                files2remove.append(f)
+        files2remove = _scan_removable(
+            cwd,
+            lambda f, top_name: f not in needed_files
+            and not (top_name and _KEPT_FILE_PATTERNS.match(top_name)),
+            needed_dirs,
+        )
+    elif not str2bool(config["execution"]["keep_inputs"]):
+        input_files = {
+            path for path, type in walk_outputs(inputs.trait_get()) if type == "f"
+        }
+        input_files -= needed_files
+        files2remove = (
+            _scan_removable(cwd, lambda f, _: f in input_files) if input_files else {}
+        )
     else:
-        if not str2bool(config["execution"]["keep_inputs"]):
-            input_files = {
-                path for path, type in walk_outputs(inputs.trait_get()) if type == "f"
-            }
-            files2remove.extend(
-                f for f in walk_files(cwd) if f in input_files and f not in needed_files
-            )
-    logger.debug("Removing files: %s", ";".join(files2remove))
-    for f in files2remove:
-        os.remove(f)
+        files2remove = {}
+    logger.debug(
+        "Removing files: %s",
+        ";".join(
+            os.path.join(path, name)
+            for path, names in files2remove.items()
+            for name in names
+        ),
+    )
+    _remove_files(files2remove)
     for key in outputs.copyable_trait_names():
         if key not in outputs_to_keep:
             setattr(outputs, key, Undefined)
@@ -1613,41 +1808,30 @@ def write_workflow_prov(graph, filename=None, format="all"):
     return ps.g
 
 
-def write_workflow_resources(graph, filename=None, append=None):
-    """
-    Generate a JSON file with profiling traces that can be loaded
-    in a pandas DataFrame or processed with JavaScript like D3.js
-    """
-    import simplejson as json
+RESOURCE_COLUMNS = ("time", "cpus", "rss_GiB", "vms_GiB")
+"""Columns of the samples of the resource monitor in workflow summaries"""
 
-    # Overwrite filename if nipype config is set
-    filename = config.get("monitoring", "summary_file", filename)
 
-    # If filename still does not make sense, store in $PWD
-    if not filename:
-        filename = os.path.join(os.getcwd(), "resource_monitor.json")
+def _load_runtime_samples(runtime):
+    """Read the samples logged by the resource monitor of an interface run"""
+    from ...utils.profiler import load_resource_samples
 
-    if append is None:
-        append = str2bool(config.get("monitoring", "summary_append", "true"))
+    # Results stored before the samples were kept apart embed them
+    if getattr(runtime, "prof_dict", None) is not None:
+        return {key: np.asarray(runtime.prof_dict[key]) for key in RESOURCE_COLUMNS}
 
-    big_dict = {
-        "time": [],
-        "name": [],
-        "interface": [],
-        "rss_GiB": [],
-        "vms_GiB": [],
-        "cpus": [],
-        "mapnode": [],
-        "params": [],
+    # Otherwise, the log must still be reachable from this host
+    samples = load_resource_samples(runtime.resmon)
+    return {
+        "time": np.array(samples["time"]),
+        "cpus": np.array(samples["cpus"]),
+        "rss_GiB": samples["rss_MiB"] / 1024,
+        "vms_GiB": samples["vms_MiB"] / 1024,
     }
 
-    # If file exists, just append new profile information
-    # If we append different runs, then we will see different
-    # "bursts" of timestamps corresponding to those executions.
-    if append and os.path.isfile(filename):
-        with open(filename) as rsf:
-            big_dict = json.load(rsf)
 
+def _iter_workflow_resources(graph):
+    """Yield the node name, interface, parameters, mapnode index and samples of every run"""
     for _, node in enumerate(graph.nodes()):
         nodename = node.fullname
         classname = node.interface.__class__.__name__
@@ -1659,6 +1843,9 @@ def write_workflow_resources(graph, filename=None, append=None):
         try:
             rt_list = node.result.runtime
         except Exception:
+            # Kept by the plugin when the node directory was removed
+            rt_list = getattr(node, "_removed_runtime", None)
+        if rt_list is None:
             logger.warning(
                 "Could not access runtime info for node %s (%s interface)",
                 nodename,
@@ -1671,8 +1858,8 @@ def write_workflow_resources(graph, filename=None, append=None):
 
         for subidx, runtime in enumerate(rt_list):
             try:
-                nsamples = len(runtime.prof_dict["time"])
-            except AttributeError:
+                samples = _load_runtime_samples(runtime)
+            except (AttributeError, OSError):
                 logger.warning(
                     'Could not retrieve profiling information for node "%s" '
                     "(mapflow %d/%d).",
@@ -1681,14 +1868,65 @@ def write_workflow_resources(graph, filename=None, append=None):
                     len(rt_list),
                 )
                 continue
+            yield nodename, classname, params, subidx, samples
+
+
+def write_workflow_resources(graph, filename=None, append=None):
+    """
+    Generate a JSON file with profiling traces that can be loaded
+    in a pandas DataFrame or processed with JavaScript like D3.js
 
-            for key in ["time", "cpus", "rss_GiB", "vms_GiB"]:
-                big_dict[key] += runtime.prof_dict[key]
+    With ``monitoring.summary_format = npz``, the traces are instead stored
+    in a directory, by :func:`write_resource_segment`.
 
-            big_dict["interface"] += [classname] * nsamples
-            big_dict["name"] += [nodename] * nsamples
-            big_dict["mapnode"] += [subidx] * nsamples
-            big_dict["params"] += [params] * nsamples
+    The traces are read from the logs of the resource monitor, listed in the
+    runtimes of the results of the nodes. For the nodes whose directory was
+    removed (with ``execution.remove_node_directories``), the plugin keeps
+    the runtimes and moves the logs next to the removed directories.
+    """
+    import simplejson as json
+
+    # Overwrite filename if nipype config is set
+    filename = config.get("monitoring", "summary_file", filename)
+
+    # If filename still does not make sense, store in $PWD
+    if not filename:
+        filename = os.path.join(os.getcwd(), "resource_monitor.json")
+
+    if append is None:
+        append = str2bool(config.get("monitoring", "summary_append", "true"))
+
+    if config.get("monitoring", "summary_format", "json") == "npz":
+        filename = os.path.splitext(filename)[0]
+        return write_resource_segment(graph, filename, append=append)
+
+    big_dict = {
+        "time": [],
+        "name": [],
+        "interface": [],
+        "rss_GiB": [],
+        "vms_GiB": [],
+        "cpus": [],
+        "mapnode": [],
+        "params": [],
+    }
+
+    # If file exists, just append new profile information
+    # If we append different runs, then we will see different
+    # "bursts" of timestamps corresponding to those executions.
+    if append and os.path.isfile(filename):
+        with open(filename) as rsf:
+            big_dict = json.load(rsf)
+
+    for nodename, classname, params, subidx, samples in _iter_workflow_resources(graph):
+        nsamples = len(samples["time"])
+        for key in RESOURCE_COLUMNS:
+            big_dict[key] += samples[key].tolist()
+
+        big_dict["interface"] += [classname] * nsamples
+        big_dict["name"] += [nodename] * nsamples
+        big_dict["mapnode"] += [subidx] * nsamples
+        big_dict["params"] += [params] * nsamples
 
     with open(filename, "w") as rsf:
         json.dump(big_dict, rsf, ensure_ascii=False)
@@ -1696,6 +1934,124 @@ def write_workflow_resources(graph, filename=None, append=None):
     return filename
 
 
+RESOURCE_INDEX = "index.tsv"
+"""Index of the segments of a columnar workflow resource summary"""
+
+
+def write_resource_segment(graph, dirname, append=True):
+    """
+    Store the profiling traces of a workflow run as a new segment of a summary.
+
+    The summary is a directory of uncompressed ``.npz`` segments, one per
+    run, holding one array per column: the samples (``time``, ``cpus``,
+    ``rss_GiB``, ``vms_GiB``) and, for every sample, the index of its node
+    (``node``) and MapNode iteration (``mapnode``). The names, interfaces
+    and parameterizations of the nodes are stored once per node
+    (``names``, ``interfaces``, ``params``). Segments are listed, in order,
+    by an append-only ``index.tsv`` with one ``<segment> <number of samples>``
+    record per line. Unless ``append`` is true, the segments of previous
+    runs are removed first.
+
+    Returns the path to the new segment.
+    """
+    index_file = os.path.join(dirname, RESOURCE_INDEX)
+    os.makedirs(dirname, exist_ok=True)
+    if not append:
+        for segment in read_resource_index(dirname):
+            try:
+                os.remove(os.path.join(dirname, segment))
+            except FileNotFoundError:
+                pass
+        if os.path.exists(index_file):
+            os.remove(index_file)
+
+    nodes = {}
+    columns = {key: [] for key in RESOURCE_COLUMNS + ("node", "mapnode")}
+    for nodename, classname, params, subidx, samples in _iter_workflow_resources(graph):
+        nodeidx = nodes.setdefault((nodename, classname, params), len(nodes))
+        for key in RESOURCE_COLUMNS:
+            columns[key].append(samples[key])
+        nsamples = len(samples["time"])
+        columns["node"].append(np.full(nsamples, nodeidx, dtype=np.int32))
+        columns["mapnode"].append(np.full(nsamples, subidx, dtype=np.int32))
+
+    arrays = {}
+    dtypes = dict(time="f8", cpus="f4", rss_GiB="f4", vms_GiB="f4")
+    for key, values in columns.items():
+        dtype = dtypes.get(key, "i4")
+        arrays[key] = (
+            np.concatenate(values).astype(dtype) if values else np.zeros(0, dtype)
+        )
+    for i, key in enumerate(("names", "interfaces", "params")):
+        arrays[key] = np.array([node[i] for node in nodes], dtype=str)
+
+    segment = "run-%s-%d.npz" % (utcnow().strftime("%Y%m%dT%H%M%S%f"), os.getpid())
+    np.savez(os.path.join(dirname, segment), **arrays)
+    with open(index_file, "a") as fp:
+        fp.write(f"{segment}\t{len(arrays['time'])}\n")
+    return os.path.join(dirname, segment)
+
+
+def read_resource_index(dirname):
+    """List the segments of a columnar workflow resource summary, in order"""
+    try:
+        with open(os.path.join(dirname, RESOURCE_INDEX)) as fp:
+            records = [line.split("\t") for line in fp.read().splitlines()]
+    except FileNotFoundError:
+        return []
+    return [fields[0] for fields in records if len(fields) == 2]
+
+
+def load_workflow_resources(dirname, columns=None, runs=None):
+    """
+    Load the profiling traces stored by :func:`write_resource_segment`.
+
+    Parameters
+    ----------
+    dirname : pathlike
+        The directory of the summary.
+    columns : list of str
+        The columns to load, among ``time``, ``cpus``, ``rss_GiB``,
+        ``vms_GiB``, ``name``, ``interface``, ``params``, ``mapnode`` and
+        ``run`` (the index of the segment). By default, all of them.
+    runs : list of int
+        The indices of the segments to load (negative indices count from
+        the last run). By default, all of them.
+
+    Returns
+    -------
+    columns : dict
+        One array per column, suitable to build a ``pandas.DataFrame``.
+        Only the members of the segments needed for these columns are read.
+
+    """
+    if columns is None:
+        columns = RESOURCE_COLUMNS + ("name", "interface", "params", "mapnode", "run")
+    node_columns = {"name": "names", "interface": "interfaces", "params": "params"}
+    segments = read_resource_index(dirname)
+    if runs is None:
+        runs = range(len(segments))
+
+    loaded = {key: [] for key in columns}
+    for run in runs:
+        with np.load(os.path.join(dirname, segments[run])) as segment:
+            nodeidx = None
+            for key in columns:
+                if key == "run":
+                    value = np.full(len(segment["mapnode"]), run % len(segments))
+                elif key in node_columns:
+                    if nodeidx is None:
+                        nodeidx = segment["node"]
+                    value = segment[node_columns[key]][nodeidx]
+                else:
+                    value = segment[key]
+                loaded[key].append(value)
+    return {
+        key: np.concatenate(values) if values else np.zeros(0)
+        for key, values in loaded.items()
+    }
+
+
 def topological_sort(graph, depth_first=False):
     """Returns a depth first sorted order if depth_first is True"""
     import networkx as nx
@@ -4,9 +4,13 @@
 import sys
 from copy import deepcopy
 from glob import glob
+from heapq import heappop, heappush
 import os
 import shutil
-from time import sleep, time
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import mkdtemp
+from threading import Event
+from time import time
 from traceback import format_exception
 
 import numpy as np
@@ -15,23 +19,23 @@ from ... import logging
 from ...utils.misc import str2bool
 from ..engine.utils import topological_sort, load_resultfile
 from ..engine import MapNode
-from .tools import report_crash, report_nodes_not_run, create_pyscript
+from .pilot import TaskQueue
+from .tools import (
+    CompletionMarkers,
+    JobStatusCache,
+    completion_marker,
+    create_pyscript,
+    create_runner,
+    get_batch_dir,
+    pickle_node,
+    read_completion_marker,
+    report_crash,
+    report_nodes_not_run,
+)
 
 logger = logging.getLogger("nipype.workflow")
 
 
-def _graph_to_lil_matrix(graph, nodelist):
-    """Provide a sparse linked list matrix across various NetworkX versions"""
-    import scipy.sparse as ssp
-
-    try:
-        from networkx import to_scipy_sparse_array
-    except ImportError:  # NetworkX < 2.7
-        from networkx import to_scipy_sparse_matrix as to_scipy_sparse_array
-
-    return ssp.lil_matrix(to_scipy_sparse_array(graph, nodelist=nodelist, format="lil"))
-
-
 class PluginBase:
     """Base class for plugins."""
 
@@ -85,18 +89,48 @@ class DistributedPluginBase(PluginBase):
     ----------
     procs : :obj:`list`
         list (N) of underlying interface elements to be processed
+    jobids : :obj:`dict`
+        mapping of each element of ``procs`` to its job id (its index in
+        ``procs``), including expanded MapNode subnodes
     proc_done : :obj:`numpy.ndarray`
         a boolean numpy array (N,) signifying whether a process has been
         submitted for execution
     proc_pending : :obj:`numpy.ndarray`
         a boolean numpy array (N,) signifying whether a
         process is currently running.
-    depidx : :obj:`numpy.matrix`
-        a boolean matrix (NxN) storing the dependency structure across
-        processes. Process dependencies are derived from each column.
+    dependents : :obj:`list`
+        list (N) of lists with the ids of the processes waiting on each
+        process. Entries are cleared once the process has finished.
+    upstream : :obj:`list`
+        list (N) of lists with the ids of the processes whose outputs are
+        read by each process. Entries are cleared once the process has
+        finished.
+    indegree : :obj:`numpy.ndarray`
+        an integer array (N,) counting the unfinished dependencies of
+        each process.
+    refcount : :obj:`numpy.ndarray`
+        an integer array (N,) counting the unfinished processes that still
+        need the outputs of each process (``-1`` once its working
+        directory has been removed).
+    ready : :obj:`set`
+        ids of the jobs whose dependencies have all been run. It is
+        maintained incrementally as jobs finish, so that the scheduler
+        never needs to scan the whole graph.
+
+    Plugins that are notified when a task finishes (e.g., through a
+    callback) should call :meth:`_notify_task_done`, which wakes up the
+    scheduler immediately instead of waiting for the next poll.
+
+    Nodes are deep-copied before :meth:`_submit_job`, unless the plugin
+    sets :attr:`_submit_graph_nodes`, promising to serialize them without
+    modifying them.
 
     """
 
+    # Whether _submit_job is given the nodes of the execution graph rather
+    # than copies of them
+    _submit_graph_nodes = False
+
     def __init__(self, plugin_args=None):
         """
         Initialize runtime attributes to none
@@ -104,14 +138,20 @@ class DistributedPluginBase(PluginBase):
         """
         super().__init__(plugin_args=plugin_args)
         self.procs = None
-        self.depidx = None
-        self.refidx = None
+        self.jobids = None
+        self.dependents = None
+        self.upstream = None
+        self.refcount = None
+        self._removable = []
         self.mapnodes = None
         self.mapnodesubids = None
         self.proc_done = None
         self.proc_pending = None
+        self.ready = None
+        self.indegree = None
         self.pending_tasks = []
         self.max_jobs = self.plugin_args.get("max_jobs", np.inf)
+        self._wakeup = Event()
 
     def _prerun_check(self, graph):
         """Stub method to validate/massage graph and nodes before running"""
@@ -130,7 +170,7 @@ class DistributedPluginBase(PluginBase):
         self._prerun_check(graph)
         # Generate appropriate structures for worker-manager model
         self._generate_dependency_list(graph)
-        self.mapnodes = []
+        self.mapnodes = set()
         self.mapnodesubids = {}
         # setup polling - TODO: change to threaded model
         notrun = []
@@ -140,9 +180,10 @@ class DistributedPluginBase(PluginBase):
         old_presub_stats = None
         while not np.all(self.proc_done) or np.any(self.proc_pending):
             loop_start = time()
+            # Any completion signalled from now on will wake the next wait up
+            self._wakeup.clear()
             # Check if a job is available (jobs with all dependencies run)
-            # https://github.com/nipy/nipype/pull/2200#discussion_r141605722
-            jobs_ready = np.nonzero(~self.proc_done & (self.depidx.sum(0) == 0))[1]
+            jobs_ready = self._get_ready_jobs()
 
             progress_stats = (
                 len(self.proc_done),
@@ -199,8 +240,12 @@ class DistributedPluginBase(PluginBase):
             elif display_stats:
                 logger.debug("Not submitting (max jobs reached)")
 
+            if np.all(self.proc_done) and not np.any(self.proc_pending):
+                break
+
+            # Wait until a task finishes, polling at most every poll_sleep_secs
             sleep_til = loop_start + poll_sleep_secs
-            sleep(max(0, sleep_til - time()))
+            self._wakeup.wait(max(0, sleep_til - time()))
 
         self._remove_node_dirs()
         report_nodes_not_run(notrun)
@@ -225,7 +270,25 @@ class DistributedPluginBase(PluginBase):
     def _get_result(self, taskid):
         raise NotImplementedError
 
+    def _notify_task_done(self):
+        """Wake up the scheduler loop, e.g., when a worker finished a task"""
+        self._wakeup.set()
+
+    def _get_ready_jobs(self):
+        """Return the sorted ids of the jobs that can be submitted"""
+        self.ready.difference_update([jid for jid in self.ready if self.proc_done[jid]])
+        return np.array(sorted(self.ready), dtype=int)
+
     def _submit_job(self, node, updatehash=False):
+        """
+        Submit ``node`` and return a task id.
+
+        ``node`` is a copy of the node of the execution graph, or the node
+        itself with :attr:`_submit_graph_nodes`: it must then be serialized
+        before being shipped (e.g., with
+        :class:`~nipype.pipeline.plugins.tools.JobDescriptor`), and must
+        not be modified.
+        """
         raise NotImplementedError
 
     def _report_crash(self, node, result=None):
@@ -265,26 +328,26 @@ class DistributedPluginBase(PluginBase):
         return self._remove_node_deps(jobid, crashfile, graph)
 
     def _submit_mapnode(self, jobid):
-        import scipy.sparse as ssp
-
         if jobid in self.mapnodes:
             return True
-        self.mapnodes.append(jobid)
+        self.mapnodes.add(jobid)
         mapnodesubids = self.procs[jobid].get_subnodes()
         numnodes = len(mapnodesubids)
         logger.debug("Adding %d jobs for mapnode %s", numnodes, self.procs[jobid])
-        for i in range(numnodes):
-            self.mapnodesubids[self.depidx.shape[0] + i] = jobid
+        first = len(self.procs)
+        subids = range(first, first + numnodes)
+        for i, subnode in zip(subids, mapnodesubids):
+            self.mapnodesubids[i] = jobid
+            self.jobids[subnode] = i
         self.procs.extend(mapnodesubids)
-        self.depidx = ssp.vstack(
-            (self.depidx, ssp.lil_matrix(np.zeros((numnodes, self.depidx.shape[1])))),
-            "lil",
-        )
-        self.depidx = ssp.hstack(
-            (self.depidx, ssp.lil_matrix(np.zeros((self.depidx.shape[0], numnodes)))),
-            "lil",
-        )
-        self.depidx[-numnodes:, jobid] = 1
+        # The parent mapnode now waits on its subnodes, which are all ready
+        self.dependents.extend([jobid] for _ in subids)
+        self.upstream.extend([] for _ in subids)
+        self.indegree = np.concatenate((self.indegree, np.zeros(numnodes, dtype=int)))
+        self.indegree[jobid] += numnodes
+        self.refcount = np.concatenate((self.refcount, np.zeros(numnodes, dtype=int)))
+        self.ready.discard(jobid)
+        self.ready.update(subids)
         self.proc_done = np.concatenate(
             (self.proc_done, np.zeros(numnodes, dtype=bool))
         )
@@ -309,8 +372,7 @@ class DistributedPluginBase(PluginBase):
                 break
 
             # Check if a job is available (jobs with all dependencies run)
-            # https://github.com/nipy/nipype/pull/2200#discussion_r141605722
-            jobids = np.nonzero(~self.proc_done & (self.depidx.sum(0) == 0))[1]
+            jobids = self._get_ready_jobs()
 
             if len(jobids) > 0:
                 # send all available jobs
@@ -353,9 +415,10 @@ class DistributedPluginBase(PluginBase):
                             self._task_finished_cb(jobid)
                             self._remove_node_dirs()
                         else:
-                            tid = self._submit_job(
-                                deepcopy(self.procs[jobid]), updatehash=updatehash
-                            )
+                            node = self.procs[jobid]
+                            if not self._submit_graph_nodes:
+                                node = deepcopy(node)
+                            tid = self._submit_job(node, updatehash=updatehash)
                             if tid is None:
                                 self.proc_done[jobid] = False
                                 self.proc_pending[jobid] = False
@@ -435,16 +498,42 @@ class DistributedPluginBase(PluginBase):
         # Update job and worker queues
         self.proc_pending[jobid] = False
         # update the job dependency structure
-        rowview = self.depidx.getrowview(jobid)
-        rowview[rowview.nonzero()] = 0
+        dependents, self.dependents[jobid] = self.dependents[jobid], []
+        unlocked = []
+        for depid in dependents:
+            self.indegree[depid] -= 1
+            if self.indegree[depid] == 0:
+                unlocked.append(depid)
+        if unlocked:
+            self.ready.update(unlocked)
+            # Let the scheduler submit the newly available jobs right away
+            self._notify_task_done()
         if jobid not in self.mapnodesubids:
-            self.refidx[self.refidx[:, jobid].nonzero()[0], jobid] = 0
+            upstream, self.upstream[jobid] = self.upstream[jobid], []
+            for srcid in upstream:
+                self.refcount[srcid] -= 1
+                if self.refcount[srcid] == 0:
+                    heappush(self._removable, srcid)
+            if self.refcount[jobid] == 0:
+                # Nothing depends on the outputs of the job
+                heappush(self._removable, jobid)
 
     def _generate_dependency_list(self, graph):
         """Generates a dependency list for a list of graphs."""
         self.procs, _ = topological_sort(graph)
-        self.depidx = _graph_to_lil_matrix(graph, nodelist=self.procs)
-        self.refidx = self.depidx.astype(int)
+        self.jobids = {node: idx for idx, node in enumerate(self.procs)}
+        self.dependents = [
+            [self.jobids[succ] for succ in graph.successors(node)]
+            for node in self.procs
+        ]
+        self.upstream = [
+            [self.jobids[pred] for pred in graph.predecessors(node)]
+            for node in self.procs
+        ]
+        self.indegree = np.array([len(preds) for preds in self.upstream], dtype=int)
+        self.refcount = np.array([len(succs) for succs in self.dependents], dtype=int)
+        self.ready = set(np.flatnonzero(self.indegree == 0).tolist())
+        self._removable = []
         self.proc_done = np.zeros(len(self.procs), dtype=bool)
         self.proc_pending = np.zeros(len(self.procs), dtype=bool)
 
@@ -457,7 +546,7 @@ class DistributedPluginBase(PluginBase):
             dfs_preorder = nx.dfs_preorder_nodes
         subnodes = list(dfs_preorder(graph, self.procs[jobid]))
         for node in subnodes:
-            idx = self.procs.index(node)
+            idx = self.jobids[node]
             self.proc_done[idx] = True
             self.proc_pending[idx] = False
         return dict(node=self.procs[jobid], dependents=subnodes, crashfile=crashfile)
@@ -465,25 +554,91 @@ class DistributedPluginBase(PluginBase):
     def _remove_node_dirs(self):
         """Removes directories whose outputs have already been used up"""
         if str2bool(self._config["execution"]["remove_node_directories"]):
-            indices = np.nonzero((self.refidx.sum(axis=1) == 0).__array__())[0]
-            for idx in indices:
-                if idx in self.mapnodesubids:
+            deferred = []
+            while self._removable:
+                idx = heappop(self._removable)
+                if idx in self.mapnodesubids or self.refcount[idx] != 0:
                     continue
-                if self.proc_done[idx] and (not self.proc_pending[idx]):
-                    self.refidx[idx, idx] = -1
-                    outdir = self.procs[idx].output_dir()
-                    logger.info(
-                        (
-                            "[node dependencies finished] "
-                            "removing node: %s from directory %s"
-                        )
-                        % (self.procs[idx]._id, outdir)
+                if not self.proc_done[idx] or self.proc_pending[idx]:
+                    deferred.append(idx)
+                    continue
+                self.refcount[idx] = -1
+                outdir = self.procs[idx].output_dir()
+                if str2bool(self._config["monitoring"]["enabled"]):
+                    self._keep_resource_logs(idx, outdir)
+                logger.info(
+                    (
+                        "[node dependencies finished] "
+                        "removing node: %s from directory %s"
                     )
-                    shutil.rmtree(outdir)
+                    % (self.procs[idx]._id, outdir)
+                )
+                shutil.rmtree(outdir)
+            for idx in deferred:
+                heappush(self._removable, idx)
+
+    def _keep_resource_logs(self, idx, outdir):
+        """Move the resource logs of a node out of the directory to remove"""
+        try:
+            runtime = self.procs[idx].result.runtime
+        except Exception:
+            runtime = None
+        runtimes = runtime if isinstance(runtime, list) else [runtime]
+        for subidx, subruntime in enumerate(runtimes):
+            resmon = getattr(subruntime, "resmon", None)
+            if not resmon or not os.path.isfile(resmon):
+                continue
+            if os.path.commonpath([outdir, resmon]) != outdir:
+                continue
+            sidecar = "%s.%d.resmon" % (outdir, subidx)
+            os.replace(resmon, sidecar)
+            subruntime.resmon = sidecar
+        # The summary of the workflow reads it instead of the results
+        self.procs[idx]._removed_runtime = runtime
 
 
 class SGELikeBatchManagerBase(DistributedPluginBase):
-    """Execute workflow with SGE/OGE/PBS like batch system"""
+    """Execute workflow with SGE/OGE/PBS like batch system
+
+    With the ``array_jobs`` plugin argument, the jobs that are ready at once
+    and request the same resources (the same ``plugin_args``) are submitted
+    together as a single array job.  A file next to the batch script lists
+    the python script of every task of the array, which is run by the task
+    of the matching index.  Batch systems supporting array jobs set
+    :attr:`_array_index_var` and accept an ``array_size`` in
+    :meth:`_submit_batchtask`.
+
+    The status of all the jobs submitted is queried at once, at most every
+    ``status_refresh`` seconds (plugin argument, 5 by default), by
+    :meth:`_query_status` (see :class:`~.tools.JobStatusCache`).
+
+    Jobs write a completion marker with the path to the results of their
+    node (see :func:`~.tools.mark_completed`), and the markers of all the
+    jobs are listed at once, at most every second (see
+    :class:`~.tools.CompletionMarkers`).  The results of a job are collected
+    as soon as its marker is written, and finished jobs without marker are
+    failed after ``job_finished_timeout`` seconds.
+
+    With the ``pilots`` plugin argument, nodes are not submitted as batch
+    jobs but put in a :class:`~.pilot.TaskQueue`, next to the batch scripts
+    of the workflow, and up to ``pilots`` long-lived batch jobs run them
+    (see :mod:`~.pilot`).  Pilots run up to ``pilot_slots`` threads of nodes
+    at once (1 by default), and are submitted with the ``pilot_plugin_args``
+    (e.g., ``{"sbatch_args": "-c 4"}``) as the ``plugin_args`` of their
+    node.  They signal they are alive every ``pilot_heartbeat`` seconds (30
+    by default), and exit after ``pilot_idle_timeout`` seconds without
+    tasks (300 by default).  The tasks of pilots lost for four heartbeats
+    are queued again, and pilots are submitted again as long as tasks
+    remain.
+    """
+
+    # Environment variable holding the (1-based) index of a task in an array
+    # job, if the batch system supports array jobs
+    _array_index_var = None
+    # States of finished jobs, as returned by _query_status
+    _finished_states = ()
+    # Nodes are pickled or written in scripts when submitted
+    _submit_graph_nodes = True
 
     def __init__(self, template, plugin_args=None):
         super().__init__(plugin_args=plugin_args)
@@ -498,40 +653,85 @@ class SGELikeBatchManagerBase(DistributedPluginBase):
             if "qsub_args" in plugin_args:
                 self._qsub_args = plugin_args["qsub_args"]
         self._pending = {}
+        self._array_jobs = str2bool(self.plugin_args.get("array_jobs", False))
+        if self._array_jobs and self._array_index_var is None:
+            logger.warning(
+                "Array jobs are not supported by %s, submitting jobs one by one.",
+                self.__class__.__name__,
+            )
+            self._array_jobs = False
+        self._arrays = {}
+        self._array_tasks = {}
+        self._array_count = 0
+        self._status = JobStatusCache(
+            self._query_status,
+            refresh=self.plugin_args.get("status_refresh", 5),
+            finished=self._finished_states,
+        )
+        self._completions = CompletionMarkers(
+            refresh=min(1, float(self.plugin_args.get("status_refresh", 5)))
+        )
+        self._markers = {}
+        self._unmarked = {}
+        self._pilots = int(self.plugin_args.get("pilots", 0))
+        self._pilot_queue = None
+        self._pilot_jobs = set()
+        self._pilot_heartbeat = float(self.plugin_args.get("pilot_heartbeat", 30))
 
     def _is_pending(self, taskid):
         """Check if a task is pending in the batch system"""
+        return self._status.is_pending(taskid)
+
+    def _query_status(self, jobids):
+        """Return the states of jobs in the batch system, keyed by job id"""
         raise NotImplementedError
 
     def _submit_batchtask(self, scriptfile, node):
         """Submit a task to the batch system"""
         raise NotImplementedError
 
+    def _array_task_id(self, jobid, index):
+        """Return the id of a task of an array job in the batch system
+
+        By default, tasks are pending until the whole array job is finished.
+        """
+        return jobid
+
+    def _batch_taskid(self, taskid):
+        """Return the id of a task in the batch system"""
+        if taskid not in self._array_tasks:
+            return taskid
+        jobid, index = self._array_tasks[taskid]
+        if index is None:
+            return jobid
+        return self._array_task_id(jobid, index)
+
     def _get_result(self, taskid):
         if taskid not in self._pending:
-            raise Exception("Task %d not found" % taskid)
-        if self._is_pending(taskid):
-            return None
+            raise Exception("Task %s not found" % taskid)
         node_dir = self._pending[taskid]
-        # MIT HACK
-        # on the pbs system at mit the parent node directory needs to be
-        # accessed before internal directories become available. there
-        # is a disconnect when the queueing engine knows a job is
-        # finished to when the directories become statable.
-        t = time()
-        timeout = float(self._config["execution"]["job_finished_timeout"])
-        timed_out = True
-        while (time() - t) < timeout:
-            try:
-                glob(os.path.join(node_dir, "result_*.pklz")).pop()
-                timed_out = False
-                break
-            except Exception as e:
-                logger.debug(e)
-            sleep(2)
-        if timed_out:
+        results_file = self._completions.results_file(self._markers[taskid])
+        if results_file is None:
+            if self._pilot_queue is not None:
+                if not self._pilot_queue.is_done(taskid):
+                    return None
+            elif self._is_pending(self._batch_taskid(taskid)):
+                return None
+            # MIT HACK
+            # on the pbs system at mit the parent node directory needs to be
+            # accessed before internal directories become available. there
+            # is a disconnect when the queueing engine knows a job is
+            # finished to when the directories become statable.
+            timeout = float(self._config["execution"]["job_finished_timeout"])
+            finished = self._unmarked.setdefault(taskid, time())
+            if time() - finished < timeout:
+                return None
+            # Jobs of former versions, or killed before writing their marker
+            results_file = next(
+                iter(glob(os.path.join(node_dir, "result_*.pklz"))), None
+            )
+        if results_file is None:
             result_data = {"hostname": "unknown", "result": None, "traceback": None}
-            results_file = None
             try:
                 error_message = (
                     "Job id ({}) finished or terminated, but "
@@ -544,14 +744,13 @@ class SGELikeBatchManagerBase(DistributedPluginBase):
             except OSError as e:
                 result_data["traceback"] = "\n".join(format_exception(*sys.exc_info()))
         else:
-            results_file = glob(os.path.join(node_dir, "result_*.pklz"))[0]
             result_data = load_resultfile(results_file)
         result_out = dict(result=None, traceback=None)
         if isinstance(result_data, dict):
             result_out["result"] = result_data["result"]
             result_out["traceback"] = result_data["traceback"]
             result_out["hostname"] = result_data["hostname"]
-            if results_file:
+            if results_file and os.path.dirname(results_file) == node_dir:
                 crash_file = os.path.join(node_dir, "crashstore.pklz")
                 os.rename(results_file, crash_file)
         else:
@@ -560,46 +759,208 @@ class SGELikeBatchManagerBase(DistributedPluginBase):
 
     def _submit_job(self, node, updatehash=False):
         """submit job and return taskid"""
+        if self._pilot_queue is not None:
+            pklfile, _ = pickle_node(node, updatehash=updatehash)
+            taskid = self._pilot_queue.put(pklfile, node.n_procs)
+            self._pending[taskid] = node.output_dir()
+            self._track_marker(taskid, pklfile)
+            return taskid
+
         pyscript = create_pyscript(node, updatehash=updatehash)
+        if not self._array_jobs:
+            taskid = self._submit_batchtask(self._write_batchscript(pyscript), node)
+            self._status.add(taskid)
+            self._track_marker(taskid, pyscript)
+            return taskid
+
+        # Postponed until all the jobs ready are known (see _submit_arrays)
+        self._array_count += 1
+        taskid = "array_task_%d" % self._array_count
+        self._pending[taskid] = node.output_dir()
+        self._track_marker(taskid, pyscript)
+        request = repr(sorted(node.plugin_args.items()))
+        self._arrays.setdefault(request, []).append((taskid, pyscript, node))
+        return taskid
+
+    def _track_marker(self, taskid, path):
+        """Track the completion marker of the node of a task"""
+        self._markers[taskid] = completion_marker(path)
+        self._completions.add(self._markers[taskid])
+
+    def _write_batchscript(self, pyscript, command=None):
+        """Write the batch script running ``pyscript``, or ``command``"""
         batch_dir, name = os.path.split(pyscript)
         name = ".".join(name.split(".")[:-1])
-        batchscript = "\n".join(
-            (self._template.rstrip("\n"), f"{sys.executable} {pyscript}")
-        )
+        if command is None:
+            command = f"{sys.executable} {pyscript}"
+        batchscript = "\n".join((self._template.rstrip("\n"), command))
         batchscriptfile = os.path.join(batch_dir, "batchscript_%s.sh" % name)
         with open(batchscriptfile, "w") as fp:
             fp.writelines(batchscript)
-        return self._submit_batchtask(batchscriptfile, node)
+        return batchscriptfile
+
+    def _prerun_check(self, graph):
+        if self._pilots:
+            batch_dir = get_batch_dir(next(iter(graph.nodes())))
+            os.makedirs(batch_dir, exist_ok=True)
+            self._pilot_queue = TaskQueue(mkdtemp(prefix="pilots_", dir=batch_dir))
+            command = (
+                "{} -m nipype.pipeline.plugins.pilot {} --slots {:d} "
+                "--heartbeat {:g} --idle-timeout {:g}".format(
+                    sys.executable,
+                    self._pilot_queue.path,
+                    int(self.plugin_args.get("pilot_slots", 1)),
+                    self._pilot_heartbeat,
+                    float(self.plugin_args.get("pilot_idle_timeout", 300)),
+                )
+            )
+            self._pilot_script = self._write_batchscript(
+                os.path.join(self._pilot_queue.path, "pilot.sh"), command
+            )
+
+    def _postrun_check(self):
+        if self._pilot_queue is not None:
+            self._pilot_queue.stop()
+
+    def _send_procs_to_workers(self, updatehash=False, graph=None):
+        super()._send_procs_to_workers(updatehash=updatehash, graph=graph)
+        self._submit_arrays()
+        if self._pilot_queue is not None:
+            self._submit_pilots()
+
+    def _submit_pilots(self):
+        """Submit pilots while tasks are queued, and replace lost ones"""
+        requeued = self._pilot_queue.requeue_lost(4 * self._pilot_heartbeat)
+        if requeued:
+            logger.warning("Queued %d tasks of lost pilots again.", requeued)
+        self._pilot_jobs = {
+            jobid for jobid in self._pilot_jobs if self._is_pending(jobid)
+        }
+        if not self._pilot_queue.has_tasks():
+            return
+        for _ in range(self._pilots - len(self._pilot_jobs)):
+            pilot = _PilotJob(
+                self._pilot_queue.path, self.plugin_args.get("pilot_plugin_args", {})
+            )
+            jobid = self._submit_batchtask(self._pilot_script, pilot)
+            # The results of pilots are not collected
+            self._pending.pop(jobid, None)
+            self._status.add(jobid)
+            self._pilot_jobs.add(jobid)
+            logger.info("Submitted pilot job %s.", jobid)
+
+    def _submit_arrays(self):
+        """Submit the postponed jobs, as one array job per resource request"""
+        arrays, self._arrays = self._arrays, {}
+        for tasks in arrays.values():
+            taskids, pyscripts, nodes = zip(*tasks)
+            if len(tasks) == 1:
+                batchscript = self._write_batchscript(pyscripts[0])
+                jobid = self._submit_batchtask(batchscript, nodes[0])
+                indices = [None]
+            else:
+                batch_dir, name = os.path.split(pyscripts[0])
+                indexfile = os.path.join(
+                    batch_dir, "array_%s.txt" % os.path.splitext(name)[0]
+                )
+                with open(indexfile, "w") as fp:
+                    fp.writelines("%s\n" % pyscript for pyscript in pyscripts)
+                command = '{} "$(sed -n "${{{}}}p" "{}")"'.format(
+                    sys.executable, self._array_index_var, indexfile
+                )
+                batchscript = self._write_batchscript(indexfile, command)
+                jobid = self._submit_batchtask(
+                    batchscript, nodes[0], array_size=len(tasks)
+                )
+                indices = range(1, len(tasks) + 1)
+                logger.info("Submitted %d jobs as array job %s", len(tasks), jobid)
+            # Results are collected per task, not per job of the batch system
+            self._pending.pop(jobid, None)
+            for taskid, index in zip(taskids, indices):
+                self._array_tasks[taskid] = (jobid, index)
+                self._status.add(self._batch_taskid(taskid))
 
     def _clear_task(self, taskid):
         del self._pending[taskid]
+        self._status.discard(self._batch_taskid(taskid))
+        self._array_tasks.pop(taskid, None)
+        self._completions.discard(self._markers.pop(taskid))
+        self._unmarked.pop(taskid, None)
+
+
+class _PilotJob:
+    """Stands for a node when submitting pilot jobs"""
+
+    _hierarchy = None
+    _id = "pilot"
+
+    def __init__(self, queue_dir, plugin_args):
+        self._queue_dir = queue_dir
+        self.plugin_args = plugin_args
+
+    def output_dir(self):
+        return self._queue_dir
 
 
 class GraphPluginBase(PluginBase):
-    """Base class for plugins that distribute graphs to workflows"""
+    """Base class for plugins that distribute graphs to workflows
+
+    The files running the nodes are written by ``script_threads`` threads
+    (plugin argument, 1 by default) before the graph is submitted.  With the
+    ``shared_runner`` plugin argument, only the nodes are pickled, and a
+    single ``runner.py`` script runs the pickle given as its argument (see
+    :func:`~.tools.create_runner`).
+    """
 
     def __init__(self, plugin_args=None):
         if plugin_args and plugin_args.get("status_callback"):
             logger.warning("status_callback not supported for Graph submission plugins")
         super().__init__(plugin_args=plugin_args)
+        self._script_threads = int(self.plugin_args.get("script_threads", 1))
+        self._shared_runner = str2bool(self.plugin_args.get("shared_runner", False))
+        self._pending = {}
+        self._markers = {}
 
     def run(self, graph, config, updatehash=False):
         import networkx as nx
 
-        pyfiles = []
-        dependencies = {}
         self._config = config
         nodes = list(nx.topological_sort(graph))
+        jobids = {node: idx for idx, node in enumerate(nodes)}
+        dependencies = {
+            idx: [jobids[prevnode] for prevnode in graph.predecessors(node)]
+            for idx, node in enumerate(nodes)
+        }
         logger.debug("Creating executable python files for each node")
-        for idx, node in enumerate(nodes):
-            pyfiles.append(
-                create_pyscript(node, updatehash=updatehash, store_exception=False)
-            )
-            dependencies[idx] = [
-                nodes.index(prevnode) for prevnode in list(graph.predecessors(node))
-            ]
+        if self._shared_runner:
+
+            def write_script(node):
+                return pickle_node(node, updatehash=updatehash)[0]
+
+        else:
+
+            def write_script(node):
+                return create_pyscript(
+                    node, updatehash=updatehash, store_exception=False
+                )
+
+        with ThreadPoolExecutor(max_workers=max(1, self._script_threads)) as pool:
+            pyfiles = list(pool.map(write_script, nodes))
+        if self._shared_runner:
+            for batch_dir in {os.path.dirname(pklfile) for pklfile in pyfiles}:
+                create_runner(batch_dir, store_exception=False)
+        # Successful jobs write their marker, keyed by node index (see _get_result)
+        self._markers = {
+            idx: completion_marker(pyfile) for idx, pyfile in enumerate(pyfiles)
+        }
         self._submit_graph(pyfiles, dependencies, nodes)
 
+    def _node_args(self, pyfile):
+        """Return the arguments of the python interpreter running a node"""
+        if self._shared_runner:
+            return [os.path.join(os.path.dirname(pyfile), "runner.py"), pyfile]
+        return [pyfile]
+
     def _get_args(self, node, keywords):
         values = ()
         for keyword in keywords:
@@ -627,7 +988,8 @@ class GraphPluginBase(PluginBase):
 
     def _submit_graph(self, pyfiles, dependencies, nodes):
         """
-        pyfiles: list of files corresponding to a topological sort
+        pyfiles: list of files corresponding to a topological sort, run with
+                 the arguments of :meth:`_node_args`
         dependencies: dictionary of dependencies based on the topological sort
         """
         raise NotImplementedError
@@ -639,9 +1001,12 @@ class GraphPluginBase(PluginBase):
             return None
         node_dir = self._pending[taskid]
 
-        glob(os.path.join(node_dir, "result_*.pklz")).pop()
-
-        results_file = glob(os.path.join(node_dir, "result_*.pklz"))[0]
+        results_file = None
+        if taskid in self._markers:
+            results_file = read_completion_marker(self._markers[taskid])
+        if results_file is None:
+            # Jobs of former versions, or failed, do not write markers
+            results_file = glob(os.path.join(node_dir, "result_*.pklz"))[0]
         result_data = load_resultfile(results_file)
         result_out = dict(result=None, traceback=None)
 
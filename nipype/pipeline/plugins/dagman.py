@@ -36,6 +36,9 @@ class CondorDAGManPlugin(GraphPluginBase):
                     condor_submit_dag call
     - block : if True the plugin call will block until Condor has finished
                  processing the entire workflow (default: False)
+    - script_threads : number of threads writing the scripts of the nodes
+    - shared_runner : run every node with a single script, taking the pickle
+                 of the node as argument
     """
 
     default_submit_template = """
@@ -141,7 +144,7 @@ getenv = True
                     # TODO make parameter for this,
                     initial_specs=initial_specs,
                     executable=sys.executable,
-                    nodescript=pyscript,
+                    nodescript=" ".join(self._node_args(pyscript)),
                     basename=os.path.join(batch_dir, name),
                     override_specs=override_specs,
                 )
@@ -150,7 +153,7 @@ getenv = True
                     specs["nodescript"] = "{} {} {}".format(
                         wrapper_args % specs,  # give access to variables
                         sys.executable,
-                        pyscript,
+                        " ".join(self._node_args(pyscript)),
                     )
                 submitspec = template % specs
                 # write submit spec for this job
@@ -45,6 +45,9 @@ def execute_task(pckld_task, node_config, updatehash):
 class IPythonPlugin(DistributedPluginBase):
     """Execute workflow with ipython"""
 
+    # Nodes are pickled when submitted
+    _submit_graph_nodes = True
+
     def __init__(self, plugin_args=None):
         if IPython_not_loaded:
             raise ImportError("Please install ipyparallel to use this plugin.")
@@ -242,6 +242,7 @@ class LegacyMultiProcPlugin(DistributedPluginBase):
         # Make sure runtime is not left at a dubious working directory
         os.chdir(self._cwd)
         self._taskresult[args["taskid"]] = args
+        self._notify_task_done()
 
     def _get_result(self, taskid):
         return self._taskresult.get(taskid)
@@ -314,9 +315,7 @@ class LegacyMultiProcPlugin(DistributedPluginBase):
         # Check to see if a job is available (jobs with all dependencies run)
         # See https://github.com/nipy/nipype/pull/2200#discussion_r141605722
         # See also https://github.com/nipy/nipype/issues/2372
-        jobids = np.flatnonzero(
-            ~self.proc_done & (self.depidx.sum(axis=0) == 0).__array__()
-        )
+        jobids = self._get_ready_jobs()
 
         # Check available resources by summing all threads and memory used
         free_memory_gb, free_processors = self._check_resources(self.pending_tasks)
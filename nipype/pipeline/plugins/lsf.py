@@ -21,9 +21,13 @@ class LSFPlugin(SGELikeBatchManagerBase):
     - template : template to use for batch job submission
     - bsub_args : arguments to be prepended to the job execution script in the
                   bsub call
+    - status_refresh : minimum interval (s) between two queries of the status
+                       of jobs, with a single ``bjobs`` call (default 5)
 
     """
 
+    _finished_states = ("DONE", "EXIT")
+
     def __init__(self, **kwargs):
         template = """
 #$ -S /bin/sh
@@ -40,23 +44,38 @@ class LSFPlugin(SGELikeBatchManagerBase):
                 self._bsub_args = kwargs["plugin_args"]["bsub_args"]
         super().__init__(template, **kwargs)
 
-    def _is_pending(self, taskid):
+    def _query_status(self, jobids):
         """LSF lists a status of 'PEND' when a job has been submitted but is
         waiting to be picked up, and 'RUN' when it is actively being processed.
         But _is_pending should return True until a job has finished and is
-        ready to be checked for completeness. So return True if status is
-        either 'PEND' or 'RUN'"""
+        ready to be checked for completeness, i.e. until its status is either
+        'DONE' or 'EXIT'"""
         cmd = CommandLine("bjobs", resource_monitor=False, terminal_output="allatonce")
-        cmd.inputs.args = "%d" % taskid
-        # check lsf task
+        cmd.inputs.args = "-a -w %s" % " ".join(jobids)
+        # check lsf tasks
         oldlevel = iflogger.level
         iflogger.setLevel(logging.getLevelName("CRITICAL"))
         result = cmd.run(ignore_exception=True)
         iflogger.setLevel(oldlevel)
-        # logger.debug(result.runtime.stdout)
-        return (
-            "DONE" not in result.runtime.stdout and "EXIT" not in result.runtime.stdout
+        # JOBID USER STAT QUEUE ...
+        states = {}
+        for line in (getattr(result.runtime, "stdout", None) or "").splitlines():
+            fields = line.split()
+            if len(fields) >= 3 and fields[0].isdigit():
+                states[fields[0]] = fields[2]
+        # bjobs exits with an error when any of the jobs has been purged, and
+        # jobs that are not listed anymore are finished
+        notfound = re.findall(
+            r"Job <(\d+)> is not found",
+            "\n".join(
+                getattr(result.runtime, stream, None) or ""
+                for stream in ("stdout", "stderr")
+            ),
         )
+        if not states and not notfound:
+            # bjobs failed, check again later
+            return None
+        return states
 
     def _submit_batchtask(self, scriptfile, node):
         cmd = CommandLine(
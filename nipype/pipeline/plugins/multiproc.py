@@ -15,12 +15,23 @@ import sys
 from logging import INFO
 import gc
 
-from copy import deepcopy
 import numpy as np
-from ... import logging
-from ...utils.profiler import get_system_total_memory_gb
+from ... import logging, config
+from ...utils.profiler import (
+    ResourceProfiles,
+    ResourceSampler,
+    get_system_total_memory_gb,
+    use_resource_sampler,
+)
 from ..engine import MapNode
 from .base import DistributedPluginBase
+from .tools import (
+    JobDescriptor,
+    critical_path_lengths,
+    descendant_counts,
+    interface_name,
+    profile_key,
+)
 
 try:
     from textwrap import indent
@@ -45,7 +56,7 @@ def run_node(node, updatehash, taskid):
 
     Parameters
     ----------
-    node : nipype Node instance
+    node : nipype Node instance or JobDescriptor
         the node to run
     updatehash : boolean
         flag for updating hash
@@ -63,6 +74,11 @@ def run_node(node, updatehash, taskid):
 
     # Try and execute the node via node.run()
     try:
+        if isinstance(node, JobDescriptor):
+            node = node.load()
+        # Don't allow streaming outputs
+        if getattr(node.interface, "terminal_output", "") == "stream":
+            node.interface.terminal_output = "allatonce"
         result["result"] = node.run(updatehash=updatehash)
     except:  # noqa: E722, intendedly catch all here
         result["traceback"] = format_exception(*sys.exc_info())
@@ -72,10 +88,12 @@ def run_node(node, updatehash, taskid):
     return result
 
 
-def process_initializer(cwd):
+def process_initializer(cwd, resource_registry=None):
     """Initializes the environment of the child process"""
     os.chdir(cwd)
     os.environ["NIPYPE_NO_ET"] = "1"
+    if resource_registry is not None:
+        use_resource_sampler(resource_registry)
 
 
 class MultiProcPlugin(DistributedPluginBase):
@@ -104,13 +122,32 @@ class MultiProcPlugin(DistributedPluginBase):
     - raise_insufficient: raise error if the requested resources for
         a node over the maximum `n_procs` and/or `memory_gb`
         (default is ``True``).
-    - scheduler: sort jobs topologically (``'tsort'``, default value)
-        or prioritize jobs by, first, memory consumption and, second,
-        number of threads (``'mem_thread'`` option).
+    - scheduler: sort jobs topologically (``'tsort'``, default value),
+        prioritize jobs by, first, memory consumption and, second,
+        number of threads (``'mem_thread'`` option), by the longest
+        path to the end of the workflow they start (``'critical_path'``),
+        or by their number of dependent jobs (``'descendants'``,
+        estimated above 4096 jobs, see
+        :func:`~nipype.pipeline.plugins.tools.descendant_counts`).
+        Paths are weighted by the duration of jobs measured on previous
+        runs when ``profile_db`` is given, and count jobs otherwise.
     - mp_context: name of multiprocessing context to use
+    - profile_db: path to a file storing the resources used by every job,
+        when the resource monitor is enabled, as
+        :class:`~nipype.utils.profiler.ResourceProfiles`. The jobs are then
+        allotted the resources measured on previous runs of the same
+        interface with inputs of similar size. The durations of
+        jobs are recorded regardless of the resource monitor.
+    - profile_policy: how measured resources are allotted (with
+        ``profile_db``): ``'replace'`` the declared ``mem_gb`` and ``n_procs``
+        of nodes (default value), or ``'clamp'`` them so that they are not
+        below the measured ones.
 
     """
 
+    # Nodes are shipped as JobDescriptor
+    _submit_graph_nodes = True
+
     def __init__(self, plugin_args=None):
         # Init variables and instance attributes
         super().__init__(plugin_args=plugin_args)
@@ -130,6 +167,43 @@ class MultiProcPlugin(DistributedPluginBase):
         )
         self.raise_insufficient = self.plugin_args.get("raise_insufficient", True)
 
+        # Resources measured on previous runs
+        self._profiles = None
+        self._profile_keys = {}
+        self._task_profiles = {}
+        self._allotted = {}
+        self._priorities = None
+        if self.plugin_args.get("profile_db"):
+            self._profiles = ResourceProfiles(self.plugin_args["profile_db"])
+        self._profile_policy = self.plugin_args.get("profile_policy", "replace")
+        if self._profile_policy not in ("replace", "clamp"):
+            raise ValueError(
+                'Unknown profile_policy "%s", use "replace" or "clamp".'
+                % self._profile_policy
+            )
+
+        # Started by run(), and stopped when it returns or raises
+        self.pool = None
+        self._sampler = None
+        self._stats = None
+
+    def run(self, graph, config, updatehash=False):
+        self._start_workers()
+        try:
+            return super().run(graph, config, updatehash=updatehash)
+        finally:
+            self._stop_workers()
+
+    def _start_workers(self):
+        """Start the pool of workers, and the sampler monitoring them"""
+        # A single sampler monitors the resources used by all workers
+        if config.resource_monitor:
+            self._sampler = ResourceSampler(
+                freq=float(config.get("execution", "resource_monitor_frequency", 1))
+            )
+            self._sampler.start()
+        registry = self._sampler.registry if self._sampler else None
+
         # Instantiate different thread pools for non-daemon processes
         logger.debug(
             "[MultiProc] Starting (n_procs=%d, mem_gb=%0.2f, cwd=%s)",
@@ -143,40 +217,80 @@ class MultiProcPlugin(DistributedPluginBase):
             self.pool = ProcessPoolExecutor(
                 max_workers=self.processors,
                 initializer=process_initializer,
-                initargs=(self._cwd,),
+                initargs=(self._cwd, registry),
                 mp_context=mp_context,
             )
         except (AttributeError, TypeError):
             # Python < 3.7 does not support initialization or contexts
             self.pool = ProcessPoolExecutor(max_workers=self.processors)
-            result_future = self.pool.submit(process_initializer, self._cwd)
+            result_future = self.pool.submit(process_initializer, self._cwd, registry)
             wait([result_future], timeout=5)
 
-        self._stats = None
+    def _stop_workers(self):
+        """Shut the pool of workers and the sampler down"""
+        if self.pool is not None:
+            self.pool.shutdown()
+        if self._sampler is not None:
+            self._sampler.stop()
 
     def _async_callback(self, args):
         result = args.result()
         self._taskresult[result["taskid"]] = result
+        self._notify_task_done()
 
     def _get_result(self, taskid):
         return self._taskresult.get(taskid)
 
     def _clear_task(self, taskid):
         del self._task_obj[taskid]
+        key = self._task_profiles.pop(taskid, None)
+        result = self._taskresult.get(taskid)
+        if key is not None and result and not result["traceback"]:
+            runtime = getattr(result["result"], "runtime", None)
+            self._profiles.record(
+                key,
+                getattr(runtime, "mem_peak_gb", None),
+                getattr(runtime, "cpu_percent", None),
+                getattr(runtime, "duration", None),
+            )
+
+    def _job_resources(self, jobid):
+        """The memory (GB) and threads allotted to a job"""
+        if jobid in self._allotted:
+            return self._allotted[jobid]
+
+        node = self.procs[jobid]
+        mem_gb, n_procs = node.mem_gb, node.n_procs
+        if self._profiles is not None and not isinstance(node, MapNode):
+            self._profile_keys[jobid] = profile_key(node)
+            estimate = self._profiles.estimate(self._profile_keys[jobid])
+            if estimate is not None:
+                if self._profile_policy == "clamp":
+                    estimate = (max(estimate[0], mem_gb), max(estimate[1], n_procs))
+                logger.debug(
+                    "Allotting %0.2fGB and %d threads to %s, measured previously "
+                    "(declared: %0.2fGB, %d threads).",
+                    *estimate,
+                    node.fullname,
+                    mem_gb,
+                    n_procs,
+                )
+                mem_gb, n_procs = estimate
+        self._allotted[jobid] = mem_gb, n_procs
+        return mem_gb, n_procs
 
     def _submit_job(self, node, updatehash=False):
         self._taskid += 1
-
-        # Don't allow streaming outputs
-        if getattr(node.interface, "terminal_output", "") == "stream":
-            node.interface.terminal_output = "allatonce"
-
-        result_future = self.pool.submit(run_node, node, updatehash, self._taskid)
+        job = JobDescriptor(node)
+        result_future = self.pool.submit(run_node, job, updatehash, self._taskid)
         result_future.add_done_callback(self._async_callback)
         self._task_obj[self._taskid] = result_future
 
         logger.debug(
-            "[MultiProc] Submitted task %s (taskid=%d).", node.fullname, self._taskid
+            "[MultiProc] Submitted task %s (taskid=%d, %d bytes).",
+            job.fullname,
+            self._taskid,
+            job.nbytes,
         )
         return self._taskid
 
@@ -204,9 +318,6 @@ class MultiProcPlugin(DistributedPluginBase):
             if self.raise_insufficient:
                 raise RuntimeError("Insufficient resources available for job")
 
-    def _postrun_check(self):
-        self.pool.shutdown()
-
     def _check_resources(self, running_tasks):
         """
         Make sure there are resources available
@@ -214,8 +325,9 @@ class MultiProcPlugin(DistributedPluginBase):
         free_memory_gb = self.memory_gb
         free_processors = self.processors
         for _, jobid in running_tasks:
-            free_memory_gb -= min(self.procs[jobid].mem_gb, free_memory_gb)
-            free_processors -= min(self.procs[jobid].n_procs, free_processors)
+            mem_gb, n_procs = self._job_resources(jobid)
+            free_memory_gb -= min(mem_gb, free_memory_gb)
+            free_processors -= min(n_procs, free_processors)
 
         return free_memory_gb, free_processors
 
@@ -227,9 +339,7 @@ class MultiProcPlugin(DistributedPluginBase):
         # Check to see if a job is available (jobs with all dependencies run)
         # See https://github.com/nipy/nipype/pull/2200#discussion_r141605722
         # See also https://github.com/nipy/nipype/issues/2372
-        jobids = np.flatnonzero(
-            ~self.proc_done & (self.depidx.sum(axis=0) == 0).__array__()
-        )
+        jobids = self._get_ready_jobs()
 
         # Check available resources by summing all threads and memory used
         free_memory_gb, free_processors = self._check_resources(self.pending_tasks)
@@ -302,8 +412,9 @@ class MultiProcPlugin(DistributedPluginBase):
                         continue
 
             # Check requirements of this job
-            next_job_gb = min(self.procs[jobid].mem_gb, self.memory_gb)
-            next_job_th = min(self.procs[jobid].n_procs, self.processors)
+            mem_gb, n_procs = self._job_resources(jobid)
+            next_job_gb = min(mem_gb, self.memory_gb)
+            next_job_th = min(n_procs, self.processors)
 
             # If node does not fit, skip at this moment
             if next_job_th > free_processors or next_job_gb > free_memory_gb:
@@ -363,19 +474,49 @@ class MultiProcPlugin(DistributedPluginBase):
             # Send job to task manager and add to pending tasks
             if self._status_callback:
                 self._status_callback(self.procs[jobid], "start")
-            tid = self._submit_job(deepcopy(self.procs[jobid]), updatehash=updatehash)
+            tid = self._submit_job(self.procs[jobid], updatehash=updatehash)
             if tid is None:
                 self.proc_done[jobid] = False
                 self.proc_pending[jobid] = False
             else:
                 self.pending_tasks.insert(0, (tid, jobid))
+                if jobid in self._profile_keys:
+                    self._task_profiles[tid] = self._profile_keys[jobid]
             # Display stats next loop
             self._stats = None
 
+    def _generate_dependency_list(self, graph):
+        super()._generate_dependency_list(graph)
+        scheduler = self.plugin_args.get("scheduler")
+        if scheduler == "critical_path":
+            self._priorities = critical_path_lengths(
+                self.dependents, self._job_durations()
+            )
+        elif scheduler == "descendants":
+            self._priorities = descendant_counts(self.dependents)
+
+    def _job_durations(self):
+        """The durations of jobs measured on previous runs, if any"""
+        if self._profiles is None:
+            return [1.0] * len(self.procs)
+        durations = [
+            self._profiles.duration(interface_name(node)) for node in self.procs
+        ]
+        measured = [duration for duration in durations if duration is not None]
+        # Jobs never run are assumed to last as long as a typical job
+        default = float(np.median(measured)) if measured else 1.0
+        return [default if duration is None else duration for duration in durations]
+
     def _sort_jobs(self, jobids, scheduler="tsort"):
         if scheduler == "mem_thread":
             return sorted(
                 jobids,
                 key=lambda item: (self.procs[item].mem_gb, self.procs[item].n_procs),
             )
+        if scheduler in ("critical_path", "descendants"):
+            # MapNode subnodes inherit the priority of their MapNode
+            return sorted(
+                jobids,
+                key=lambda item: -self._priorities[self.mapnodesubids.get(item, item)],
+            )
         return jobids
@@ -24,12 +24,15 @@ class OARPlugin(SGELikeBatchManagerBase):
     - oarsub_args : arguments to be prepended to the job execution
                     script in the oarsub call
     - max_jobname_len: maximum length of the job name.  Default 15.
+    - status_refresh: minimum interval (s) between two queries of the status
+                      of jobs, with a single ``oarstat`` call (default 5)
 
     """
 
     # Additional class variables
     _max_jobname_len = 15
     _oarsub_args = ""
+    _finished_states = ("error", "terminated")
 
     def __init__(self, **kwargs):
         template = """
@@ -49,19 +52,21 @@ class OARPlugin(SGELikeBatchManagerBase):
                 self._max_jobname_len = kwargs["plugin_args"]["max_jobname_len"]
         super().__init__(template, **kwargs)
 
-    def _is_pending(self, taskid):
-        #  subprocess.Popen requires taskid to be a string
-        proc = subprocess.Popen(
-            ["oarstat", "-J", "-s", "-j", taskid],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-        )
+    def _query_status(self, jobids):
+        #  subprocess.Popen requires taskids to be strings
+        args = ["oarstat", "-J", "-s"]
+        for jobid in jobids:
+            args.extend(["-j", jobid])
+        proc = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         o, e = proc.communicate()
-        parsed_result = json.loads(o)[taskid].lower()
-        is_pending = ("error" not in parsed_result) and (
-            "terminated" not in parsed_result
-        )
-        return is_pending
+        if proc.returncode:
+            # oarstat failed, check again later
+            return None
+        try:
+            states = json.loads(o)
+        except ValueError:
+            return None
+        return {jobid: state.lower() for jobid, state in states.items()}
 
     def _submit_batchtask(self, scriptfile, node):
         cmd = CommandLine(
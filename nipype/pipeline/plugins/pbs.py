@@ -2,6 +2,7 @@
 """
 
 import os
+import re
 from time import sleep
 
 from ... import logging
@@ -21,11 +22,19 @@ class PBSPlugin(SGELikeBatchManagerBase):
     - qsub_args : arguments to be prepended to the job execution script in the
                   qsub call
     - max_jobname_len: maximum length of the job name.  Default 15.
+    - array_jobs : submit the jobs ready at once with the same ``plugin_args``
+                   as a single array job (``qsub -t``)
+    - status_refresh : minimum interval (s) between two queries of the status
+                       of jobs, with a single ``qstat`` call (default 5)
+    - pilots : number of long-lived pilot jobs running the nodes, instead of
+               a job per node (see :class:`~.base.SGELikeBatchManagerBase`)
 
     """
 
     # Additional class variables
     _max_jobname_len = 15
+    _array_index_var = "PBS_ARRAYID"
+    _finished_states = ("C", "F")
 
     def __init__(self, **kwargs):
         template = """
@@ -43,25 +52,35 @@ class PBSPlugin(SGELikeBatchManagerBase):
                 self._max_jobname_len = kwargs["plugin_args"]["max_jobname_len"]
         super().__init__(template, **kwargs)
 
-    def _is_pending(self, taskid):
+    def _query_status(self, jobids):
         result = CommandLine(
-            f"qstat -f {taskid}",
+            "qstat -f %s" % " ".join("'%s'" % jobid for jobid in jobids),
             environ=dict(os.environ),
             terminal_output="file_split",
             resource_monitor=False,
             ignore_exception=True,
         ).run()
 
-        stdout = result.runtime.stdout
+        # Unknown jobs (errors) are not listed, and thus finished
+        states = {}
+        for block in result.runtime.stdout.split("Job Id:")[1:]:
+            jobid = block.split()[0].split(".")[0]
+            state = re.search(r"job_state = (\w+)", block)
+            states[jobid] = state.group(1) if state else None
         stderr = result.runtime.stderr
-        errmsg = "Unknown Job Id"
-        success = "Job has finished"
-        if (success in stderr) or ("job_state = C" in stdout):
-            return False
-        else:
-            return errmsg not in stderr
+        if (
+            result.runtime.returncode
+            and not states
+            and not any(msg in stderr for msg in ("Unknown Job Id", "Job has finished"))
+        ):
+            # qstat failed, check again later
+            return None
+        return states
+
+    def _array_task_id(self, jobid, index):
+        return "%s[%d]" % (jobid, index)
 
-    def _submit_batchtask(self, scriptfile, node):
+    def _submit_batchtask(self, scriptfile, node, array_size=None):
         cmd = CommandLine(
             "qsub",
             environ=dict(os.environ),
@@ -77,6 +96,8 @@ class PBSPlugin(SGELikeBatchManagerBase):
                 qsubargs = node.plugin_args["qsub_args"]
             else:
                 qsubargs += " " + node.plugin_args["qsub_args"]
+        if array_size:
+            qsubargs = f"{qsubargs} -t 1-{array_size}"
         if "-o" not in qsubargs:
             qsubargs = f"{qsubargs} -o {path}"
         if "-e" not in qsubargs:
@@ -110,8 +131,8 @@ class PBSPlugin(SGELikeBatchManagerBase):
             else:
                 break
         iflogger.setLevel(oldlevel)
-        # retrieve pbs taskid
-        taskid = result.runtime.stdout.split(".")[0]
+        # retrieve pbs taskid, without the brackets of array jobs
+        taskid = result.runtime.stdout.split(".")[0].split("[")[0]
         self._pending[taskid] = node.output_dir()
         logger.debug(f"submitted pbs task: {taskid} for node {node._id}")
 
@@ -18,6 +18,9 @@ class PBSGraphPlugin(SGEGraphPlugin):
     - template : template to use for batch job submission
     - qsub_args : arguments to be prepended to the job execution script in the
                   qsub call
+    - script_threads : number of threads writing the scripts of the nodes
+    - shared_runner : run every node with a single script, taking the pickle
+                      of the node as argument
 
     """
 
@@ -36,7 +39,8 @@ class PBSGraphPlugin(SGEGraphPlugin):
 
                 batch_dir, name = os.path.split(pyscript)
                 name = ".".join(name.split(".")[:-1])
-                batchscript = "\n".join((template, f"{sys.executable} {pyscript}"))
+                command = " ".join([sys.executable] + self._node_args(pyscript))
+                batchscript = "\n".join((template, command))
                 batchscriptfile = os.path.join(batch_dir, "batchscript_%s.sh" % name)
                 with open(batchscriptfile, "w") as batchfp:
                     batchfp.writelines(batchscript)
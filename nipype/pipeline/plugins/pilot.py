@@ -0,0 +1,253 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""Pilot workers for the execution of workflows on batch systems
+
+Pilots are long-lived batch jobs that run the nodes pulled from a
+:class:`TaskQueue`, kept in a directory of a filesystem shared with the
+workflow.  A pilot is started with::
+
+    python -m nipype.pipeline.plugins.pilot <queue directory> --slots 4
+
+and exits when the queue is stopped, or after having been idle for a while.
+"""
+import argparse
+import os
+import os.path as op
+import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from socket import gethostname
+from time import sleep, time
+from traceback import format_exception
+
+from ... import logging
+
+logger = logging.getLogger("nipype.workflow")
+
+
+class TaskQueue:
+    """
+    A queue of nodes to run, on a shared filesystem.
+
+    Every task is a file in the ``tasks`` directory, named after its serial
+    number and the number of threads of its node, and listing the pickle of
+    the node (see :func:`~.tools.pickle_node`).  Pilots claim a task by
+    moving it atomically to the ``running`` directory, prefixed with their
+    name, and mark it finished with a file in the ``done`` directory once
+    the results of the node are saved.  Pilots touch their file in the
+    ``workers`` directory as a heartbeat, so that the tasks of lost pilots
+    can be put back in the queue.
+    """
+
+    def __init__(self, path):
+        self.path = op.abspath(path)
+        for name in ("tasks", "running", "done", "workers"):
+            os.makedirs(op.join(self.path, name), exist_ok=True)
+        self._serial = 0
+
+    def _dir(self, name, *entry):
+        return op.join(self.path, name, *entry)
+
+    def put(self, pklfile, n_procs=1):
+        """Queue the node pickled in ``pklfile`` and return the task id"""
+        self._serial += 1
+        taskid = "%08d.%d" % (self._serial, max(1, n_procs))
+        tmpfile = self._dir("tasks", "." + taskid)
+        with open(tmpfile, "w") as fp:
+            fp.write(pklfile + "\n")
+        os.rename(tmpfile, self._dir("tasks", taskid))
+        return taskid
+
+    def is_done(self, taskid):
+        """Whether a task has been run"""
+        return op.exists(self._dir("done", taskid))
+
+    def has_tasks(self):
+        """Whether tasks are queued or running"""
+        return any(
+            not entry.startswith(".")
+            for name in ("tasks", "running")
+            for entry in os.listdir(self._dir(name))
+        )
+
+    def claim(self, worker, free, slots):
+        """Claim the queued tasks fitting in the ``free`` threads of a worker
+
+        A task needing more threads than available is only claimed by an
+        idle worker, with all its ``slots`` free.  Return a list of
+        ``(taskid, n_procs, pklfile)``.
+        """
+        claimed = []
+        for taskid in sorted(os.listdir(self._dir("tasks"))):
+            if free <= 0:
+                break
+            if taskid.startswith("."):
+                continue
+            n_procs = int(taskid.rsplit(".", 1)[1])
+            if n_procs > free and free < slots:
+                continue
+            running = self._dir("running", f"{worker}@{taskid}")
+            try:
+                os.rename(self._dir("tasks", taskid), running)
+            except FileNotFoundError:
+                # Claimed by another worker
+                continue
+            with open(running) as fp:
+                claimed.append((taskid, n_procs, fp.read().strip()))
+            free -= n_procs
+        return claimed
+
+    def finish(self, worker, taskid):
+        """Mark a task claimed by ``worker`` as done"""
+        open(self._dir("done", taskid), "w").close()
+        try:
+            os.remove(self._dir("running", f"{worker}@{taskid}"))
+        except FileNotFoundError:
+            # Queued again, as the worker was believed to be lost
+            pass
+
+    def beat(self, worker):
+        """Signal that ``worker`` is alive"""
+        with open(self._dir("workers", worker), "w"):
+            pass
+
+    def retire(self, worker):
+        """Signal that ``worker`` exited"""
+        try:
+            os.remove(self._dir("workers", worker))
+        except FileNotFoundError:
+            pass
+
+    def requeue_lost(self, timeout):
+        """Queue the tasks of workers without heartbeat for ``timeout`` seconds
+
+        Return the number of tasks queued again.
+        """
+        requeued = 0
+        now = time()
+        for worker in os.listdir(self._dir("workers")):
+            try:
+                if now - os.stat(self._dir("workers", worker)).st_mtime < timeout:
+                    continue
+            except FileNotFoundError:
+                continue
+            logger.warning("Pilot %s has been lost.", worker)
+            for entry in os.listdir(self._dir("running")):
+                owner, _, taskid = entry.partition("@")
+                if owner == worker:
+                    os.rename(self._dir("running", entry), self._dir("tasks", taskid))
+                    requeued += 1
+            self.retire(worker)
+        return requeued
+
+    def stop(self):
+        """Ask the workers to exit once their tasks are done"""
+        open(self._dir("stop"), "w").close()
+
+    @property
+    def stopped(self):
+        return op.exists(self._dir("stop"))
+
+
+def run_task(pklfile, store_exception=True):
+    """Run a node pickled by :func:`~.tools.pickle_node`
+
+    Exceptions are stored in the results file of the node, as in the python
+    scripts of :func:`~.tools.create_pyscript`, and the path to the results
+    is written in the completion marker of the node (see
+    :func:`~.tools.mark_completed`).  Otherwise, the crash of the node is
+    reported and the exception raised again.
+    """
+    from ... import config
+    from ...utils.filemanip import loadpkl, savepkl
+    from .tools import mark_completed, report_crash
+
+    info = None
+    try:
+        info = loadpkl(pklfile)
+        if info["node"].config:
+            config.update_config(info["node"].config)
+        try:
+            config.update_matplotlib()
+        except ImportError:
+            pass
+        logging.update_logging(config)
+        info["node"].run(updatehash=info["updatehash"])
+    except Exception:
+        traceback = format_exception(*sys.exc_info())
+        if info is None or not op.exists(info["node"].output_dir()):
+            result = None
+            suffix = op.basename(pklfile)[len("node_") : -len(".pklz")]
+            resultsfile = op.join(op.dirname(pklfile), "crashdump_%s.pklz" % suffix)
+        else:
+            result = info["node"].result
+            resultsfile = op.join(
+                info["node"].output_dir(), "result_%s.pklz" % info["node"].name
+            )
+        if store_exception or info is None:
+            savepkl(
+                resultsfile,
+                dict(result=result, hostname=gethostname(), traceback=traceback),
+            )
+        else:
+            report_crash(info["node"], traceback, gethostname())
+        if not store_exception:
+            raise
+    else:
+        resultsfile = op.join(
+            info["node"].output_dir(), "result_%s.pklz" % info["node"].name
+        )
+    mark_completed(pklfile, resultsfile)
+
+
+def run_pilot(path, slots=1, heartbeat=30, idle_timeout=300, poll=1):
+    """Run the tasks of a queue, in up to ``slots`` processes"""
+    queue = TaskQueue(path)
+    worker = "%s.%d" % (gethostname(), os.getpid())
+    logger.info("Pilot %s started with %d slots.", worker, slots)
+    running = {}
+    last_beat = 0
+    idle_since = time()
+    with ProcessPoolExecutor(max_workers=slots) as pool:
+        while True:
+            if time() - last_beat >= heartbeat:
+                queue.beat(worker)
+                last_beat = time()
+
+            for future in [future for future in running if future.done()]:
+                taskid, _ = running.pop(future)
+                queue.finish(worker, taskid)
+
+            if not queue.stopped:
+                free = slots - sum(n_procs for _, n_procs in running.values())
+                for taskid, n_procs, pklfile in queue.claim(worker, free, slots):
+                    logger.debug("Pilot %s running task %s.", worker, taskid)
+                    running[pool.submit(run_task, pklfile)] = (taskid, n_procs)
+
+            if running:
+                idle_since = time()
+                wait(list(running), timeout=poll, return_when=FIRST_COMPLETED)
+                continue
+            if queue.stopped or time() - idle_since > idle_timeout:
+                break
+            sleep(poll)
+    queue.retire(worker)
+    logger.info("Pilot %s exited.", worker)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("queue", help="directory of the task queue")
+    parser.add_argument("--slots", type=int, default=1)
+    parser.add_argument("--heartbeat", type=float, default=30)
+    parser.add_argument("--idle-timeout", type=float, default=300)
+    args = parser.parse_args(argv)
+    run_pilot(
+        args.queue,
+        slots=args.slots,
+        heartbeat=args.heartbeat,
+        idle_timeout=args.idle_timeout,
+    )
+
+
+if __name__ == "__main__":
+    main()
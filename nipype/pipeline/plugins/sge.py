@@ -383,9 +383,15 @@ class SGEPlugin(SGELikeBatchManagerBase):
     - template : template to use for batch job submission
     - qsub_args : arguments to be prepended to the job execution script in the
                   qsub call
+    - array_jobs : submit the jobs ready at once with the same ``plugin_args``
+                   as a single array job (``qsub -t``)
+    - pilots : number of long-lived pilot jobs running the nodes, instead of
+               a job per node (see :class:`~.base.SGELikeBatchManagerBase`)
 
     """
 
+    _array_index_var = "SGE_TASK_ID"
+
     def __init__(self, **kwargs):
         template = """
 #$ -V
@@ -412,7 +418,7 @@ class SGEPlugin(SGELikeBatchManagerBase):
     def _is_pending(self, taskid):
         return self._refQstatSubstitute.is_job_pending(int(taskid))
 
-    def _submit_batchtask(self, scriptfile, node):
+    def _submit_batchtask(self, scriptfile, node, array_size=None):
         cmd = CommandLine(
             "qsub",
             environ=dict(os.environ),
@@ -428,6 +434,8 @@ class SGEPlugin(SGELikeBatchManagerBase):
                 qsubargs = node.plugin_args["qsub_args"]
             else:
                 qsubargs += " " + node.plugin_args["qsub_args"]
+        if array_size:
+            qsubargs = f"{qsubargs} -t 1-{array_size}"
         if "-o" not in qsubargs:
             qsubargs = f"{qsubargs} -o {path}"
         if "-e" not in qsubargs:
@@ -468,7 +476,9 @@ class SGEPlugin(SGELikeBatchManagerBase):
         # retrieve sge taskid
         lines = [line for line in result.runtime.stdout.split("\n") if line]
         taskid = int(
-            re.match("Your job ([0-9]*) .* has been submitted", lines[-1]).groups()[0]
+            re.match(
+                "Your job(?:-array)? ([0-9]*)[ .].* has been submitted", lines[-1]
+            ).groups()[0]
         )
         self._pending[taskid] = node.output_dir()
         self._refQstatSubstitute.add_startup_job(taskid, cmd.cmdline)
@@ -28,9 +28,31 @@ class SLURMPlugin(SGELikeBatchManagerBase):
 
     - sbatch_args: arguments to pass prepend to the sbatch call
 
+    - array_jobs: submit the jobs ready at once with the same ``plugin_args``
+      as a single array job (``sbatch --array``)
+
+    - status_refresh: minimum interval (s) between two queries of the status
+      of jobs, with a single ``squeue`` call (default 5)
+
+    - pilots: number of long-lived pilot jobs running the nodes, instead of
+      a job per node (see :class:`~.base.SGELikeBatchManagerBase`)
+
 
     """
 
+    _array_index_var = "SLURM_ARRAY_TASK_ID"
+    _finished_states = (
+        "BOOT_FAIL",
+        "CANCELLED",
+        "COMPLETED",
+        "DEADLINE",
+        "FAILED",
+        "NODE_FAIL",
+        "OUT_OF_MEMORY",
+        "PREEMPTED",
+        "TIMEOUT",
+    )
+
     def __init__(self, **kwargs):
         template = "#!/bin/bash"
 
@@ -57,32 +79,44 @@ class SLURMPlugin(SGELikeBatchManagerBase):
         self._pending = {}
         super().__init__(self._template, **kwargs)
 
-    def _is_pending(self, taskid):
-        try:
-            res = CommandLine(
-                "squeue",
-                args=" ".join(["-j", "%s" % taskid]),
-                resource_monitor=False,
-                terminal_output="allatonce",
-            ).run()
-            return res.runtime.stdout.find(str(taskid)) > -1
-        except RuntimeError as e:
-            if any(
-                ss in str(e)
-                for ss in ["Socket timed out", "not available at the moment"]
-            ):
-                # do not raise error and allow recheck
-                logger.warning(
-                    "SLURM timeout encountered while checking job status,"
-                    " treating job %d as pending",
-                    taskid,
-                )
-                return True
-            if "Invalid job id" not in str(e):
-                raise (e)
-            return False
-
-    def _submit_batchtask(self, scriptfile, node):
+    def _array_task_id(self, jobid, index):
+        return "%s_%d" % (jobid, index)
+
+    def _query_status(self, jobids):
+        # A single squeue call lists the jobs tracked, in any state until
+        # slurm forgets them, and tasks of arrays one by one
+        res = CommandLine(
+            "squeue",
+            args="-h -r -t all -j %s -o '%%i %%T'" % ",".join(jobids),
+            resource_monitor=False,
+            terminal_output="allatonce",
+        ).run(ignore_exception=True)
+        if getattr(res.runtime, "returncode", None) != 0:
+            error = getattr(res.runtime, "stderr", None) or ""
+            if "Invalid job id" in error:
+                # None of the jobs is known anymore
+                return {}
+            # do not raise error and allow recheck
+            logger.warning(
+                "SLURM failed to list the status of jobs, treating jobs as "
+                "pending: %s",
+                error.strip() or getattr(res.runtime, "traceback", ""),
+            )
+            return None
+        states = {}
+        for line in res.runtime.stdout.splitlines():
+            fields = line.split()
+            if len(fields) >= 2:
+                states[fields[0]] = fields[1]
+        if not states:
+            # Finished jobs are listed too, so some should be
+            logger.warning(
+                "SLURM listed none of the jobs queried, treating jobs as pending"
+            )
+            return None
+        return states
+
+    def _submit_batchtask(self, scriptfile, node, array_size=None):
         """
         This is more or less the _submit_batchtask from sge.py with flipped
         variable names, different command line switches, and different output
@@ -104,14 +138,14 @@ class SLURMPlugin(SGELikeBatchManagerBase):
                 sbatch_args = node.plugin_args["sbatch_args"]
             else:
                 sbatch_args += " " + node.plugin_args["sbatch_args"]
+        logfile = "slurm-%j.out"
+        if array_size:
+            sbatch_args = f"{sbatch_args} --array=1-{array_size}"
+            logfile = "slurm-%A_%a.out"
         if "-o" not in sbatch_args:
-            sbatch_args = "{} -o {}".format(
-                sbatch_args, os.path.join(path, "slurm-%j.out")
-            )
+            sbatch_args = "{} -o {}".format(sbatch_args, os.path.join(path, logfile))
         if "-e" not in sbatch_args:
-            sbatch_args = "{} -e {}".format(
-                sbatch_args, os.path.join(path, "slurm-%j.out")
-            )
+            sbatch_args = "{} -e {}".format(sbatch_args, os.path.join(path, logfile))
         if node._hierarchy:
             jobname = ".".join((dict(os.environ)["LOGNAME"], node._hierarchy, node._id))
         else:
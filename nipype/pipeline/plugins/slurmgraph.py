@@ -35,6 +35,9 @@ class SLURMGraphPlugin(GraphPluginBase):
     - template : template to use for batch job submission
     - qsub_args : arguments to be prepended to the job execution script in the
                   qsub call
+    - script_threads : number of threads writing the scripts of the nodes
+    - shared_runner : run every node with a single script, taking the pickle
+                      of the node as argument
 
     """
 
@@ -110,7 +113,8 @@ class SLURMGraphPlugin(GraphPluginBase):
 
                     batch_dir, name = os.path.split(pyscript)
                     name = ".".join(name.split(".")[:-1])
-                    batchscript = "\n".join((template, f"{sys.executable} {pyscript}"))
+                    command = " ".join([sys.executable] + self._node_args(pyscript))
+                    batchscript = "\n".join((template, command))
                     batchscriptfile = os.path.join(
                         batch_dir, "batchscript_%s.sh" % name
                     )
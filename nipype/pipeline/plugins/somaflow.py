@@ -24,7 +24,7 @@ class SomaFlowPlugin(GraphPluginBase):
     def _submit_graph(self, pyfiles, dependencies, nodes):
         jobs = [
             Job(
-                command=[sys.executable, fname],
+                command=[sys.executable] + self._node_args(fname),
                 name=os.path.splitext(os.path.split(fname)[1])[0],
             )
             for fname in pyfiles
@@ -2,9 +2,19 @@
 # vi: set ft=python sts=4 ts=4 sw=4 et:
 """Tests for the engine module
 """
+import os
+import subprocess
+import sys
+
+import networkx as nx
 import numpy as np
+import pytest
 import scipy.sparse as ssp
 
+import nipype.pipeline.engine as pe
+from nipype.interfaces.utility import Function
+from nipype.pipeline.plugins.base import DistributedPluginBase, GraphPluginBase
+
 
 def test_scipy_sparse():
     foo = ssp.lil_matrix(np.eye(3, k=1))
@@ -13,6 +23,154 @@ def test_scipy_sparse():
     assert foo[0, 1] == 0
 
 
+def test_dependency_bookkeeping():
+    graph = nx.DiGraph([("a", "b"), ("a", "c"), ("b", "d"), ("c", "d")])
+    plugin = DistributedPluginBase()
+    plugin._generate_dependency_list(graph)
+    plugin.mapnodesubids = {}
+    jobid = {node: idx for idx, node in enumerate(plugin.procs)}
+
+    assert plugin._get_ready_jobs().tolist() == [jobid["a"]]
+    assert plugin.refcount[jobid["a"]] == 2
+
+    plugin.proc_done[jobid["a"]] = True
+    plugin._task_finished_cb(jobid["a"])
+    assert plugin._get_ready_jobs().tolist() == sorted([jobid["b"], jobid["c"]])
+
+    for node in "bc":
+        plugin.proc_done[jobid[node]] = True
+        plugin._task_finished_cb(jobid[node])
+    assert plugin._get_ready_jobs().tolist() == [jobid["d"]]
+    assert plugin.refcount[jobid["a"]] == 0
+    assert plugin.refcount[jobid["b"]] == 1
+    # Only the finished jobs whose outputs are used up can be removed
+    assert plugin._removable == [jobid["a"]]
+    # A repeated completion must not release dependencies twice
+    plugin._task_finished_cb(jobid["b"])
+    assert plugin.indegree[jobid["d"]] == 0
+    assert plugin.refcount[jobid["a"]] == 0
+
+
+def test_remove_node_deps():
+    graph = nx.DiGraph([("a", "b"), ("a", "c"), ("b", "d"), ("e", "d")])
+    plugin = DistributedPluginBase()
+    plugin._generate_dependency_list(graph)
+    assert all(plugin.procs[idx] == node for node, idx in plugin.jobids.items())
+
+    info = plugin._remove_node_deps(plugin.jobids["b"], "crashfile", graph)
+    assert info["dependents"] == ["b", "d"]
+    assert plugin.proc_done.tolist() == [node in ("b", "d") for node in plugin.procs]
+
+
+def test_keep_resource_logs(tmp_path):
+    from types import SimpleNamespace
+
+    outdir = tmp_path / "node"
+    outdir.mkdir()
+    (outdir / "resmon").write_bytes(b"samples")
+    runtime = SimpleNamespace(resmon=str(outdir / "resmon"))
+    plugin = DistributedPluginBase()
+    plugin.procs = [SimpleNamespace(result=SimpleNamespace(runtime=runtime))]
+
+    plugin._keep_resource_logs(0, str(outdir))
+    assert plugin.procs[0]._removed_runtime is runtime
+    assert runtime.resmon == str(tmp_path / "node.0.resmon")
+    assert (tmp_path / "node.0.resmon").read_bytes() == b"samples"
+
+
+def add(x, y=0):
+    return x + y + 1
+
+
+class ModifyingPlugin(DistributedPluginBase):
+    """Run nodes when submitted, marking them as it goes"""
+
+    def __init__(self, plugin_args=None):
+        super().__init__(plugin_args=plugin_args)
+        self._results = {}
+
+    def _submit_job(self, node, updatehash=False):
+        node.submitted = True
+        taskid = len(self._results)
+        self._results[taskid] = {
+            "result": node.run(updatehash=updatehash),
+            "traceback": None,
+        }
+        return taskid
+
+    def _get_result(self, taskid):
+        return self._results[taskid]
+
+    def _clear_task(self, taskid):
+        del self._results[taskid]
+
+
+def test_submitted_nodes_copied(tmp_path):
+    pipe = pe.Workflow(name="pipe", base_dir=str(tmp_path))
+    nodes = [pe.Node(Function(function=add), name=f"n{i}") for i in range(2)]
+    nodes[0].inputs.x = 0
+    pipe.connect(nodes[0], "out", nodes[1], "x")
+
+    execgraph = pipe.run(plugin=ModifyingPlugin())
+    assert {n.name: n.result.outputs.out for n in execgraph.nodes()} == {
+        "n0": 1,
+        "n1": 2,
+    }
+    # Plugins that did not opt in are given copies of the nodes
+    assert not any(hasattr(n, "submitted") for n in execgraph.nodes())
+
+
+class LocalGraphPlugin(GraphPluginBase):
+    """Run the files of a graph one after the other"""
+
+    def _submit_graph(self, pyfiles, dependencies, nodes):
+        self.nodes = nodes
+        self.dependencies = {
+            nodes[idx].name: sorted(nodes[dep].name for dep in deps)
+            for idx, deps in dependencies.items()
+        }
+        self.commands = [[sys.executable] + self._node_args(f) for f in pyfiles]
+        for command in self.commands:
+            subprocess.run(command, check=True)
+
+
+@pytest.mark.parametrize("shared_runner", [False, True])
+def test_graph_submission(tmp_path, shared_runner):
+    pipe = pe.Workflow(name="pipe", base_dir=str(tmp_path))
+    nodes = [pe.Node(Function(function=add), name=f"n{i}") for i in range(4)]
+    nodes[0].inputs.x = 0
+    pipe.connect(
+        [
+            (nodes[0], nodes[1], [("out", "x")]),
+            (nodes[0], nodes[2], [("out", "x")]),
+            (nodes[1], nodes[3], [("out", "x")]),
+            (nodes[2], nodes[3], [("out", "y")]),
+        ]
+    )
+
+    plugin = LocalGraphPlugin(
+        plugin_args={"shared_runner": shared_runner, "script_threads": 4}
+    )
+    execgraph = pipe.run(plugin=plugin)
+    assert plugin.dependencies == {
+        "n0": [],
+        "n1": ["n0"],
+        "n2": ["n0"],
+        "n3": ["n1", "n2"],
+    }
+    scripts = {command[1] for command in plugin.commands}
+    assert len(scripts) == (1 if shared_runner else 4)
+    outputs = {n.name: n.result.outputs.out for n in execgraph.nodes()}
+    assert outputs == {"n0": 1, "n1": 2, "n2": 2, "n3": 5}
+
+    # Results are found from the completion markers of the jobs
+    plugin._is_pending = lambda taskid: False
+    for idx, node in enumerate(plugin.nodes):
+        assert os.path.exists(plugin._markers[idx])
+        plugin._pending[idx] = node.output_dir()
+        assert plugin._get_result(idx)["result"].outputs.out == outputs[node.name]
+
+
 """
 Can use the following code to test that a mapnode crash continues successfully
 Need to put this into a unit-test with a timeout
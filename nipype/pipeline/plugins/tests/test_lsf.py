@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+from nipype.pipeline.plugins.lsf import LSFPlugin
+
+FAKE_BJOBS = """#!/bin/sh
+cat "{states}"
+exit $(cat "{status}")
+"""
+
+
+@pytest.fixture
+def fake_bjobs(tmp_path, monkeypatch):
+    """A bjobs command listing the jobs, and exiting with the status, in files"""
+    states = tmp_path / "states"
+    status = tmp_path / "status"
+    status.write_text("0")
+    bjobs = tmp_path / "bjobs"
+    bjobs.write_text(FAKE_BJOBS.format(states=states, status=status))
+    bjobs.chmod(0o755)
+    monkeypatch.setenv("PATH", str(tmp_path), prepend=os.pathsep)
+    monkeypatch.chdir(tmp_path)
+    return states, status
+
+
+def test_lsf_bulk_status(fake_bjobs):
+    states, status = fake_bjobs
+    states.write_text(
+        "JOBID USER STAT QUEUE FROM_HOST EXEC_HOST JOB_NAME SUBMIT_TIME\n"
+        "10 user RUN normal host host job Jan 1 00:00\n"
+        "11 user DONE normal host host job Jan 1 00:00\n"
+    )
+    plugin = LSFPlugin(plugin_args={"status_refresh": 0})
+    for jobid in (10, 11, 12):
+        plugin._status.add(jobid)
+    assert [plugin._is_pending(jobid) for jobid in (10, 11, 12)] == [
+        True,
+        False,
+        False,
+    ]
+
+    # Purged jobs are finished, even though bjobs exits with an error
+    status.write_text("255")
+    states.write_text(
+        "JOBID USER STAT QUEUE FROM_HOST EXEC_HOST JOB_NAME SUBMIT_TIME\n"
+        "10 user RUN normal host host job Jan 1 00:00\n"
+        "Job <11> is not found\n"
+    )
+    assert [plugin._is_pending(jobid) for jobid in (10, 11)] == [True, False]
+    states.write_text("Job <10> is not found\n")
+    assert not plugin._is_pending(10)
+
+    # Jobs are pending while bjobs fails
+    plugin._status.add(13)
+    states.write_text("")
+    assert plugin._is_pending(13)
+
+
+def test_lsf_missing_bjobs(tmp_path, monkeypatch):
+    monkeypatch.setenv("PATH", str(tmp_path))
+    monkeypatch.chdir(tmp_path)
+    plugin = LSFPlugin(plugin_args={"status_refresh": 0})
+    assert plugin._query_status(["10"]) is None
@@ -3,6 +3,7 @@
 """
 Test the resource management of MultiProc
 """
+
 import sys
 import os
 import pytest
@@ -137,3 +138,115 @@ def test_hold_job_until_procs_available(tmpdir):
 
     max_threads = 2
     pipe.run(plugin="MultiProc", plugin_args={"n_procs": max_threads})
+
+
+def test_event_driven_dispatch(tmpdir):
+    """Finished tasks wake up the scheduler before the poll interval elapses"""
+    from threading import Event
+    from nipype.pipeline.plugins import MultiProcPlugin
+
+    class RecordingEvent(Event):
+        def __init__(self):
+            super().__init__()
+            self.woken = []
+
+        def wait(self, timeout=None):
+            woken = super().wait(timeout)
+            self.woken.append(woken)
+            return woken
+
+    tmpdir.chdir()
+
+    pipe = pe.Workflow(name="pipe", base_dir=tmpdir.strpath)
+    nodes = [pe.Node(SingleNodeTestInterface(), name="n%d" % i) for i in range(4)]
+    for src, dst in zip(nodes[:-1], nodes[1:]):
+        pipe.connect(src, "output1", dst, "input1")
+    nodes[0].inputs.input1 = 1
+    pipe.config["execution"]["poll_sleep_duration"] = 60
+
+    plugin = MultiProcPlugin(plugin_args={"n_procs": 2})
+    plugin._wakeup = RecordingEvent()
+    pipe.run(plugin=plugin)
+    # Every wait of the scheduler ended on a completion, none on the timeout
+    assert plugin._wakeup.woken
+    assert all(plugin._wakeup.woken)
+
+
+def test_submitted_nodes_not_modified(tmpdir):
+    """Jobs are shipped as descriptors, the nodes of the graph are kept as-is"""
+    tmpdir.chdir()
+
+    pipe = pe.Workflow(name="pipe", base_dir=tmpdir.strpath)
+    node = pe.Node(SingleNodeTestInterface(), name="n")
+    node.inputs.input1 = 1
+    node.interface.terminal_output = "stream"
+    pipe.add_nodes([node])
+
+    execgraph = pipe.run(plugin="MultiProc", plugin_args={"n_procs": 2})
+    (result,) = execgraph.nodes()
+    assert result.result.outputs.output1 == 1
+    assert result.interface.terminal_output == "stream"
+
+
+@pytest.mark.parametrize("policy,allotted", [("replace", (0.11, 1)), ("clamp", (1, 2))])
+def test_profile_db(tmpdir, policy, allotted):
+    """Jobs are allotted the resources measured on previous runs"""
+    from nipype.pipeline.plugins.multiproc import MultiProcPlugin
+    from nipype.pipeline.plugins.tools import profile_key
+    from nipype.utils.profiler import ResourceProfiles
+
+    tmpdir.chdir()
+    node = pe.Node(SingleNodeTestInterface(), name="n", mem_gb=1, n_procs=2)
+    node.inputs.input1 = 1
+    key = profile_key(node)
+    assert key.startswith("nipype.pipeline.plugins.tests.test_multiproc.")
+
+    profiles = ResourceProfiles(tmpdir.join("profiles.tsv").strpath)
+    for _ in range(3):
+        profiles.record(key, 0.1, 50.0)
+
+    plugin = MultiProcPlugin(
+        plugin_args={
+            "n_procs": 2,
+            "profile_db": profiles.filename,
+            "profile_policy": policy,
+        }
+    )
+    plugin.procs = [node]
+    mem_gb, n_procs = plugin._job_resources(0)
+    assert (pytest.approx(mem_gb), n_procs) == allotted
+
+    with pytest.raises(ValueError):
+        MultiProcPlugin(plugin_args={"profile_policy": "unknown"})
+
+
+@pytest.mark.parametrize("scheduler", ["critical_path", "descendants"])
+def test_critical_path_first(tmpdir, scheduler):
+    """Long chains of jobs are started before independent jobs"""
+    tmpdir.chdir()
+
+    pipe = pe.Workflow(name="pipe", base_dir=tmpdir.strpath)
+    wide = [pe.Node(SingleNodeTestInterface(), name="w%d" % i) for i in range(3)]
+    deep = [pe.Node(SingleNodeTestInterface(), name="d%d" % i) for i in range(3)]
+    pipe.add_nodes(wide)
+    for src, dst in zip(deep[:-1], deep[1:]):
+        pipe.connect(src, "output1", dst, "input1")
+    for node in wide + deep[:1]:
+        node.inputs.input1 = 1
+
+    started = []
+
+    def status_callback(node, status):
+        if status == "start":
+            started.append(node.name)
+
+    pipe.run(
+        plugin="MultiProc",
+        plugin_args={
+            "n_procs": 1,
+            "scheduler": scheduler,
+            "status_callback": status_callback,
+        },
+    )
+    # The last job of the chain is as long as independent jobs
+    assert started[:2] == ["d0", "d1"]
@@ -1,3 +1,4 @@
+import os
 from shutil import which
 
 import nipype.interfaces.base as nib
@@ -42,3 +43,30 @@ def test_run_oargraph(tmp_path):
     node = list(execgraph.nodes())[names.index("pipe.mod1")]
     result = node.get_output("output1")
     assert result == [1, 1]
+
+
+def test_oar_bulk_status(tmp_path, monkeypatch):
+    from nipype.pipeline.plugins.oar import OARPlugin
+
+    output = tmp_path / "output"
+    oarstat = tmp_path / "oarstat"
+    oarstat.write_text('#!/bin/sh\ncat "%s"\n' % output)
+    oarstat.chmod(0o755)
+    monkeypatch.setenv("PATH", str(tmp_path), prepend=os.pathsep)
+
+    plugin = OARPlugin(plugin_args={"status_refresh": 0})
+    for jobid in (10, 11, 12):
+        plugin._status.add(jobid)
+    output.write_text('{"10": "Running", "11": "Terminated"}')
+    assert [plugin._is_pending(jobid) for jobid in (10, 11, 12)] == [
+        True,
+        False,
+        False,
+    ]
+
+    # Jobs are pending while oarstat fails or prints invalid output
+    for text in ("", "{"):
+        output.write_text(text)
+        assert plugin._is_pending(11)
+    oarstat.write_text("#!/bin/sh\nexit 1\n")
+    assert plugin._is_pending(11)
@@ -41,3 +41,32 @@ def test_run_pbsgraph(tmp_path):
     node = list(execgraph.nodes())[names.index("pipe.mod1")]
     result = node.get_output("output1")
     assert result == [1, 1]
+
+
+FAKE_QSTAT = """#!/bin/sh
+echo "$@" >> "{log}"
+cat "{states}"
+"""
+
+
+def test_pbs_bulk_status(tmp_path, monkeypatch):
+    from nipype.pipeline.plugins.pbs import PBSPlugin
+
+    log = tmp_path / "qstat.log"
+    states = tmp_path / "states"
+    states.write_text(
+        "Job Id: 10.server\n    job_state = R\n\n"
+        "Job Id: 11[2].server\n    job_state = C\n"
+    )
+    qstat = tmp_path / "qstat"
+    qstat.write_text(FAKE_QSTAT.format(log=log, states=states))
+    qstat.chmod(0o755)
+    monkeypatch.setenv("PATH", str(tmp_path), prepend=":")
+    monkeypatch.chdir(tmp_path)
+
+    plugin = PBSPlugin()
+    jobids = ("10", "11[2]", "12")
+    for jobid in jobids:
+        plugin._status.add(jobid)
+    assert [plugin._is_pending(jobid) for jobid in jobids] == [True, False, False]
+    assert log.read_text().split() == ["-f", "10", "11[2]", "12"]
@@ -0,0 +1,77 @@
+import os
+import subprocess
+
+import nipype.pipeline.engine as pe
+from nipype.interfaces.utility import Function
+from nipype.pipeline.plugins.base import SGELikeBatchManagerBase
+from nipype.pipeline.plugins.pilot import TaskQueue
+
+
+def increment(x):
+    return x + 1
+
+
+class LocalBatchPlugin(SGELikeBatchManagerBase):
+    """Run batch jobs as local subprocesses"""
+
+    _finished_states = ("done",)
+
+    def __init__(self, **kwargs):
+        super().__init__("", **kwargs)
+        self.jobs = {}
+
+    def _submit_batchtask(self, scriptfile, node):
+        jobid = len(self.jobs) + 1
+        self.jobs[jobid] = subprocess.Popen(["bash", scriptfile])
+        self._pending[jobid] = node.output_dir()
+        return jobid
+
+    def _query_status(self, jobids):
+        return {
+            str(jobid): "running" if proc.poll() is None else "done"
+            for jobid, proc in self.jobs.items()
+        }
+
+
+def test_task_queue(tmp_path):
+    queue = TaskQueue(tmp_path)
+    taskid = queue.put("/batch/node_a.pklz", n_procs=2)
+    assert queue.has_tasks()
+    # Tasks larger than the free slots wait for an idle worker
+    assert queue.claim("w1", 1, 4) == []
+    assert queue.claim("w1", 1, 1) == [(taskid, 2, "/batch/node_a.pklz")]
+    assert queue.claim("w2", 1, 1) == []
+
+    # The tasks of workers without heartbeat are queued again
+    queue.beat("w1")
+    assert queue.requeue_lost(60) == 0
+    os.utime(tmp_path / "workers" / "w1", (0, 0))
+    assert queue.requeue_lost(60) == 1
+    assert queue.claim("w2", 2, 2)[0][0] == taskid
+
+    assert not queue.is_done(taskid)
+    queue.finish("w2", taskid)
+    assert queue.is_done(taskid)
+    assert not queue.has_tasks()
+
+
+def test_pilots(tmp_path):
+    pipe = pe.Workflow(name="pipe", base_dir=str(tmp_path))
+    mapnode = pe.MapNode(Function(function=increment), iterfield=["x"], name="inc")
+    mapnode.inputs.x = [1, 2, 3, 4]
+    node = pe.Node(Function(function=increment), name="single")
+    node.inputs.x = 10
+    pipe.add_nodes([mapnode, node])
+    pipe.config["execution"]["poll_sleep_duration"] = 0.2
+
+    plugin = LocalBatchPlugin(
+        plugin_args={"pilots": 2, "pilot_slots": 2, "status_refresh": 0}
+    )
+    execgraph = pipe.run(plugin=plugin)
+    outputs = {n.name: n.result.outputs.out for n in execgraph.nodes()}
+    assert outputs == {"inc": [2, 3, 4, 5], "single": 11}
+
+    # Only the pilots were submitted, and they exit with the workflow
+    assert len(plugin.jobs) == 2
+    for proc in plugin.jobs.values():
+        assert proc.wait(timeout=30) == 0
@@ -3,6 +3,7 @@ from nipype.interfaces.utility import Function
 import nipype.pipeline.engine as pe
 import pytest
 from unittest.mock import patch
+import os
 import subprocess
 
 
@@ -34,3 +35,72 @@ def test_crashfile_creation(tmp_path):
         tmp_path.glob("crash*crasher*.txt")
     )
     assert len(crashfiles) == 1
+
+
+def increment(x):
+    return x + 1
+
+
+class ArrayPlugin(SGELikeBatchManagerBase):
+    """Run array jobs in the foreground, one task after the other"""
+
+    _array_index_var = "TASK_ID"
+
+    def __init__(self, **kwargs):
+        super().__init__("", **kwargs)
+        self.submitted = []
+
+    def _submit_batchtask(self, scriptfile, node, array_size=None):
+        self.submitted.append(array_size)
+        for index in range(1, (array_size or 1) + 1):
+            env = dict(os.environ, TASK_ID=str(index))
+            subprocess.check_call(["bash", scriptfile], env=env)
+        jobid = len(self.submitted)
+        self._pending[jobid] = node.output_dir()
+        return jobid
+
+    def _is_pending(self, taskid):
+        return False
+
+
+def test_array_jobs(tmp_path):
+    pipe = pe.Workflow(name="pipe", base_dir=str(tmp_path))
+    mapnode = pe.MapNode(Function(function=increment), iterfield=["x"], name="inc")
+    mapnode.inputs.x = [1, 2, 3]
+    # A different resource request is submitted separately
+    node = pe.Node(Function(function=increment), name="single")
+    node.plugin_args = {"qsub_args": "-l h_vmem=2G"}
+    node.inputs.x = 10
+    pipe.add_nodes([mapnode, node])
+
+    plugin = ArrayPlugin(plugin_args={"array_jobs": True})
+    execgraph = pipe.run(plugin=plugin)
+    # The subnodes, then the MapNode collating their results, and the node
+    assert sorted(plugin.submitted, key=str) == [3, None, None]
+    assert not plugin._pending and not plugin._array_tasks
+    outputs = {n.name: n.result.outputs.out for n in execgraph.nodes()}
+    assert outputs == {"inc": [2, 3, 4], "single": 11}
+
+
+class RunningPlugin(ArrayPlugin):
+    """Never report jobs finished"""
+
+    def _is_pending(self, taskid):
+        return True
+
+
+def test_completion_markers(tmp_path):
+    pipe = pe.Workflow(name="pipe", base_dir=str(tmp_path))
+    node = pe.Node(Function(function=increment), name="single")
+    node.inputs.x = 10
+    pipe.add_nodes([node])
+
+    # Results are collected from the markers, before the jobs are finished
+    plugin = RunningPlugin(plugin_args={"status_refresh": 0})
+    execgraph = pipe.run(plugin=plugin)
+    assert not plugin._markers and not plugin._pending
+    assert [n.result.outputs.out for n in execgraph.nodes()] == [11]
+    (marker,) = (tmp_path / "pipe" / "batch" / "completed").iterdir()
+    assert marker.read_text().strip() == str(
+        tmp_path / "pipe" / "single" / "result_single.pklz"
+    )
@@ -0,0 +1,61 @@
+import os
+
+import pytest
+
+from nipype.pipeline.plugins.slurm import SLURMPlugin
+
+FAKE_SQUEUE = """#!/bin/sh
+echo "$@" >> "{log}"
+cat "{states}"
+if [ -s "{error}" ]; then
+    cat "{error}" >&2
+    exit 1
+fi
+"""
+
+
+@pytest.fixture
+def fake_squeue(tmp_path, monkeypatch):
+    """A squeue command listing the states, or failing with the error, in files"""
+    states = tmp_path / "states"
+    error = tmp_path / "error"
+    log = tmp_path / "squeue.log"
+    squeue = tmp_path / "squeue"
+    squeue.write_text(FAKE_SQUEUE.format(log=log, states=states, error=error))
+    squeue.chmod(0o755)
+    monkeypatch.setenv("PATH", str(tmp_path), prepend=os.pathsep)
+    monkeypatch.chdir(tmp_path)
+    return states, error, log
+
+
+def test_slurm_bulk_status(fake_squeue):
+    states, error, log = fake_squeue
+    states.write_text("10 RUNNING\n11 PENDING\n12_1 RUNNING\n12_2 COMPLETED\n")
+    plugin = SLURMPlugin(plugin_args={"status_refresh": 3600})
+    for jobid in (10, 11, "12_1", "12_2", 13):
+        plugin._status.add(jobid)
+
+    pending = [plugin._is_pending(jobid) for jobid in (10, 11, "12_1", "12_2", 13)]
+    assert pending == [True, True, True, False, False]
+    calls = log.read_text().splitlines()
+    assert len(calls) == 1
+    assert "-r" in calls[0].split()
+    # Only the jobs tracked are queried
+    assert "10,11,12_1,12_2,13" in calls[0].split()
+
+    # Results are reused until the next refresh
+    states.write_text("10 COMPLETED\n")
+    assert plugin._is_pending(10)
+    plugin._status.refresh = 0
+    assert not plugin._is_pending(10)
+    assert len(log.read_text().splitlines()) == 2
+
+    # Jobs are pending while squeue lists nothing or times out
+    states.write_text("")
+    assert plugin._is_pending(11)
+    error.write_text("slurm_load_jobs error: Socket timed out on send/recv\n")
+    assert plugin._is_pending(11)
+
+    # Jobs forgotten by slurm are finished
+    error.write_text("slurm_load_jobs error: Invalid job id specified\n")
+    assert not plugin._is_pending(11)
@@ -4,11 +4,25 @@
 """
 import numpy as np
 import scipy.sparse as ssp
+import pickle
 import re
 
 from unittest import mock
 
-from nipype.pipeline.plugins.tools import report_crash
+import pytest
+
+import nipype.interfaces.utility as niu
+import nipype.pipeline.engine as pe
+from nipype.pipeline.plugins.tools import (
+    CompletionMarkers,
+    JobDescriptor,
+    JobStatusCache,
+    completion_marker,
+    critical_path_lengths,
+    descendant_counts,
+    mark_completed,
+    report_crash,
+)
 
 
 def test_report_crash():
@@ -33,6 +47,83 @@ def test_report_crash():
             assert mock_pickle_dump.call_count == 1
 
 
+def test_job_descriptor(tmpdir):
+    node = pe.Node(niu.IdentityInterface(fields=["a"]), name="n", mem_gb=2)
+    node.base_dir = tmpdir.strpath
+    node.inputs.a = list(range(10))
+    job = JobDescriptor(node)
+
+    assert job.fullname == "n"
+    assert job.interface == "nipype.interfaces.utility.base.IdentityInterface"
+    assert job.output_dir == node.output_dir()
+    assert (job.mem_gb, job.n_procs) == (2, 1)
+    with pytest.raises(AttributeError):
+        job.fullname = "m"
+
+    # Later changes to the node are not shipped
+    node.inputs.a = None
+    loaded = pickle.loads(pickle.dumps(job)).load()
+    assert loaded is not node
+    assert loaded.inputs.a == list(range(10))
+    assert loaded.output_dir() == node.output_dir()
+
+
+def test_job_priorities():
+    # A diamond (0 -> 1, 2 -> 3), and an isolated job (4)
+    dependents = [[1, 2], [3], [3], [], []]
+    assert critical_path_lengths(dependents, [1, 2, 5, 1, 1]) == [7, 3, 6, 1, 1]
+    assert descendant_counts(dependents) == [3, 1, 1, 0, 0]
+    # Estimated on larger graphs, counting shared descendants once per path
+    assert descendant_counts(dependents, exact_limit=4) == [4, 1, 1, 0, 0]
+
+
+def test_job_status_cache():
+    queries = []
+    states = {"1": "RUN", "2": "DONE"}
+
+    def query(jobids):
+        queries.append(sorted(jobids))
+        return dict(states)
+
+    cache = JobStatusCache(query, refresh=3600, finished=["DONE"])
+    for jobid in (1, 2, 3):
+        cache.add(jobid)
+    # A single query gives the status of all the jobs
+    assert [cache.is_pending(jobid) for jobid in (1, 2, 3)] == [True, False, False]
+    assert queries == [["1", "2", "3"]]
+
+    # Jobs submitted since the last query are pending until the next one
+    cache.discard(2)
+    cache.add(4)
+    assert cache.is_pending(4)
+    assert len(queries) == 1
+    cache.refresh = 0
+    assert not cache.is_pending(4)
+    assert queries[-1] == ["1", "3", "4"]
+
+
+def test_completion_markers(tmp_path):
+    pklfile = str(tmp_path / "node_20240101_000000_a.pklz")
+    pyscript = str(tmp_path / "pyscript_20240101_000000_b.py")
+    markers = CompletionMarkers(refresh=3600)
+    for path in (pklfile, pyscript):
+        markers.add(completion_marker(path))
+    assert markers.results_file(completion_marker(pklfile)) is None
+
+    # Markers are only listed again after refresh seconds
+    mark_completed(pklfile, "/a/result_a.pklz")
+    mark_completed(pyscript, "/b/result_b.pklz")
+    assert markers.results_file(completion_marker(pklfile)) is None
+    markers.refresh = 0
+    assert markers.results_file(completion_marker(pklfile)) == "/a/result_a.pklz"
+    markers.refresh = 3600
+    assert markers.results_file(completion_marker(pyscript)) == "/b/result_b.pklz"
+    assert sorted(p.name for p in (tmp_path / "completed").iterdir()) == [
+        "20240101_000000_a",
+        "20240101_000000_b",
+    ]
+
+
 """
 Can use the following code to test that a mapnode crash continues successfully
 Need to put this into a unit-test with a timeout
@@ -4,10 +4,11 @@
 """
 import os
 import getpass
+import pickle
 from socket import gethostname
 import sys
 import uuid
-from time import strftime
+from time import strftime, time
 from traceback import format_exception
 
 from ... import logging
@@ -16,6 +17,267 @@ from ...utils.filemanip import savepkl, crash2txt
 logger = logging.getLogger("nipype.workflow")
 
 
+def profile_key(node):
+    """
+    Identify the interface of a node, and the size of its input files.
+
+    The size is rounded to a power of two, so that runs on inputs of
+    comparable sizes share their :class:`~nipype.utils.profiler.ResourceProfiles`.
+    The inputs connected to other nodes are only accounted for when the
+    results of these nodes are available.
+    """
+    from ..engine.utils import walk_outputs
+
+    try:
+        node._get_inputs()
+    except Exception:
+        logger.debug("Profiling %s without its connected inputs.", node)
+
+    size = 0
+    for path, kind in walk_outputs(node.inputs.trait_get()):
+        if kind == "f":
+            try:
+                size += os.path.getsize(path)
+            except OSError:
+                pass
+    return "%s:%d" % (interface_name(node), size.bit_length())
+
+
+def interface_name(node):
+    """Return the fully qualified class name of the interface of a node"""
+    interface = type(node.interface)
+    return "%s.%s" % (interface.__module__, interface.__name__)
+
+
+def critical_path_lengths(dependents, weights):
+    """
+    Return the length of the longest path from every job to the end of the
+    graph, including the job itself.
+
+    ``dependents`` lists the jobs depending on every job, which must be in
+    topological order, and ``weights`` the (estimated) duration of every job.
+    """
+    lengths = list(weights)
+    for jobid in reversed(range(len(dependents))):
+        if dependents[jobid]:
+            lengths[jobid] += max(lengths[depid] for depid in dependents[jobid])
+    return lengths
+
+
+def descendant_counts(dependents, exact_limit=4096):
+    """
+    Return the number of jobs depending, directly or not, on every job.
+
+    ``dependents`` lists the jobs depending on every job, which must be in
+    topological order.  Descendants reached through several paths are
+    counted once by keeping the set of descendants of every job, which
+    takes O(N²) bits of memory and time for N jobs.  Above ``exact_limit``
+    jobs, the counts are estimated in linear time instead, by adding up
+    those of the dependents (capped at the number of jobs): the estimate is
+    exact for trees, and overcounts the descendants shared by dependents.
+    """
+    njobs = len(dependents)
+    if njobs > exact_limit:
+        counts = [0] * njobs
+        for jobid in reversed(range(njobs)):
+            total = sum(counts[depid] + 1 for depid in dependents[jobid])
+            counts[jobid] = min(total, njobs - 1)
+        return counts
+
+    # Sets of descendants as bitmasks, shared paths are only counted once
+    descendants = [0] * njobs
+    for jobid in reversed(range(njobs)):
+        for depid in dependents[jobid]:
+            descendants[jobid] |= descendants[depid] | (1 << depid)
+    return [bin(mask).count("1") for mask in descendants]
+
+
+class JobDescriptor:
+    """
+    Immutable description of a node submitted to a worker.
+
+    The node is pickled once, when the job is submitted, so that the master
+    process neither deep-copies it nor holds a reference to a node that may
+    still change while the job is queued. Workers rebuild the node with
+    :meth:`load`. The remaining attributes (name, interface class, output
+    directory and resource requirements) are available without loading it.
+    """
+
+    __slots__ = ("fullname", "interface", "output_dir", "mem_gb", "n_procs", "_node")
+
+    def __init__(self, node):
+        values = (
+            node.fullname,
+            "%s.%s" % (type(node.interface).__module__, type(node.interface).__name__),
+            node.output_dir(),
+            node.mem_gb,
+            node.n_procs,
+            pickle.dumps(node, protocol=pickle.HIGHEST_PROTOCOL),
+        )
+        for name, value in zip(self.__slots__, values):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("JobDescriptor objects are immutable")
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            object.__setattr__(self, name, value)
+
+    @property
+    def nbytes(self):
+        """Size of the pickled node, in bytes"""
+        return len(self._node)
+
+    def __repr__(self):
+        return "JobDescriptor(%s, %s)" % (self.fullname, self.interface)
+
+    def load(self):
+        """Rebuild the node"""
+        return pickle.loads(self._node)
+
+
+class JobStatusCache:
+    """
+    Status of the jobs submitted to a batch system, queried in bulk.
+
+    ``query`` is called with the ids of all the jobs tracked, and returns
+    the states of the jobs listed by the batch system, keyed by job id, or
+    ``None`` if the batch system could not be queried.  It is called at most
+    every ``refresh`` seconds, when the status of a job is requested.  Jobs
+    are pending until they are not listed anymore or their state is one of
+    ``finished``, and jobs submitted since the last query are pending until
+    the next one.
+    """
+
+    def __init__(self, query, refresh=5, finished=()):
+        self._query = query
+        self.refresh = float(refresh)
+        self.finished = set(finished)
+        self._states = {}
+        self._tracked = {}
+        self._last_query = None
+        self._queries = 0
+
+    def add(self, jobid):
+        """Track a job submitted to the batch system"""
+        self._tracked[str(jobid)] = self._queries
+
+    def discard(self, jobid):
+        """Stop tracking a job"""
+        self._tracked.pop(str(jobid), None)
+
+    def is_pending(self, jobid):
+        """Whether a job is queued or running"""
+        jobid = str(jobid)
+        added = self._tracked.setdefault(jobid, self._queries)
+        if self._last_query is None or time() - self._last_query >= self.refresh:
+            self._update()
+        if self._queries == added or self._states is None:
+            return True
+        state = self._states.get(jobid)
+        return state is not None and state not in self.finished
+
+    def _update(self):
+        self._last_query = time()
+        self._queries += 1
+        self._states = self._query(list(self._tracked))
+        logger.debug(
+            "Queried the status of %d jobs (%s listed).",
+            len(self._tracked),
+            "none" if self._states is None else len(self._states),
+        )
+
+
+def completion_marker(path):
+    """
+    Return the completion marker of the node pickled in, or run by, ``path``.
+
+    Markers are written in the ``completed`` directory next to the pickle
+    (see :func:`pickle_node`) or python script (see :func:`create_pyscript`)
+    of the node, and named after their suffix.
+    """
+    batch_dir, name = os.path.split(path)
+    suffix = os.path.splitext(name)[0].split("_", 1)[1]
+    return os.path.join(batch_dir, "completed", suffix)
+
+
+def read_completion_marker(marker):
+    """Return the path to the results listed in a marker, or None if missing"""
+    try:
+        with open(marker) as fp:
+            return fp.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def mark_completed(path, resultsfile):
+    """Write the completion marker of a node, with the path to its results"""
+    marker = completion_marker(path)
+    marker_dir, name = os.path.split(marker)
+    os.makedirs(marker_dir, exist_ok=True)
+    tmpfile = os.path.join(marker_dir, "." + name)
+    with open(tmpfile, "w") as fp:
+        fp.write(resultsfile + "\n")
+    os.rename(tmpfile, marker)
+
+
+class CompletionMarkers:
+    """
+    Completion markers of the jobs submitted to a batch system, listed in bulk.
+
+    The directories of all the markers tracked are listed at most every
+    ``refresh`` seconds, when the results of a job are requested, so that
+    the results of finished jobs are found without looking into the
+    directory of every node.
+    """
+
+    def __init__(self, refresh=1):
+        self.refresh = float(refresh)
+        self._tracked = set()
+        self._completed = set()
+        self._last_listing = None
+
+    def add(self, marker):
+        """Track the marker of a job submitted to the batch system"""
+        self._tracked.add(marker)
+
+    def discard(self, marker):
+        """Stop tracking a marker"""
+        self._tracked.discard(marker)
+        self._completed.discard(marker)
+
+    def results_file(self, marker):
+        """Return the results file listed in a marker, or None if not written"""
+        if marker not in self._completed:
+            if (
+                self._last_listing is None
+                or time() - self._last_listing >= self.refresh
+            ):
+                self._update()
+            if marker not in self._completed:
+                return None
+        return read_completion_marker(marker)
+
+    def _update(self):
+        self._last_listing = time()
+        markers = {}
+        for marker in self._tracked - self._completed:
+            marker_dir, name = os.path.split(marker)
+            markers.setdefault(marker_dir, []).append(name)
+        for marker_dir, names in markers.items():
+            try:
+                listed = set(os.listdir(marker_dir))
+            except FileNotFoundError:
+                continue
+            self._completed.update(
+                os.path.join(marker_dir, name) for name in names if name in listed
+            )
+
+
 def report_crash(node, traceback=None, hostname=None):
     """Writes crash related information to a file"""
     name = node._id
@@ -92,19 +354,31 @@ def report_nodes_not_run(notrun):
         logger.info("***********************************")
 
 
-def create_pyscript(node, updatehash=False, store_exception=True):
-    # pickle node
+def get_batch_dir(node):
+    """Return the directory of the files submitting a node to a batch system"""
+    if node._hierarchy:
+        return os.path.join(node.base_dir, node._hierarchy.split(".")[0], "batch")
+    return os.path.join(node.base_dir, "batch")
+
+
+def pickle_node(node, updatehash=False):
+    """Pickle a node to run in a batch job, return the file and its suffix"""
     timestamp = strftime("%Y%m%d_%H%M%S")
     if node._hierarchy:
         suffix = f"{timestamp}_{node._hierarchy}_{node._id}"
-        batch_dir = os.path.join(node.base_dir, node._hierarchy.split(".")[0], "batch")
     else:
         suffix = f"{timestamp}_{node._id}"
-        batch_dir = os.path.join(node.base_dir, "batch")
-    if not os.path.exists(batch_dir):
-        os.makedirs(batch_dir)
+    batch_dir = get_batch_dir(node)
+    os.makedirs(batch_dir, exist_ok=True)
     pkl_file = os.path.join(batch_dir, "node_%s.pklz" % suffix)
     savepkl(pkl_file, dict(node=node, updatehash=updatehash))
+    return pkl_file, suffix
+
+
+def create_pyscript(node, updatehash=False, store_exception=True):
+    # pickle node
+    pkl_file, suffix = pickle_node(node, updatehash=updatehash)
+    batch_dir = os.path.dirname(pkl_file)
     mpl_backend = node.config["execution"]["matplotlib_backend"]
     # create python script to load and trap exception
     cmdstr = """import os
@@ -160,6 +434,11 @@ except Exception as e:
         cmdstr += """
     savepkl(resultsfile, dict(result=result, hostname=gethostname(),
                               traceback=traceback))
+else:
+    resultsfile = os.path.join(info['node'].output_dir(),
+                               'result_%%s.pklz'%%info['node'].name)
+from nipype.pipeline.plugins.tools import mark_completed
+mark_completed(pklfile, resultsfile)
 """
     else:
         cmdstr += """
@@ -170,9 +449,38 @@ except Exception as e:
         from nipype.pipeline.plugins.base import report_crash
         report_crash(info['node'], traceback, gethostname())
     raise Exception(e)
+else:
+    resultsfile = os.path.join(info['node'].output_dir(),
+                               'result_%%s.pklz'%%info['node'].name)
+from nipype.pipeline.plugins.tools import mark_completed
+mark_completed(pklfile, resultsfile)
 """
     cmdstr = cmdstr % (mpl_backend, pkl_file, batch_dir, node.config, suffix)
     pyscript = os.path.join(batch_dir, "pyscript_%s.py" % suffix)
     with open(pyscript, "w") as fp:
         fp.writelines(cmdstr)
     return pyscript
+
+
+def create_runner(batch_dir, store_exception=True):
+    """Write a python script running the node pickled in its first argument
+
+    A single runner can replace the scripts of :func:`create_pyscript` for
+    all the nodes of a workflow, as in::
+
+        python <batch_dir>/runner.py <batch_dir>/node_<suffix>.pklz
+
+    """
+    runner = os.path.join(batch_dir, "runner.py")
+    cmdstr = """import os
+import sys
+
+# disable ET for any submitted job
+os.environ.setdefault('NIPYPE_NO_ET', '1')
+from nipype.pipeline.plugins.pilot import run_task
+
+run_task(sys.argv[1], store_exception=%s)
+"""
+    with open(runner, "w") as fp:
+        fp.writelines(cmdstr % bool(store_exception))
+    return runner
@@ -4,7 +4,10 @@
 Created on 20 Apr 2010
 
 logging options : INFO, DEBUG
-hash_method : content, timestamp
+hash_method : content, sampled, timestamp
+hash_algorithm : md5, sha1, sha256, blake2b, blake2s, xxh64, xxh3_128
+hash_format : 1, 2
+pkl_compression : gzip, gzip_fast, none, zstd, lz4
 
 @author: Chris Filo Gorgolewski
 """
@@ -42,6 +45,10 @@ log_rotate = 4
 create_report = true
 crashdump_dir = {crashdump_dir}
 hash_method = timestamp
+hash_algorithm = md5
+hash_format = 1
+hash_sample_blocks = 16
+hash_sample_threshold = 268435456
 job_finished_timeout = 5
 keep_inputs = false
 local_hash_check = true
@@ -55,9 +62,11 @@ crashfile_format = pklz
 stop_on_first_crash = false
 stop_on_first_rerun = false
 use_relative_paths = false
+use_cache_index = false
 stop_on_unknown_version = false
 write_provenance = false
 parameterize_dirs = true
+pkl_compression = gzip
 poll_sleep_duration = 2
 xvfb_max_wait = 10
 check_version = true
@@ -66,6 +75,7 @@ check_version = true
 enabled = false
 sample_frequency = 1
 summary_append = true
+summary_format = json
 
 [check]
 interval = 1209600
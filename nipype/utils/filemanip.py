@@ -8,6 +8,7 @@ import errno
 import subprocess as sp
 import gzip
 import hashlib
+import io
 import locale
 from hashlib import md5
 import os
@@ -16,13 +17,31 @@ import re
 import shutil
 import contextlib
 import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
 from pathlib import Path
+from stat import S_ISREG
 import simplejson as json
 from time import sleep, time
 
 from .. import logging, config, __version__ as version
 from .misc import is_container
 
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4frame
+except ImportError:
+    lz4frame = None
+
 fmlogger = logging.getLogger("nipype.utils")
 
 related_filetype_sets = [(".hdr", ".img", ".mat"), (".nii", ".mat"), (".BRIK", ".HEAD")]
@@ -152,10 +171,69 @@ def check_forhash(filename):
         return False, None
 
 
-def hash_infile(afile, chunk_len=8192, crypto=hashlib.md5, raise_notfound=False):
+HASH_CHUNK_LEN = 2**20
+"""Size of the blocks read when hashing the contents of a file"""
+
+HASH_ALGORITHMS = {
+    "md5": hashlib.md5,
+    "sha1": hashlib.sha1,
+    "sha256": hashlib.sha256,
+    "blake2b": hashlib.blake2b,
+    "blake2s": hashlib.blake2s,
+}
+"""Hash algorithms that can be selected with ``execution.hash_algorithm``"""
+if xxhash is not None:
+    HASH_ALGORITHMS["xxh64"] = xxhash.xxh64
+    if hasattr(xxhash, "xxh3_128"):
+        HASH_ALGORITHMS["xxh3_128"] = xxhash.xxh3_128
+
+
+def get_hash_algorithm(name=None):
+    """
+    Return the hash constructor registered as ``name``.
+
+    If ``name`` is not given, the ``execution.hash_algorithm`` setting of
+    the configuration is used. The ``xxh*`` algorithms are only available
+    when the optional ``xxhash`` package is installed.
+
+    >>> get_hash_algorithm('md5') is hashlib.md5
+    True
+
+    """
+    if name is None:
+        name = config.get("execution", "hash_algorithm", "md5")
+    try:
+        return HASH_ALGORITHMS[name.lower()]
+    except KeyError:
+        raise ValueError(
+            'Unknown hash algorithm "%s", available algorithms are: %s.'
+            % (name, ", ".join(sorted(HASH_ALGORITHMS)))
+        ) from None
+
+
+@lru_cache(maxsize=65536)
+def _hash_infile(afile, device, inode, size, mtime_ns, chunk_len, crypto):
+    """Hash the contents of a file, memoized on its path and stat signature"""
+    crypto_obj = crypto()
+    with open(afile, "rb") as fp:
+        while True:
+            data = fp.read(chunk_len)
+            if not data:
+                break
+            crypto_obj.update(data)
+    return crypto_obj.hexdigest()
+
+
+def hash_infile(
+    afile, chunk_len=HASH_CHUNK_LEN, crypto=hashlib.md5, raise_notfound=False
+):
     """
     Computes hash of a file using 'crypto' module
 
+    Digests are cached for the lifetime of the process, keyed by the file
+    path, device, inode, size and modification time, so that a file is
+    only read again if it has been replaced or modified.
+
     >>> hash_infile('smri_ants_registration_settings.json')
     'f225785dfb0db9032aa5a0e4f2c730ad'
 
@@ -170,21 +248,110 @@ def hash_infile(afile, chunk_len=8192, crypto=hashlib.md5, raise_notfound=False)
 
 
     """
-    if not op.isfile(afile):
+    try:
+        fstat = os.stat(afile)
+    except (OSError, ValueError):
+        fstat = None
+    if fstat is None or not S_ISREG(fstat.st_mode):
         if raise_notfound:
             raise RuntimeError('File "%s" not found.' % afile)
         return None
 
+    return _hash_infile(
+        op.abspath(afile),
+        fstat.st_dev,
+        fstat.st_ino,
+        fstat.st_size,
+        fstat.st_mtime_ns,
+        chunk_len,
+        crypto,
+    )
+
+
+@lru_cache(maxsize=65536)
+def _hash_sampled(afile, device, inode, size, mtime_ns, nblocks, chunk_len, crypto):
+    """Hash the size and strided blocks of a file, memoized like _hash_infile"""
     crypto_obj = crypto()
+    crypto_obj.update(str(size).encode())
     with open(afile, "rb") as fp:
-        while True:
-            data = fp.read(chunk_len)
-            if not data:
-                break
-            crypto_obj.update(data)
+        crypto_obj.update(fp.read(chunk_len))  # header
+        for i in range(1, nblocks + 1):
+            fp.seek(i * (size - chunk_len) // nblocks)
+            crypto_obj.update(fp.read(chunk_len))
     return crypto_obj.hexdigest()
 
 
+def hash_sampled(
+    afile,
+    threshold=None,
+    nblocks=None,
+    chunk_len=HASH_CHUNK_LEN,
+    crypto=hashlib.md5,
+    raise_notfound=False,
+):
+    """
+    Computes hash of the size and a sample of the contents of a file
+
+    Files smaller than ``threshold`` bytes are hashed entirely, as with
+    :func:`hash_infile`. For larger files, only the size, the first
+    ``chunk_len`` bytes (the header) and ``nblocks`` blocks of ``chunk_len``
+    bytes evenly strided over the rest of the file (the last one ending
+    at the end of the file) are hashed. ``threshold`` and ``nblocks``
+    default to the ``hash_sample_threshold`` and ``hash_sample_blocks``
+    settings of the ``execution`` section.
+
+    >>> hash_sampled('surf01.vtk') == hash_infile('surf01.vtk')
+    True
+
+    """
+    if threshold is None:
+        threshold = int(config.get("execution", "hash_sample_threshold"))
+    if nblocks is None:
+        nblocks = int(config.get("execution", "hash_sample_blocks"))
+
+    try:
+        fstat = os.stat(afile)
+    except (OSError, ValueError):
+        fstat = None
+    if fstat is None or not S_ISREG(fstat.st_mode):
+        if raise_notfound:
+            raise RuntimeError('File "%s" not found.' % afile)
+        return None
+
+    if fstat.st_size < max(threshold, (nblocks + 1) * chunk_len):
+        return hash_infile(afile, chunk_len=chunk_len, crypto=crypto)
+
+    return _hash_sampled(
+        op.abspath(afile),
+        fstat.st_dev,
+        fstat.st_ino,
+        fstat.st_size,
+        fstat.st_mtime_ns,
+        nblocks,
+        chunk_len,
+        crypto,
+    )
+
+
+def get_hash_function(hash_method, crypto=hashlib.md5):
+    """
+    Return a function computing the hash of a file with ``hash_method``
+    (one of ``timestamp``, ``content`` or ``sampled``).
+
+    >>> get_hash_function('timestamp') is hash_timestamp
+    True
+
+    """
+    hash_method = hash_method.lower()
+    if hash_method == "timestamp":
+        return hash_timestamp
+    if hash_method == "content":
+        return partial(hash_infile, crypto=crypto)
+    if hash_method == "sampled":
+        return partial(hash_sampled, crypto=crypto)
+    raise Exception("Unknown hash method: %s" % hash_method)
+
+
 def hash_timestamp(afile):
     """Computes md5 hash of the timestamp of a file"""
     md5hex = None
@@ -197,6 +364,39 @@ def hash_timestamp(afile):
     return md5hex
 
 
+def hash_infiles(
+    filenames, hash_method="content", crypto=hashlib.md5, max_workers=None
+):
+    """
+    Hash a collection of files, each of them only once.
+
+    With ``hash_method="content"`` or ``"sampled"``, files are hashed with
+    ``crypto`` and read concurrently on a pool of up to ``max_workers``
+    threads (by default, the number of CPUs up to 8), since hashing large
+    files releases the GIL.
+
+    Returns
+    -------
+    hashes : dict
+        ``{filename: hash}`` for every existing file in ``filenames``.
+
+    """
+    filenames = [fname for fname in set(filenames) if op.isfile(fname)]
+    if not filenames:
+        return {}
+
+    hashfn = get_hash_function(hash_method, crypto=crypto)
+    if hashfn is hash_timestamp:
+        return {fname: hash_timestamp(fname) for fname in filenames}
+
+    if max_workers is None:
+        max_workers = min(8, os.cpu_count() or 1)
+    if max_workers < 2 or len(filenames) < 2:
+        return {fname: hashfn(fname) for fname in filenames}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(filenames))) as pool:
+        return dict(zip(filenames, pool.map(hashfn, filenames)))
+
+
 def _parse_mount_table(exit_code, output):
     """Parses the output of ``mount`` to produce (path, fs_type) pairs
 
@@ -284,6 +484,7 @@ def copyfile(
     hashmethod=None,
     use_hardlink=False,
     copy_related_files=True,
+    quick_check=False,
 ):
     """Copy or link ``originalfile`` to ``newfile``.
 
@@ -293,6 +494,9 @@ def copyfile(
     If a hard link is not created and ``copy`` is False, then a symbolic
     link is created.
 
+    An existing regular ``newfile`` of a different size than
+    ``originalfile`` is replaced without hashing either file.
+
     Parameters
     ----------
     originalfile : str
@@ -308,6 +512,11 @@ def copyfile(
     copy_related_files : Bool
         specifies whether to also operate on related files, as defined in
         ``related_filetype_sets``
+    quick_check : Bool
+        specifies whether an existing regular ``newfile`` with the size and
+        modification time of ``originalfile`` is kept without hashing them
+        (default=False). Copies, and existing files found identical by
+        hashing, are then given the modification time of ``originalfile``
 
     Returns
     -------
@@ -346,6 +555,8 @@ def copyfile(
     #       to other file                           (unlink)
     #   regular file
     #       hard link to originalfile               (keep)
+    #       different size                          (unlink)
+    #       same size and mtime, if quick_check     (keep)
     #       copy of file (same hash)                (keep)
     #       different file (diff hash)              (unlink)
     keep = False
@@ -362,18 +573,28 @@ def copyfile(
         elif posixpath.samefile(newfile, originalfile):
             keep = True
         else:
-            if hashmethod == "timestamp":
-                hashfn = hash_timestamp
-            elif hashmethod == "content":
-                hashfn = hash_infile
+            orig_stat, new_stat = os.stat(originalfile), os.stat(newfile)
+            if orig_stat.st_size != new_stat.st_size:
+                fmlogger.debug("File: %s already exists, with another size", newfile)
+            elif quick_check and orig_stat.st_mtime_ns == new_stat.st_mtime_ns:
+                keep = True
             else:
-                raise AttributeError("Unknown hash method found:", hashmethod)
-            newhash = hashfn(newfile)
-            fmlogger.debug(
-                "File: %s already exists,%s, copy:%d", newfile, newhash, copy
-            )
-            orighash = hashfn(originalfile)
-            keep = newhash == orighash
+                if hashmethod == "timestamp":
+                    hashfn = hash_timestamp
+                elif hashmethod == "content":
+                    hashfn = hash_infile
+                elif hashmethod == "sampled":
+                    hashfn = hash_sampled
+                else:
+                    raise AttributeError("Unknown hash method found:", hashmethod)
+                newhash = hashfn(newfile)
+                fmlogger.debug(
+                    "File: %s already exists,%s, copy:%d", newfile, newhash, copy
+                )
+                orighash = hashfn(originalfile)
+                keep = newhash == orighash
+                if keep and quick_check:
+                    os.utime(newfile, ns=(new_stat.st_atime_ns, orig_stat.st_mtime_ns))
         if keep:
             fmlogger.debug(
                 "File: %s already exists, not overwriting, copy:%d", newfile, copy
@@ -408,9 +629,13 @@ def copyfile(
     if not keep:
         try:
             fmlogger.debug("Copying File: %s->%s", newfile, originalfile)
-            shutil.copyfile(originalfile, newfile)
+            _copy_data(originalfile, newfile)
         except shutil.Error as e:
             fmlogger.warning(str(e))
+        else:
+            if quick_check:
+                orig_stat = os.stat(originalfile)
+                os.utime(newfile, ns=(orig_stat.st_atime_ns, orig_stat.st_mtime_ns))
 
     # Associated files
     if copy_related_files:
@@ -427,11 +652,41 @@ def copyfile(
                     hashmethod=hashmethod,
                     use_hardlink=use_hardlink,
                     copy_related_files=False,
+                    quick_check=quick_check,
                 )
 
     return newfile
 
 
+def _copy_data(originalfile, newfile):
+    """
+    Copy the contents of ``originalfile`` to ``newfile``.
+
+    Where available, ``os.copy_file_range`` lets the kernel copy the data
+    without moving it through user space, or share its blocks (reflink) on
+    filesystems that support it. Otherwise, or if the filesystems involved
+    cannot, ``shutil.copyfile`` is used.
+    """
+    if hasattr(os, "copy_file_range") and op.isfile(originalfile):
+        with open(originalfile, "rb") as fsrc, open(newfile, "wb") as fdst:
+            size = os.fstat(fsrc.fileno()).st_size
+            copied = 0
+            try:
+                while copied < size:
+                    ncopied = os.copy_file_range(
+                        fsrc.fileno(), fdst.fileno(), size - copied
+                    )
+                    if not ncopied:
+                        break
+                    copied += ncopied
+            except OSError as e:
+                fmlogger.debug("Cannot copy %s in kernel: %s", originalfile, e)
+            else:
+                if copied == size:
+                    return
+    shutil.copyfile(originalfile, newfile)
+
+
 def get_related_files(filename, include_this_file=True):
     """Returns a list of related files, as defined in
     ``related_filetype_sets``, for a filename. (e.g., Nifti-Pair, Analyze (SPM)
@@ -572,11 +827,68 @@ def loadcrash(infile, *args):
         raise ValueError("Only pickled crashfiles are supported")
 
 
-def loadpkl(infile):
-    """Load a zipped or plain cPickled file."""
+PKL_COMPRESSIONS = {
+    "none": partial(open, mode="wb"),
+    "gzip": partial(gzip.open, mode="wb"),
+    "gzip_fast": partial(gzip.open, mode="wb", compresslevel=1),
+}
+"""Codecs of ``.pklz`` files that can be selected with ``execution.pkl_compression``"""
+if zstandard is not None:
+    PKL_COMPRESSIONS["zstd"] = partial(zstandard.open, mode="wb")
+if lz4frame is not None:
+    PKL_COMPRESSIONS["lz4"] = partial(lz4frame.open, mode="wb")
+
+_PKL_MAGICS = (
+    (b"\x1f\x8b", "gzip", gzip),
+    (b"\x28\xb5\x2f\xfd", "zstandard", zstandard),
+    (b"\x04\x22\x4d\x18", "lz4", lz4frame),
+)
+_PKL_METADATA_MAXLEN = 4096
+
+
+def _open_pkl(infile):
+    """Open a pickle file for reading, decompressing it by its magic number"""
+    with open(infile, "rb") as fp:
+        magic = fp.read(4)
+    for prefix, package, module in _PKL_MAGICS:
+        if magic.startswith(prefix):
+            if module is None:
+                raise RuntimeError(
+                    "Loading %s requires the %s package." % (infile, package)
+                )
+            pkl_file = module.open(infile, "rb")
+            if not hasattr(pkl_file, "peek"):
+                # Read lines from unbuffered streams (e.g., of zstandard)
+                pkl_file = io.BufferedReader(pkl_file)
+            return pkl_file
+    return open(infile, "rb")
+
+
+def _rewind_pkl(pkl_file, infile, offset):
+    """Return ``pkl_file`` at ``offset``, opened again if it cannot seek back"""
+    try:
+        pkl_file.seek(offset)
+        return pkl_file
+    except OSError:
+        # Decompression streams may only seek forward
+        pkl_file.close()
+        pkl_file = _open_pkl(infile)
+        pkl_file.read(offset)
+        return pkl_file
+
+
+def loadpkl(infile, appendix=False):
+    """
+    Load a zipped or plain cPickled file.
+
+    The file is decompressed as it is unpickled, whatever codec of
+    :data:`PKL_COMPRESSIONS` wrote it.  With ``appendix=True``, the record
+    stored next to the main one by :func:`savepkl` is loaded as well, and a
+    ``(record, appendix)`` tuple is returned (``appendix`` is ``None`` if
+    the file has none).  Otherwise, reading stops after the main record.
+    """
     infile = Path(infile)
     fmlogger.debug("Loading pkl: %s", infile)
-    pklopen = gzip.open if infile.suffix == ".pklz" else open
 
     t = time()
     timeout = float(config.get("execution", "job_finished_timeout"))
@@ -595,59 +907,71 @@ def loadpkl(infile):
         )
         raise OSError(error_message)
 
-    with pklopen(str(infile), "rb") as pkl_file:
-        pkl_contents = pkl_file.read()
-
-    pkl_metadata = None
+    pkl_file = _open_pkl(str(infile))
+    try:
+        pkl_metadata = None
 
-    # Look if pkl file contains version metadata
-    idx = pkl_contents.find(b"\n")
-    if idx >= 0:
+        # Look if pkl file contains version metadata
+        line = pkl_file.readline(_PKL_METADATA_MAXLEN)
         try:
-            pkl_metadata = json.loads(pkl_contents[:idx])
-        except (UnicodeDecodeError, json.JSONDecodeError):
+            if not line.endswith(b"\n"):
+                raise ValueError
+            pkl_metadata = json.loads(line)
+        except (ValueError, UnicodeDecodeError):
             # Could not get version info
-            pass
-        else:
-            # On success, skip JSON metadata
-            pkl_contents = pkl_contents[idx + 1 :]
+            pkl_file = _rewind_pkl(pkl_file, str(infile), 0)
+        start = pkl_file.tell()
 
-    # Pickle files may contain relative paths that must be resolved relative
-    # to the working directory, so use indirectory while attempting to load
-    unpkl = None
-    try:
-        with indirectory(infile.parent):
-            unpkl = pickle.loads(pkl_contents)
-    except UnicodeDecodeError:
-        # Was this pickle created with Python 2.x?
-        with indirectory(infile.parent):
-            unpkl = pickle.loads(pkl_contents, fix_imports=True, encoding="utf-8")
-        fmlogger.info("Successfully loaded pkl in compatibility mode.")
-    # Unpickling problems
-    except Exception as e:
-        if pkl_metadata and "version" in pkl_metadata:
-            if pkl_metadata["version"] != version:
-                fmlogger.error(
-                    """\
+        # Pickle files may contain relative paths that must be resolved relative
+        # to the working directory, so use indirectory while attempting to load
+        unpkl = None
+        try:
+            with indirectory(infile.parent):
+                unpkl = pickle.load(pkl_file)
+                extra = _load_appendix(pkl_file) if appendix else None
+        except UnicodeDecodeError:
+            # Was this pickle created with Python 2.x?
+            pkl_file = _rewind_pkl(pkl_file, str(infile), start)
+            with indirectory(infile.parent):
+                unpkl = pickle.load(pkl_file, fix_imports=True, encoding="utf-8")
+                extra = None
+            fmlogger.info("Successfully loaded pkl in compatibility mode.")
+        # Unpickling problems
+        except Exception as e:
+            if pkl_metadata and "version" in pkl_metadata:
+                if pkl_metadata["version"] != version:
+                    fmlogger.error(
+                        """\
 Attempted to open a results file generated by Nipype version %s, \
 with an incompatible Nipype version (%s)""",
-                    pkl_metadata["version"],
-                    version,
-                )
-                raise e
-        fmlogger.warning(
-            """\
+                        pkl_metadata["version"],
+                        version,
+                    )
+                    raise e
+            fmlogger.warning(
+                """\
 No metadata was found in the pkl file. Make sure you are currently using \
 the same Nipype version from the generated pkl."""
-        )
-        raise e
+            )
+            raise e
+    finally:
+        pkl_file.close()
 
     if unpkl is None:
         raise ValueError("Loading %s resulted in None." % infile)
 
+    if appendix:
+        return unpkl, extra
     return unpkl
 
 
+def _load_appendix(pkl_file):
+    try:
+        return pickle.load(pkl_file)
+    except EOFError:
+        return None
+
+
 def crash2txt(filename, record):
     """Write out plain text crash file"""
     with open(filename, "w") as fp:
@@ -680,21 +1004,36 @@ def read_stream(stream, logger=None, encoding=None):
     return out.splitlines()
 
 
-def savepkl(filename, record, versioning=False):
-    from io import BytesIO
+def savepkl(filename, record, versioning=False, appendix=None):
+    """
+    Pickle ``record`` into ``filename``, atomically replacing it.
 
-    with BytesIO() as f:
-        if versioning:
-            metadata = json.dumps({"version": version})
-            f.write(metadata.encode("utf-8"))
-            f.write(b"\n")
-        pickle.dump(record, f)
-        content = f.getvalue()
+    The pickle is streamed with the highest protocol, through the codec set
+    with ``execution.pkl_compression`` if ``filename`` ends in ``.pklz``.
+    A non-``None`` ``appendix`` is pickled after ``record`` in the same
+    file, so that readers not interested in it can stop before it.
+    """
+    if filename.endswith(".pklz"):
+        compression = config.get("execution", "pkl_compression", "gzip")
+        try:
+            pkl_open = PKL_COMPRESSIONS[compression.lower()]
+        except KeyError:
+            raise ValueError(
+                'Unknown pkl compression "%s", available codecs are: %s.'
+                % (compression, ", ".join(sorted(PKL_COMPRESSIONS)))
+            ) from None
+    else:
+        pkl_open = PKL_COMPRESSIONS["none"]
 
-    pkl_open = gzip.open if filename.endswith(".pklz") else open
     tmpfile = filename + ".tmp"
-    with pkl_open(tmpfile, "wb") as pkl_file:
-        pkl_file.write(content)
+    with pkl_open(tmpfile) as pkl_file:
+        if versioning:
+            metadata = json.dumps({"version": version})
+            pkl_file.write(metadata.encode("utf-8"))
+            pkl_file.write(b"\n")
+        pickle.dump(record, pkl_file, protocol=pickle.HIGHEST_PROTOCOL)
+        if appendix is not None:
+            pickle.dump(appendix, pkl_file, protocol=pickle.HIGHEST_PROTOCOL)
     for _ in range(5):
         try:
             os.rename(tmpfile, filename)
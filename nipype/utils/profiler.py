@@ -22,6 +22,24 @@ resource_monitor = config.resource_monitor
 # Init variables
 _MB = 1024.0**2
 
+SAMPLE_DTYPE = np.dtype(
+    [("time", "<f8"), ("cpus", "<f4"), ("rss_MiB", "<f4"), ("vms_MiB", "<f4")]
+)
+"""Layout of the records of the binary logs written by :class:`ResourceMonitor`"""
+
+
+def load_resource_samples(fname):
+    """
+    Load the samples logged by a :class:`ResourceMonitor` as a record array.
+
+    The file is memory-mapped, and a trailing partial record (as left by a
+    process killed while writing) is ignored.
+    """
+    nsamples = os.path.getsize(fname) // SAMPLE_DTYPE.itemsize
+    if not nsamples:
+        return np.zeros(0, dtype=SAMPLE_DTYPE)
+    return np.memmap(fname, dtype=SAMPLE_DTYPE, mode="r", shape=(nsamples,))
+
 
 class ResourceMonitorMock:
     """A mock class to use when the monitor is disabled."""
@@ -41,10 +59,53 @@ class ResourceMonitorMock:
         return {}
 
 
+def _pack_sample(processes, cpu_interval=None):
+    """Sum the usage of ``processes`` into a binary record of :data:`SAMPLE_DTYPE`"""
+    cpu = 0.0
+    rss = 0.0
+    vms = 0.0
+    for i, proc in enumerate(processes):
+        try:
+            with proc.oneshot():
+                cpu += proc.cpu_percent(interval=None if i else cpu_interval)
+                mem_info = proc.memory_info()
+                rss += mem_info.rss
+                vms += mem_info.vms
+        except psutil.NoSuchProcess:
+            pass
+
+    record = np.zeros(1, dtype=SAMPLE_DTYPE)
+    record[0] = (time(), cpu, rss / _MB, vms / _MB)
+    return record.tobytes()
+
+
+_SAMPLER_REGISTRY = None
+
+
+def use_resource_sampler(registry):
+    """
+    Have the resource monitors of this process register with a
+    :class:`ResourceSampler` (``registry`` is its directory), instead of
+    starting sampling threads. ``None`` restores the threads.
+    """
+    global _SAMPLER_REGISTRY
+    _SAMPLER_REGISTRY = registry
+
+
 class ResourceMonitor(threading.Thread):
     """
     A ``Thread`` to monitor a specific PID with a certain frequency
     to a file
+
+    Samples are appended to the file as fixed-width binary records
+    (:data:`SAMPLE_DTYPE`), which :func:`load_resource_samples` reads back.
+    Only their peaks and means are returned by :meth:`stop`, so that the
+    results of interfaces do not grow with their run time: the trace stays
+    in the file, whose path is kept in the runtime (``resmon``).
+
+    In processes set up with :func:`use_resource_sampler`, no thread is
+    started: the PID is registered with the shared :class:`ResourceSampler`
+    between :meth:`start` and :meth:`stop`, which appends samples to the file.
     """
 
     def __init__(self, pid, freq=5, fname=None, python=True):
@@ -57,9 +118,16 @@ class ResourceMonitor(threading.Thread):
         if fname is None:
             fname = ".proc-%d_time-%s_freq-%0.2f" % (pid, time(), freq)
         self._fname = os.path.abspath(fname)
-        self._logfile = open(self._fname, "w")
+        # The sampler appends to the file as well
+        self._logfile = open(self._fname, "ab")
+        self._logfile.truncate(0)
         self._freq = freq
         self._python = python
+        self._registration = None
+        if _SAMPLER_REGISTRY is not None:
+            self._registration = os.path.join(
+                _SAMPLER_REGISTRY, os.path.basename(self._fname)
+            )
 
         # Leave process initialized and make first sample
         self._process = psutil.Process(pid)
@@ -74,65 +142,55 @@ class ResourceMonitor(threading.Thread):
         """Get/set the internal filename"""
         return self._fname
 
+    def start(self):
+        """Start monitoring."""
+        if self._registration is None:
+            return super().start()
+
+        self._logfile.flush()
+        with open(self._registration + ".tmp", "w") as fp:
+            fp.write(f"{self._process.pid}\n{self._fname}\n")
+        os.replace(self._registration + ".tmp", self._registration)
+
     def stop(self):
         """Stop monitoring."""
         if not self._event.is_set():
             self._event.set()
-            self.join()
+            if self._registration is None:
+                self.join()
+            else:
+                try:
+                    os.unlink(self._registration)
+                except FileNotFoundError:
+                    pass
             self._sample()
             self._logfile.flush()
             self._logfile.close()
 
         retval = {
             "mem_peak_gb": None,
+            "mem_mean_gb": None,
             "cpu_percent": None,
+            "cpu_mean_percent": None,
         }
 
-        # Read .prof file in and set runtime values
-        vals = np.loadtxt(self._fname, delimiter=",")
+        # Read the log in and set runtime values
+        vals = load_resource_samples(self._fname)
         if vals.size:
-            vals = np.atleast_2d(vals)
-            retval["mem_peak_gb"] = vals[:, 2].max() / 1024
-            retval["cpu_percent"] = vals[:, 1].max()
-            retval["prof_dict"] = {
-                "time": vals[:, 0].tolist(),
-                "cpus": vals[:, 1].tolist(),
-                "rss_GiB": (vals[:, 2] / 1024).tolist(),
-                "vms_GiB": (vals[:, 3] / 1024).tolist(),
-            }
+            retval["mem_peak_gb"] = float(vals["rss_MiB"].max()) / 1024
+            retval["mem_mean_gb"] = float(vals["rss_MiB"].mean()) / 1024
+            retval["cpu_percent"] = float(vals["cpus"].max())
+            retval["cpu_mean_percent"] = float(vals["cpus"].mean())
         return retval
 
     def _sample(self, cpu_interval=None):
-        cpu = 0.0
-        rss = 0.0
-        vms = 0.0
-        try:
-            with self._process.oneshot():
-                cpu += self._process.cpu_percent(interval=cpu_interval)
-                mem_info = self._process.memory_info()
-                rss += mem_info.rss
-                vms += mem_info.vms
-        except psutil.NoSuchProcess:
-            pass
-
         # Iterate through child processes and get number of their threads
         try:
             children = self._process.children(recursive=True)
         except psutil.NoSuchProcess:
             children = []
 
-        for child in children:
-            try:
-                with child.oneshot():
-                    cpu += child.cpu_percent()
-                    mem_info = child.memory_info()
-                    rss += mem_info.rss
-                    vms += mem_info.vms
-            except psutil.NoSuchProcess:
-                pass
-
-        print(f"{time():f},{cpu:f},{rss / _MB:f},{vms / _MB:f}", file=self._logfile)
-        self._logfile.flush()
+        self._logfile.write(_pack_sample([self._process] + children, cpu_interval))
 
     def run(self):
         """Core monitoring function, called by start()"""
@@ -144,6 +202,183 @@ class ResourceMonitor(threading.Thread):
             self._event.wait(max(0, wait_til - time()))
 
 
+class ResourceSampler(threading.Thread):
+    """
+    A ``Thread`` sampling the process trees of all the resource monitors
+    registered with it, across processes, in one pass.
+
+    Monitors register by writing a ``<PID>\\n<log file>`` file in the
+    ``registry`` directory, created by :meth:`start`. At every tick, the
+    process table is scanned once to map every registered PID to its
+    descendants, and a sample of each tree is appended to its log file.
+    Worker processes opt in with :func:`use_resource_sampler`.
+    """
+
+    def __init__(self, freq=1):
+        import psutil
+
+        if freq < 0.2:
+            raise RuntimeError("Frequency (%0.2fs) cannot be lower than 0.2s" % freq)
+
+        super().__init__(daemon=True)
+        self._freq = freq
+        self._event = threading.Event()
+        self._registered = {}
+        self.registry = None
+
+    def start(self):
+        """Create the registry and start sampling."""
+        from tempfile import mkdtemp
+
+        self.registry = mkdtemp(prefix="nipype-resmon-")
+        super().start()
+
+    def stop(self):
+        """Stop sampling and remove the registry."""
+        from shutil import rmtree
+
+        if not self._event.is_set():
+            self._event.set()
+            self.join()
+            rmtree(self.registry, ignore_errors=True)
+
+    def _update_registrations(self):
+        names = {name for name in os.listdir(self.registry) if name[-4:] != ".tmp"}
+        for name in set(self._registered) - names:
+            del self._registered[name]
+        for name in names - set(self._registered):
+            try:
+                with open(os.path.join(self.registry, name)) as fp:
+                    pid, fname = fp.read().splitlines()
+            except (OSError, ValueError):
+                continue
+            self._registered[name] = (int(pid), fname)
+
+    def sample(self):
+        """Append a sample to the log of every registered monitor."""
+        self._update_registrations()
+        if not self._registered:
+            return
+
+        # One pass over the process table for all the registered trees
+        children = {}
+        processes = {}
+        for proc in psutil.process_iter(["ppid"]):
+            processes[proc.pid] = proc
+            children.setdefault(proc.info["ppid"], []).append(proc.pid)
+
+        for name, (pid, fname) in list(self._registered.items()):
+            if pid not in processes:
+                continue
+            tree = [pid]
+            for parent in tree:
+                tree.extend(children.get(parent, ()))
+            try:
+                fd = os.open(fname, os.O_WRONLY | os.O_APPEND)
+            except OSError:
+                continue
+            try:
+                os.write(fd, _pack_sample([processes[p] for p in tree]))
+            finally:
+                os.close(fd)
+
+    def run(self):
+        """Core sampling function, called by start()"""
+        wait_til = time()
+        while not self._event.is_set():
+            self.sample()
+            wait_til += self._freq
+            self._event.wait(max(0, wait_til - time()))
+
+
+class ResourceProfiles:
+    """
+    Resources measured on previous runs of interfaces, to estimate the
+    requirements of the next ones.
+
+    The profiles are stored in an append-only, tab-separated file with one
+    ``<key> <mem_peak_gb> <cpu_percent> <duration>`` record per run, where
+    unmeasured resources are left empty and the key identifies the interface
+    and the features of its inputs (see
+    :func:`~nipype.pipeline.plugins.tools.profile_key`). Estimates are based
+    on the last ``history`` records of a key, and only given once it has
+    ``min_records`` of them: the peak memory, increased by ``margin``, and
+    the number of threads matching the peak CPU usage. Durations are
+    estimated per interface, regardless of its inputs.
+    """
+
+    def __init__(self, filename, history=20, min_records=3, margin=0.1):
+        self.filename = os.path.abspath(os.path.expanduser(filename))
+        self.history = history
+        self.min_records = min_records
+        self.margin = margin
+        self._records = {}
+        self._durations = {}
+        try:
+            with open(self.filename) as fp:
+                lines = fp.read().splitlines()
+        except FileNotFoundError:
+            lines = []
+        for line in lines:
+            fields = line.split("\t")
+            try:
+                values = [float(value) if value else None for value in fields[1:4]]
+                self._add(fields[0], *values)
+            except (TypeError, ValueError):
+                proflogger.debug("Skipping malformed resource profile: %s", line)
+
+    def _add(self, key, mem_gb, cpu_percent, duration=None):
+        if mem_gb is not None and cpu_percent is not None:
+            records = self._records.setdefault(key, [])
+            records.append((mem_gb, cpu_percent))
+            del records[: -self.history]
+        if duration is not None:
+            durations = self._durations.setdefault(key.rpartition(":")[0], [])
+            durations.append(duration)
+            del durations[: -self.history]
+
+    def estimate(self, key):
+        """Return the estimated ``(mem_gb, n_procs)`` of a key, or ``None``"""
+        records = self._records.get(key, ())
+        if len(records) < self.min_records:
+            return None
+        mem_gb = max(mem for mem, _ in records) * (1 + self.margin)
+        n_procs = max(1, int(np.ceil(max(cpu for _, cpu in records) / 100 - 0.2)))
+        return mem_gb, n_procs
+
+    def duration(self, interface):
+        """Return the median duration (s) of the runs of an interface, or ``None``"""
+        durations = self._durations.get(interface)
+        if not durations:
+            return None
+        return float(np.median(durations))
+
+    def record(self, key, mem_gb, cpu_percent, duration=None):
+        """Add the resources measured on a run to the profiles"""
+        values = (mem_gb, cpu_percent, duration)
+        if all(value is None for value in values):
+            return
+        self._add(key, *values)
+        record = "\t".join(
+            [key]
+            + [
+                "" if value is None else "%.*f" % (precision, value)
+                for value, precision in zip(values, (6, 2, 3))
+            ]
+        )
+        # A single write on a file opened for appending keeps records whole
+        try:
+            fd = os.open(self.filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+            try:
+                os.write(fd, (record + "\n").encode())
+            finally:
+                os.close(fd)
+        except OSError as err:
+            proflogger.debug(
+                "Unable to update resource profiles %s: %s", self.filename, err
+            )
+
+
 # Log node stats function
 def log_nodes_cb(node, status):
     """Function to record node run statistics to a log file as json
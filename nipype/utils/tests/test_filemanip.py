@@ -14,6 +14,10 @@ from ...utils.filemanip import (
     fnames_presuffix,
     hash_rename,
     check_forhash,
+    hash_infile,
+    hash_infiles,
+    hash_sampled,
+    get_hash_algorithm,
     _parse_mount_table,
     _cifs_table,
     on_cifs,
@@ -28,6 +32,7 @@ from ...utils.filemanip import (
     loadpkl,
     loadcrash,
     savepkl,
+    PKL_COMPRESSIONS,
     path_resolve,
     write_rst_list,
     emptydirs,
@@ -96,6 +101,83 @@ def test_check_forhash():
     assert hash is None
 
 
+def test_hash_infile_cache(tmp_path):
+    from hashlib import md5
+
+    afile = tmp_path / "data.txt"
+    afile.write_bytes(b"a" * 1000)
+    assert hash_infile(str(afile)) == md5(b"a" * 1000).hexdigest()
+
+    # A modified file is hashed again
+    afile.write_bytes(b"b" * 2000)
+    assert hash_infile(str(afile)) == md5(b"b" * 2000).hexdigest()
+    assert hash_infile(str(tmp_path / "missing.txt")) is None
+    with pytest.raises(RuntimeError):
+        hash_infile(str(tmp_path), raise_notfound=True)
+
+
+def test_hash_sampled(tmp_path):
+    from ...utils.filemanip import _hash_sampled
+
+    afile = tmp_path / "data.bin"
+    afile.write_bytes(os.urandom(64 * 1024))
+    kwargs = {"threshold": 32 * 1024, "nblocks": 4, "chunk_len": 1024}
+
+    # Small files are hashed entirely
+    assert hash_sampled(str(afile), threshold=2**20) == hash_infile(str(afile))
+    sampled = hash_sampled(str(afile), **kwargs)
+    assert sampled != hash_infile(str(afile))
+
+    # Changes in the header, the sampled blocks or the size are detected
+    data = afile.read_bytes()
+
+    def flip(offset):
+        _hash_sampled.cache_clear()  # in case the mtime did not change
+        afile.write_bytes(
+            data[:offset] + bytes([data[offset] ^ 0xFF]) + data[offset + 1 :]
+        )
+        return hash_sampled(str(afile), **kwargs)
+
+    for offset in (0, 16128 + 10, len(data) - 1):
+        assert flip(offset) != sampled
+    afile.write_bytes(data + b"\0")
+    assert hash_sampled(str(afile), **kwargs) != sampled
+
+    # Bytes between sampled blocks are not read
+    assert flip(2048) == sampled
+    assert hash_sampled(str(tmp_path / "missing.bin")) is None
+
+
+@pytest.mark.parametrize("hash_method", ["content", "sampled", "timestamp"])
+def test_hash_infiles(tmp_path, hash_method):
+    files = []
+    for i in range(5):
+        files.append(str(tmp_path / f"file{i}.txt"))
+        Path(files[-1]).write_text("content" * (i + 1))
+
+    hashes = hash_infiles(files + files[:2] + ["missing.txt"], hash_method)
+    assert sorted(hashes) == files
+    assert hashes == hash_infiles(files, hash_method, max_workers=1)
+    assert len(set(hashes.values())) == 5
+    with pytest.raises(Exception):
+        hash_infiles(files, "unknown")
+
+
+def test_get_hash_algorithm(tmp_path):
+    from hashlib import blake2b
+
+    assert get_hash_algorithm("BLAKE2b") is blake2b
+    with pytest.raises(ValueError):
+        get_hash_algorithm("crc32")
+
+    afile = tmp_path / "data.txt"
+    afile.write_bytes(b"a" * 1000)
+    assert hash_infile(str(afile), crypto=blake2b) == blake2b(b"a" * 1000).hexdigest()
+    assert hash_infiles([str(afile)], crypto=blake2b)[str(afile)] == hash_infile(
+        str(afile), crypto=blake2b
+    )
+
+
 @pytest.fixture()
 def _temp_analyze_files(tmpdir):
     """Generate temporary analyze file pair."""
@@ -654,6 +736,35 @@ def test_pickle(tmp_path, save_versioning):
     assert outobj == testobj
 
 
+@pytest.mark.parametrize("compression", ["gzip", "gzip_fast", "lz4", "none", "zstd"])
+@pytest.mark.parametrize("save_versioning", [True, False])
+def test_pickle_compression(tmp_path, compression, save_versioning):
+    from ... import config
+
+    if compression not in PKL_COMPRESSIONS:
+        pytest.skip("%s compression is not installed" % compression)
+    pickle_fname = str(tmp_path / "testpickle.pklz")
+    old_compression = config.get("execution", "pkl_compression")
+    config.set("execution", "pkl_compression", compression)
+    try:
+        savepkl(pickle_fname, "record", save_versioning, appendix=["appendix"])
+    finally:
+        config.set("execution", "pkl_compression", old_compression)
+
+    assert loadpkl(pickle_fname) == "record"
+    assert loadpkl(pickle_fname, appendix=True) == ("record", ["appendix"])
+
+    savepkl(pickle_fname, "record")
+    assert loadpkl(pickle_fname, appendix=True) == ("record", None)
+
+    config.set("execution", "pkl_compression", "lzma")
+    try:
+        with pytest.raises(ValueError):
+            savepkl(pickle_fname, "record")
+    finally:
+        config.set("execution", "pkl_compression", old_compression)
+
+
 @pytest.mark.parametrize(
     "items,expected",
     [
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""
+Benchmark the cleanup of node working directories.
+
+A working directory is populated with ``--files`` empty files, spread over
+``--dirs`` subdirectories.  The first subdirectory and ``--outputs`` of the
+files are outputs of the node, and the other files are removed by
+:func:`~nipype.pipeline.engine.utils.clean_working_directory` and, with
+``--compare``, from a fresh copy by the former implementation.
+
+Usage::
+
+    python tools/benchmarks/bench_clean_working_directory.py --files 100000 --compare
+
+"""
+
+import argparse
+import os
+import os.path as op
+from glob import glob
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from nipype import config
+from nipype.interfaces.base import Directory, File, TraitedSpec, traits
+from nipype.pipeline.engine.utils import (
+    clean_working_directory,
+    walk_files,
+    walk_outputs,
+)
+from nipype.utils.filemanip import get_related_files
+
+
+class OutputSpec(TraitedSpec):
+    out_files = traits.List(File)
+    out_dir = Directory()
+
+
+def legacy_clean_working_directory(outputs, cwd, needed_outputs):
+    """The former cleanup, with list membership and string prefix checks"""
+    output_files = []
+    outputdict = outputs.trait_get()
+    for output in needed_outputs:
+        output_files.extend(walk_outputs(outputdict[output]))
+    needed_files = [path for path, type in output_files if type == "f"]
+    for extra in ["_0x*.json", "result*.pklz", "_inputs.pklz", "_node.pklz"]:
+        needed_files.extend(glob(os.path.join(cwd, extra)))
+    needed_dirs = [path for path, type in output_files if type == "d"]
+    temp = []
+    for filename in needed_files:
+        temp.extend(get_related_files(filename))
+    needed_files = temp
+    files2remove = []
+    for f in walk_files(cwd):
+        if f not in needed_files and not f.startswith(tuple(needed_dirs)):
+            files2remove.append(f)
+    for f in files2remove:
+        os.remove(f)
+
+
+def populate(cwd, nfiles, ndirs, noutputs):
+    """Create the files, and outputs listing ``noutputs`` of them"""
+    dirs = [op.join(cwd, f"dir{i:04d}") for i in range(ndirs)]
+    for path in dirs:
+        os.mkdir(path)
+    files = [op.join(dirs[i % ndirs], f"vol{i:06d}.nii") for i in range(nfiles)]
+    for fname in files:
+        open(fname, "w").close()
+    step = max(1, nfiles // max(1, noutputs))
+    return OutputSpec(out_files=files[::step][:noutputs], out_dir=dirs[0])
+
+
+def timeit(func, *args):
+    start = perf_counter()
+    func(*args)
+    return perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--files", type=int, default=100000)
+    parser.add_argument("--dirs", type=int, default=100)
+    parser.add_argument("--outputs", type=int, default=1000)
+    parser.add_argument("--tmpdir", default=None)
+    parser.add_argument("--compare", action="store_true")
+    args = parser.parse_args()
+
+    needed_outputs = ["out_files", "out_dir"]
+    config.set("execution", "remove_unnecessary_outputs", "true")
+    implementations = {
+        "current": lambda outputs, cwd: clean_working_directory(
+            outputs, cwd, OutputSpec(), needed_outputs, config._sections
+        ),
+    }
+    if args.compare:
+        implementations["former"] = lambda outputs, cwd: (
+            legacy_clean_working_directory(outputs, cwd, needed_outputs)
+        )
+
+    print(f"{args.files} files in {args.dirs} directories")
+    for name, clean in implementations.items():
+        with TemporaryDirectory(dir=args.tmpdir) as cwd:
+            outputs = populate(cwd, args.files, args.dirs, args.outputs)
+            elapsed = timeit(clean, outputs, cwd)
+            left = sum(1 for _ in walk_files(cwd))
+            print(f"{name:>8} {elapsed:10.3f} s, {left} files left")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""
+Benchmark how fast a node failure is propagated to its dependents.
+
+A layered synthetic DAG (``--width`` nodes per layer, ``--depth`` layers,
+each node reading from ``--fanin`` random nodes of the previous layer) is
+loaded into :class:`~nipype.pipeline.plugins.base.DistributedPluginBase`
+and failures are injected at several depths.  For each failure the time
+spent in ``_remove_node_deps`` (marking every dependent as not run) is
+reported, optionally next to the former ``procs.index`` based lookup.
+
+Usage::
+
+    python tools/benchmarks/bench_crash_propagation.py --width 500 --depth 100
+
+"""
+
+import argparse
+from time import perf_counter
+
+import networkx as nx
+import numpy as np
+
+from nipype.pipeline.plugins.base import DistributedPluginBase
+
+
+class FakeNode:
+    """Stand-in for a workflow node, only used as a graph vertex"""
+
+    def __init__(self, name):
+        self._id = name
+
+    def __repr__(self):
+        return self._id
+
+
+def build_graph(width, depth, fanin, seed=0):
+    rng = np.random.default_rng(seed)
+    layers = [[FakeNode(f"n{d}_{w}") for w in range(width)] for d in range(depth)]
+    graph = nx.DiGraph()
+    graph.add_nodes_from(layers[0])
+    for prev, layer in zip(layers[:-1], layers[1:]):
+        for node in layer:
+            for src in rng.choice(width, size=min(fanin, width), replace=False):
+                graph.add_edge(prev[src], node)
+    return graph, layers
+
+
+def legacy_remove_node_deps(plugin, jobid, graph):
+    """The former implementation, with a linear lookup per dependent"""
+    for node in nx.dfs_preorder_nodes(graph, plugin.procs[jobid]):
+        idx = plugin.procs.index(node)
+        plugin.proc_done[idx] = True
+        plugin.proc_pending[idx] = False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--width", type=int, default=500)
+    parser.add_argument("--depth", type=int, default=100)
+    parser.add_argument("--fanin", type=int, default=2)
+    parser.add_argument(
+        "--compare", action="store_true", help="also time the former lookup"
+    )
+    args = parser.parse_args()
+
+    graph, layers = build_graph(args.width, args.depth, args.fanin)
+    plugin = DistributedPluginBase()
+    start = perf_counter()
+    plugin._generate_dependency_list(graph)
+    print(
+        f"{len(plugin.procs)} nodes, {graph.number_of_edges()} edges "
+        f"(dependency list built in {perf_counter() - start:.3f}s)"
+    )
+    print(
+        f"{'depth':>6} {'dependents':>11} {'indexed (ms)':>13}"
+        + (f" {'former (ms)':>12}" if args.compare else "")
+    )
+    for depth in np.linspace(0, args.depth - 1, 5, dtype=int):
+        jobid = plugin.jobids[layers[depth][0]]
+
+        plugin.proc_done[:] = False
+        start = perf_counter()
+        info = plugin._remove_node_deps(jobid, None, graph)
+        elapsed = perf_counter() - start
+        line = f"{depth:6d} {len(info['dependents']):11d} {1e3 * elapsed:13.2f}"
+
+        if args.compare:
+            plugin.proc_done[:] = False
+            start = perf_counter()
+            legacy_remove_node_deps(plugin, jobid, graph)
+            line += f" {1e3 * (perf_counter() - start):12.2f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
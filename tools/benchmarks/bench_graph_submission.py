@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+"""
+Benchmark the preparation of graphs by the graph submission plugins.
+
+The workflow processes ``--subjects`` subjects with a chain of ``--depth``
+nodes each, followed by a group node depending on the end of every chain.
+The dependencies of the nodes are computed by index lookups, as formerly,
+and by the index map of :class:`~nipype.pipeline.plugins.base.GraphPluginBase`.
+The files running the nodes are then written in ``--tmpdir`` by
+:meth:`~nipype.pipeline.plugins.base.GraphPluginBase.run`, with a python
+script per node and with the shared runner, with ``--threads`` threads.
+
+Usage::
+
+    python tools/benchmarks/bench_graph_submission.py --subjects 1000 --depth 10 --threads 8
+
+"""
+
+import argparse
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+import networkx as nx
+
+from nipype import config
+import nipype.pipeline.engine as pe
+from nipype.interfaces.utility import IdentityInterface
+from nipype.pipeline.plugins.base import GraphPluginBase
+
+
+class DryGraphPlugin(GraphPluginBase):
+    """Write the files running the nodes, without submitting them"""
+
+    def _submit_graph(self, pyfiles, dependencies, nodes):
+        pass
+
+
+def make_graph(subjects, depth, base_dir):
+    """Return the graph of the workflow"""
+    graph = nx.DiGraph()
+    group = pe.Node(IdentityInterface(fields=["x"]), name="group", base_dir=base_dir)
+    for subject in range(subjects):
+        chain = [
+            pe.Node(
+                IdentityInterface(fields=["x"]),
+                name=f"s{subject}_d{i}",
+                base_dir=base_dir,
+            )
+            for i in range(depth)
+        ]
+        nx.add_path(graph, chain + [group])
+    for node in graph.nodes:
+        node.config = config._sections
+    return graph
+
+
+def timeit(func, *args):
+    start = perf_counter()
+    func(*args)
+    return perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--subjects", type=int, default=1000)
+    parser.add_argument("--depth", type=int, default=10)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--tmpdir", default=None)
+    args = parser.parse_args()
+
+    with TemporaryDirectory(dir=args.tmpdir) as base_dir:
+        graph = make_graph(args.subjects, args.depth, base_dir)
+        nodes = list(nx.topological_sort(graph))
+        print(f"{len(nodes)} nodes")
+
+        def index_lookups():
+            return {
+                idx: [nodes.index(prevnode) for prevnode in graph.predecessors(node)]
+                for idx, node in enumerate(nodes)
+            }
+
+        def index_map():
+            jobids = {node: idx for idx, node in enumerate(nodes)}
+            return {
+                idx: [jobids[prevnode] for prevnode in graph.predecessors(node)]
+                for idx, node in enumerate(nodes)
+            }
+
+        print(
+            f"{'dependencies':>24} {'index lookups':>14} {timeit(index_lookups):8.3f} s"
+        )
+        print(f"{'':>24} {'index map':>14} {timeit(index_map):8.3f} s")
+
+        for shared_runner in (False, True):
+            for threads in (1, args.threads):
+                plugin = DryGraphPlugin(
+                    plugin_args={
+                        "shared_runner": shared_runner,
+                        "script_threads": threads,
+                    }
+                )
+                elapsed = timeit(plugin.run, graph, None)
+                name = "shared runner" if shared_runner else "python scripts"
+                print(f"{name:>24} {threads:>6} threads {elapsed:8.3f} s")
+
+
+if __name__ == "__main__":
+    main()
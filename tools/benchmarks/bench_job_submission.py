@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""
+Measure the per-job cost of shipping nodes to MultiProc workers.
+
+For a MapNode iterating over ``--items`` values and a Node with an
+in-memory input of ``--size`` floats, the time and the peak memory
+allocated (``tracemalloc``) by the master process to prepare one job are
+reported for the former ``deepcopy`` + pickle path and for
+:class:`~nipype.pipeline.plugins.tools.JobDescriptor`, along with the
+number of bytes shipped to the worker.
+
+Usage::
+
+    python tools/benchmarks/bench_job_submission.py --items 5000 --size 1000000
+
+"""
+
+import argparse
+import pickle
+import tracemalloc
+from copy import deepcopy
+from time import perf_counter
+
+from nipype.interfaces import utility as niu
+from nipype.pipeline import engine as pe
+from nipype.pipeline.plugins.tools import JobDescriptor
+
+
+def _add(a, b):
+    return a + b
+
+
+def deepcopy_job(node):
+    """The former submission path: copy the node, then the pool pickles it"""
+    return pickle.dumps(deepcopy(node), protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def descriptor_job(node):
+    """The node is pickled once into a descriptor, which the pool pickles"""
+    return pickle.dumps(JobDescriptor(node), protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def measure(submit, node, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        submit(node)
+        best = min(best, perf_counter() - start)
+
+    tracemalloc.start()
+    shipped = len(submit(node))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak, shipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--items", type=int, default=5000)
+    parser.add_argument("--size", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--base-dir", default=".")
+    args = parser.parse_args()
+
+    mapnode = pe.MapNode(niu.Function(function=_add), iterfield=["a"], name="mapnode")
+    mapnode.inputs.a = list(range(args.items))
+    mapnode.inputs.b = 1
+
+    node = pe.Node(niu.Function(function=_add), name="node")
+    node.inputs.a = [float(i) for i in range(args.size)]
+    node.inputs.b = [0.0]
+
+    print(
+        f"{'job':>8} {'method':>11} {'time (ms)':>10} {'peak (MiB)':>11}"
+        f" {'shipped (MiB)':>14}"
+    )
+    for job in (mapnode, node):
+        job.base_dir = args.base_dir
+        for name, submit in (
+            ("deepcopy", deepcopy_job),
+            ("descriptor", descriptor_job),
+        ):
+            elapsed, peak, shipped = measure(submit, job, args.repeat)
+            print(
+                f"{job.name:>8} {name:>11} {1e3 * elapsed:10.2f}"
+                f" {peak / 2**20:11.2f} {shipped / 2**20:14.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+"""
+Benchmark the bookkeeping of serial MapNodes.
+
+A MapNode wrapping a trivial ``Function`` interface iterates over
+``--items`` values.  The generation of its subnodes (``_make_nodes``) and
+the collation of their results (``_collate_results``, fed with precomputed
+results) are timed separately from interface execution, optionally next to
+the former implementations (``--compare``).  With ``--run``, the MapNode is
+also run end to end.
+
+Usage::
+
+    python tools/benchmarks/bench_mapnode.py --items 10000 --compare
+
+"""
+
+import argparse
+import os.path as op
+from copy import deepcopy
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from nipype import logging
+from nipype.interfaces.base import InterfaceResult, isdefined
+from nipype.interfaces.base.support import Bunch
+from nipype.interfaces.utility import Function
+from nipype.pipeline.engine import MapNode, Node
+from nipype.utils.filemanip import ensure_list
+from nipype.utils.misc import str2bool
+
+
+def increment(x):
+    return x + 1
+
+
+def legacy_make_nodes(mapnode, cwd):
+    """The former subnode generation, deep-copying the inputs twice"""
+    nitems = len(ensure_list(getattr(mapnode.inputs, mapnode.iterfield[0])))
+    for i in range(nitems):
+        node = Node(
+            deepcopy(mapnode._interface),
+            base_dir=op.join(cwd, "mapflow"),
+            name="_%s%d" % (mapnode.name, i),
+        )
+        node.interface.inputs.trait_set(
+            **deepcopy(mapnode._interface.inputs.trait_get())
+        )
+        for field in mapnode.iterfield:
+            fieldvals = ensure_list(getattr(mapnode.inputs, field))
+            setattr(node.inputs, field, fieldvals[i])
+        node.config = mapnode.config
+        yield i, node
+
+
+def legacy_collate_results(mapnode, nodes):
+    """The former collation, inserting into and setting outputs per subnode"""
+    finalresult = InterfaceResult(
+        interface=[], runtime=[], provenance=[], inputs=[], outputs=mapnode.outputs
+    )
+    for i, nresult, err in nodes:
+        finalresult.runtime.insert(i, None)
+        if mapnode.outputs:
+            for key, _ in list(mapnode.outputs.items()):
+                rm_extra = mapnode.config["execution"]["remove_unnecessary_outputs"]
+                if str2bool(rm_extra) and mapnode.needed_outputs:
+                    if key not in mapnode.needed_outputs:
+                        continue
+                values = getattr(finalresult.outputs, key)
+                if not isdefined(values):
+                    values = []
+                values.insert(i, nresult.outputs.trait_get()[key])
+                if any(isdefined(val) for val in values):
+                    setattr(finalresult.outputs, key, values)
+    return finalresult
+
+
+def fake_results(mapnode, nitems):
+    results = []
+    for i in range(nitems):
+        outputs = mapnode._interface._outputs()
+        outputs.out = i + 1
+        runtime = Bunch(returncode=0)
+        results.append((i, InterfaceResult(Function, runtime, outputs=outputs), None))
+    return results
+
+
+def timeit(func, *args):
+    start = perf_counter()
+    func(*args)
+    return perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument("--run", action="store_true")
+    args = parser.parse_args()
+    logging.getLogger("nipype.workflow").setLevel("WARNING")
+
+    with TemporaryDirectory() as tmpdir:
+        mapnode = MapNode(
+            Function(function=increment), iterfield=["x"], name="m", base_dir=tmpdir
+        )
+        mapnode.inputs.x = list(range(args.items))
+        mapnode.config = {"execution": {"remove_unnecessary_outputs": "true"}}
+        results = fake_results(mapnode, args.items)
+
+        timings = {
+            "make_nodes": [timeit(list, mapnode._make_nodes(tmpdir))],
+            "collate_results": [timeit(mapnode._collate_results, iter(results))],
+        }
+        if args.compare:
+            timings["make_nodes"].append(
+                timeit(list, legacy_make_nodes(mapnode, tmpdir))
+            )
+            timings["collate_results"].append(
+                timeit(legacy_collate_results, mapnode, iter(results))
+            )
+
+        print(f"{args.items} items")
+        header = f"{'step':>16} {'time (s)':>10}"
+        print(header + (f" {'former (s)':>10}" if args.compare else ""))
+        for step, times in timings.items():
+            print(f"{step:>16}" + "".join(f" {t:10.3f}" for t in times))
+
+        if args.run:
+            mapnode.config = None
+            print(f"{'run':>16} {timeit(mapnode.run):10.3f}")
+
+
+if __name__ == "__main__":
+    main()
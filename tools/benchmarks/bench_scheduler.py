@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+"""
+Benchmark the dispatch overhead of the MultiProc scheduler loop.
+
+A synthetic workflow made of ``--chains`` independent chains of
+``--depth`` trivial nodes is run twice: once with the event-driven
+scheduler (worker completions wake the loop up) and once emulating the
+former fixed-interval polling (completions are only seen every
+``poll_sleep_duration`` seconds).  For each run, the master CPU time and
+the per-node dispatch latency (delay between the completion of the last
+upstream node and the start of a node) are reported.
+
+Usage::
+
+    python tools/benchmarks/bench_scheduler.py --chains 8 --depth 25
+
+"""
+
+import argparse
+import os
+import resource
+from tempfile import mkdtemp
+from time import time
+
+import numpy as np
+
+from nipype import config, logging
+from nipype.interfaces import utility as niu
+from nipype.pipeline import engine as pe
+from nipype.pipeline.plugins import MultiProcPlugin
+
+
+class PollingMultiProcPlugin(MultiProcPlugin):
+    """MultiProc that ignores completion notifications (fixed polling)"""
+
+    def _notify_task_done(self):
+        pass
+
+
+def _identity(value):
+    return value
+
+
+def build_workflow(chains, depth, base_dir):
+    wf = pe.Workflow(name="bench", base_dir=base_dir)
+    for c in range(chains):
+        prev = None
+        for d in range(depth):
+            node = pe.Node(
+                niu.Function(function=_identity, input_names=["value"]),
+                name=f"c{c}_d{d}",
+            )
+            if prev is None:
+                node.inputs.value = c
+            else:
+                wf.connect(prev, "out", node, "value")
+            prev = node
+    return wf
+
+
+def run(plugin_cls, args):
+    wf = build_workflow(args.chains, args.depth, mkdtemp(prefix="nipype-bench-"))
+    wf.config["execution"]["poll_sleep_duration"] = args.poll
+    wf.config["execution"]["create_report"] = False
+
+    events = {}
+
+    def status_callback(node, status):
+        events[(node.fullname, status)] = time()
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    cpu_start = usage.ru_utime + usage.ru_stime
+    wall_start = time()
+    execgraph = wf.run(
+        plugin=plugin_cls(
+            plugin_args={"n_procs": args.n_procs, "status_callback": status_callback}
+        )
+    )
+    wall = time() - wall_start
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = usage.ru_utime + usage.ru_stime - cpu_start
+
+    latencies = [
+        events[(node.fullname, "start")]
+        - max(events[(pred.fullname, "end")] for pred in preds)
+        for node, preds in (
+            (node, list(execgraph.predecessors(node))) for node in execgraph.nodes()
+        )
+        if preds
+    ]
+    return wall, cpu, np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chains", type=int, default=8)
+    parser.add_argument("--depth", type=int, default=25)
+    parser.add_argument("--n-procs", type=int, default=os.cpu_count())
+    parser.add_argument("--poll", type=float, default=2.0)
+    args = parser.parse_args()
+
+    config.set("logging", "workflow_level", "WARNING")
+    logging.update_logging(config)
+
+    print(
+        f"{args.chains * args.depth} nodes, n_procs={args.n_procs}, "
+        f"poll_sleep_duration={args.poll}s"
+    )
+    print(
+        f"{'mode':>10} {'wall (s)':>10} {'master CPU (s)':>15} "
+        f"{'latency mean (ms)':>18} {'latency p95 (ms)':>17}"
+    )
+    for mode, plugin_cls in (
+        ("polling", PollingMultiProcPlugin),
+        ("event", MultiProcPlugin),
+    ):
+        wall, cpu, latency = run(plugin_cls, args)
+        print(
+            f"{mode:>10} {wall:10.2f} {cpu:15.2f} "
+            f"{1e3 * latency.mean():18.1f} {1e3 * np.percentile(latency, 95):17.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""
+Simulate the makespan of MultiProc job orderings on synthetic workflows.
+
+The workflow processes ``--subjects`` subjects, each with ``--wide`` short
+independent jobs and a chain of ``--depth`` long jobs, followed by a group
+job depending on the end of every chain.  Durations are drawn from a
+log-normal distribution around 1 s (long jobs) and 0.1 s (short jobs).
+Jobs are dispatched to ``--procs`` single-threaded workers as soon as they
+are ready, in the order given by every ``scheduler`` of
+:class:`~nipype.pipeline.plugins.multiproc.MultiProcPlugin`, and the
+simulated makespans are reported next to a lower bound.  The
+``critical_path`` ordering is simulated with the actual durations (as
+measured on previous runs with ``profile_db``) and with unit durations
+(without).
+
+Usage::
+
+    python tools/benchmarks/bench_scheduling_policy.py --subjects 50 --wide 20 --depth 10 --procs 16
+
+"""
+
+import argparse
+import heapq
+
+import networkx as nx
+import numpy as np
+
+from nipype.pipeline.engine.utils import topological_sort
+from nipype.pipeline.plugins.tools import critical_path_lengths, descendant_counts
+
+
+def make_graph(subjects, wide, depth, rng):
+    """Return the graph of the workflow, with the duration of every job"""
+    graph = nx.DiGraph()
+    for subject in range(subjects):
+        for i in range(wide):
+            graph.add_node(f"s{subject}_w{i}", duration=rng.lognormal(np.log(0.1), 0.5))
+        chain = [f"s{subject}_d{i}" for i in range(depth)]
+        for name in chain:
+            graph.add_node(name, duration=rng.lognormal(0.0, 0.5))
+        nx.add_path(graph, chain)
+        graph.add_edge(chain[-1], "group")
+    graph.nodes["group"]["duration"] = 1.0
+    return graph
+
+
+def simulate(dependents, durations, priorities, procs):
+    """Return the makespan of dispatching jobs by decreasing priority"""
+    indegree = np.zeros(len(dependents), dtype=int)
+    for deps in dependents:
+        indegree[deps] += 1
+    # Ties are broken by topological order, as in MultiProc
+    ready = [(-priorities[jobid], jobid) for jobid in np.flatnonzero(indegree == 0)]
+    heapq.heapify(ready)
+    running = []
+    now = 0.0
+    while ready or running:
+        while ready and len(running) < procs:
+            _, jobid = heapq.heappop(ready)
+            heapq.heappush(running, (now + durations[jobid], jobid))
+        now, jobid = heapq.heappop(running)
+        for depid in dependents[jobid]:
+            indegree[depid] -= 1
+            if indegree[depid] == 0:
+                heapq.heappush(ready, (-priorities[depid], depid))
+    return now
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--subjects", type=int, default=50)
+    parser.add_argument("--wide", type=int, default=20)
+    parser.add_argument("--depth", type=int, default=10)
+    parser.add_argument("--procs", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    graph = make_graph(
+        args.subjects, args.wide, args.depth, np.random.default_rng(args.seed)
+    )
+    procs, _ = topological_sort(graph)
+    jobids = {node: idx for idx, node in enumerate(procs)}
+    dependents = [[jobids[succ] for succ in graph.successors(node)] for node in procs]
+    durations = [graph.nodes[node]["duration"] for node in procs]
+
+    orderings = {
+        "tsort": [0] * len(procs),
+        "critical_path": critical_path_lengths(dependents, durations),
+        "critical_path (unmeasured)": critical_path_lengths(
+            dependents, [1.0] * len(procs)
+        ),
+        "descendants": descendant_counts(dependents),
+    }
+    bound = max(
+        max(critical_path_lengths(dependents, durations)), sum(durations) / args.procs
+    )
+
+    print(f"{len(procs)} jobs on {args.procs} workers, lower bound {bound:.2f} s")
+    print(f"{'scheduler':>28} {'makespan (s)':>12} {'vs. bound':>10}")
+    for name, priorities in orderings.items():
+        makespan = simulate(dependents, durations, priorities, args.procs)
+        print(f"{name:>28} {makespan:12.2f} {makespan / bound:10.2f}")
+
+
+if __name__ == "__main__":
+    main()